@@ -1,51 +1,601 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, g, Response, stream_with_context, abort, has_app_context
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import sqlite3
 import os
+import sys
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 import json
+import base64
+import re
+import csv
+import io
+import zipfile
+import zlib
+from xml.sax.saxutils import escape as xml_escape
+import xml.etree.ElementTree as ET
+import click
+import queue
+import threading
+import time
+import heapq
+import importlib
+import atexit
+import logging
+from collections import deque, OrderedDict
+import random
+import secrets
+import urllib.request
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this-in-production'
 
-DATABASE = 'database/erp.db'
+DATABASE = os.environ.get('ERP_DATABASE', 'database/erp.db')
+
+# Connection pool settings (override with environment variables)
+app.config['DB_POOL_SIZE'] = int(os.environ.get('ERP_DB_POOL_SIZE', 8))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('ERP_DB_POOL_TIMEOUT', 10))
+app.config['DB_STATEMENT_CACHE'] = int(os.environ.get('ERP_DB_STATEMENT_CACHE', 256))
+# Storage tuning: WAL lets dashboard reads proceed while writers commit
+app.config['DB_JOURNAL_MODE'] = os.environ.get('ERP_DB_JOURNAL_MODE', 'WAL')
+app.config['DB_CHECKPOINT_INTERVAL'] = float(os.environ.get('ERP_DB_CHECKPOINT_INTERVAL', 300))
+app.config['DB_WAL_AUTOCHECKPOINT'] = int(os.environ.get('ERP_DB_WAL_AUTOCHECKPOINT', 1000))
+# PRAGMAs applied once when a pooled connection is opened
+app.config['DB_PRAGMAS'] = {
+    'busy_timeout': int(os.environ.get('ERP_DB_BUSY_TIMEOUT', 5000)),
+    'synchronous': os.environ.get('ERP_DB_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': int(os.environ.get('ERP_DB_CACHE_SIZE', -16000)),
+    'mmap_size': int(os.environ.get('ERP_DB_MMAP_SIZE', 134217728)),
+    'temp_store': os.environ.get('ERP_DB_TEMP_STORE', 'MEMORY'),
+    'wal_autocheckpoint': app.config['DB_WAL_AUTOCHECKPOINT'],
+}
+
+# Translations: one JSON file per language in translations/. Keys missing
+# from a language fall back to the default language, then to the key itself;
+# the chain is merged into one table per language when the files are loaded.
+DEFAULT_LANGUAGE = 'tr'
+TRANSLATION_DIR = os.path.join(os.path.dirname(__file__), 'translations')
+# Reload changed translation files on the next request (None: only in debug mode)
+app.config['TRANSLATIONS_AUTO_RELOAD'] = (
+    os.environ['ERP_TRANSLATIONS_AUTO_RELOAD'] == '1' if os.environ.get('ERP_TRANSLATIONS_AUTO_RELOAD') else None)
+
+class TranslationTable(dict):
+    """Translations of one language; unknown keys translate to themselves"""
+
+    def __missing__(self, key):
+        return key
+
+def translation_files():
+    """{language code: path} for translations/*.json"""
+    return {name[:-5]: os.path.join(TRANSLATION_DIR, name)
+            for name in sorted(os.listdir(TRANSLATION_DIR)) if name.endswith('.json')}
 
-# Load translations from JSON files
 def load_translations():
     """Load translation files from translations/ directory"""
-    translations = {}
-    translation_dir = os.path.join(os.path.dirname(__file__), 'translations')
-    
-    for lang_code in ['tr', 'en']:
-        file_path = os.path.join(translation_dir, f'{lang_code}.json')
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                translations[lang_code] = json.load(f)
-        else:
-            # Fallback to empty dict if file not found
-            translations[lang_code] = {}
+    raw = {}
+    for lang_code, file_path in translation_files().items():
+        with open(file_path, 'r', encoding='utf-8') as f:
+            raw[lang_code] = json.load(f)
+    raw.setdefault(DEFAULT_LANGUAGE, {})
     
+    translations = {}
+    for lang_code, strings in raw.items():
+        translations[lang_code] = TranslationTable(raw[DEFAULT_LANGUAGE])
+        translations[lang_code].update(strings)
     return translations
 
+def translation_mtimes():
+    return {lang_code: os.stat(path).st_mtime_ns for lang_code, path in translation_files().items()}
+
 # Load translations once at startup
 TRANSLATIONS = load_translations()
+_translation_mtimes = translation_mtimes()
+_translation_lock = threading.Lock()
+
+def reload_translations_if_changed():
+    """Reload TRANSLATIONS when a file in translations/ was added, removed or modified"""
+    global TRANSLATIONS, _translation_mtimes
+    mtimes = translation_mtimes()
+    if mtimes == _translation_mtimes:
+        return False
+    with _translation_lock:
+        if mtimes != _translation_mtimes:
+            TRANSLATIONS = load_translations()
+            _translation_mtimes = mtimes
+    return True
+
+def get_translator():
+    """The current request's translate function, bound once to the session language"""
+    translate = g.get('translate')
+    if translate is None:
+        auto_reload = app.config['TRANSLATIONS_AUTO_RELOAD']
+        if auto_reload or (auto_reload is None and app.debug):
+            reload_translations_if_changed()
+        lang = session.get('language', DEFAULT_LANGUAGE)
+        translate = g.translate = TRANSLATIONS.get(lang, TRANSLATIONS[DEFAULT_LANGUAGE]).__getitem__
+    return translate
 
 def get_translation(key, lang=None):
     """Get translation for a key"""
     if lang is None:
-        lang = session.get('language', 'tr')
-    return TRANSLATIONS.get(lang, TRANSLATIONS.get('tr', {})).get(key, key)
+        return get_translator()(key)
+    return TRANSLATIONS.get(lang, TRANSLATIONS[DEFAULT_LANGUAGE])[key]
+
+@app.context_processor
+def inject_translator():
+    return {'t': get_translator()}
 
 # Database helper functions
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections shared between requests"""
+
+    def __init__(self, database, size, timeout, statement_cache=256, pragmas=None, factory=sqlite3.Connection):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.statement_cache = statement_cache
+        self.pragmas = pragmas or {}
+        self.factory = factory
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        self.stats = {'hits': 0, 'misses': 0, 'waits': 0, 'wait_time': 0.0, 'timeouts': 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, check_same_thread=False,
+                               cached_statements=self.statement_cache, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def acquire(self):
+        """Take an idle connection, open a new one, or wait for one to be released"""
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self.stats['hits'] += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+                self.stats['misses'] += 1
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self.stats['timeouts'] += 1
+            raise sqlite3.OperationalError('database connection pool exhausted')
+        with self._lock:
+            self.stats['waits'] += 1
+            self.stats['wait_time'] += time.perf_counter() - started
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any uncommitted work"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        # Checked under the lock so close_all() cannot drain the queue between the check and the put
+        with self._lock:
+            if not self._closed:
+                self._idle.put(conn)
+                return
+        self._discard(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def close_all(self):
+        """Close every idle connection; connections still in use close on release"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+            data['size'] = self.size
+            data['open'] = self._created
+        data['idle'] = self._idle.qsize()
+        data['in_use'] = data['open'] - data['idle']
+        return data
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DATABASE,
+                    size=app.config['DB_POOL_SIZE'],
+                    timeout=app.config['DB_POOL_TIMEOUT'],
+                    statement_cache=app.config['DB_STATEMENT_CACHE'],
+                    pragmas=app.config['DB_PRAGMAS'],
+                    factory=InstrumentedConnection if app.config['INSTRUMENTATION'] else sqlite3.Connection
+                )
+    return _pool
+
+def close_pool():
+    """Close the pool's connections; the next get_pool() opens a fresh pool"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close_all()
+
+_checkpointer = None
+_checkpoint_stats = {'runs': 0, 'busy': 0, 'last_log_frames': 0, 'last_checkpointed': 0, 'last_run': None}
+
+def configure_storage(db):
+    """Switch the database file to the configured journal mode (persistent)"""
+    mode = db.execute(f"PRAGMA journal_mode = {app.config['DB_JOURNAL_MODE']}").fetchone()[0]
+    return mode
+
+def checkpoint_wal(mode='PASSIVE'):
+    """Copy WAL frames back into the database file without blocking readers"""
+    pool = get_pool()
+    db = pool.acquire()
+    try:
+        busy, log_frames, checkpointed = db.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+    finally:
+        pool.release(db)
+    _checkpoint_stats['runs'] += 1
+    _checkpoint_stats['busy'] += busy
+    _checkpoint_stats['last_log_frames'] = log_frames
+    _checkpoint_stats['last_checkpointed'] = checkpointed
+    _checkpoint_stats['last_run'] = datetime.now().isoformat(timespec='seconds')
+    return busy, log_frames, checkpointed
+
+def start_checkpointer():
+    """Run a passive WAL checkpoint every DB_CHECKPOINT_INTERVAL seconds"""
+    global _checkpointer
+    interval = app.config['DB_CHECKPOINT_INTERVAL']
+    if _checkpointer is not None or interval <= 0:
+        return _checkpointer
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                checkpoint_wal()
+            except sqlite3.Error as e:
+                app.logger.warning('WAL checkpoint failed: %s', e)
+
+    _checkpointer = threading.Thread(target=run, name='wal-checkpoint', daemon=True)
+    _checkpointer.stop = stop
+    _checkpointer.start()
+    return _checkpointer
+
+def stop_checkpointer():
+    global _checkpointer
+    if _checkpointer is not None:
+        _checkpointer.stop.set()
+        _checkpointer.join(timeout=5)
+        _checkpointer = None
+
 def get_db():
-    db = sqlite3.connect(DATABASE)
-    db.row_factory = sqlite3.Row
-    return db
+    """Return the connection bound to the current app context"""
+    if 'db' not in g:
+        # Released to the pool that issued it, even if close_pool() has replaced that pool since
+        g.db_pool = get_pool()
+        g.db = g.db_pool.acquire()
+        if 'profile' in g and isinstance(g.db, InstrumentedConnection):
+            g.db.profile = g.profile
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exception=None):
+    db = g.pop('db', None)
+    pool = g.pop('db_pool', None)
+    if db is not None:
+        if isinstance(db, InstrumentedConnection):
+            db.profile = None
+        pool.release(db)
+
+# Instrumentation (opt-in): pooled connections record every statement's time
+# and rows into the current request's profile; finished requests feed
+# Prometheus metrics at /metrics and the slow-query log.
+app.config['INSTRUMENTATION'] = os.environ.get('ERP_INSTRUMENTATION', '0') == '1'
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('ERP_SLOW_QUERY_MS', 100))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('ERP_SLOW_QUERY_LOG', '')
+app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('ERP_N_PLUS_ONE_THRESHOLD', 20))
+app.config['METRICS_TOKEN'] = os.environ.get('ERP_METRICS_TOKEN', '')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+RECENT_SLOW_QUERIES = 100
+
+slow_query_logger = logging.getLogger('simple_erp.slow_queries')
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that adds execute and fetch time, and rows fetched, to its statement's profile entry"""
+    entry = None
+
+    def _run(self, method, sql, parameters, many=False):
+        profile = getattr(self.connection, 'profile', None)
+        if profile is None:
+            return method(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        finally:
+            self.entry = profile.record(sql, time.perf_counter() - started, many)
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self._run(super().executemany, sql, parameters, many=True)
+
+    def _fetched(self, started, rows):
+        if self.entry is not None:
+            self.entry[1] += time.perf_counter() - started
+            self.entry[2] += rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        row = super().__next__()
+        self._fetched(started, 1)
+        return row
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose shortcut methods go through InstrumentedCursor"""
+    profile = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+    def executescript(self, script):
+        profile = self.profile
+        started = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            if profile is not None:
+                profile.record(script, time.perf_counter() - started, False)
+
+_WHITESPACE = re.compile(r'\s+')
+
+class RequestProfile:
+    """Statements run while serving one request: [sql, seconds, rows, executemany] entries"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.entries = []
+
+    def record(self, sql, seconds, many):
+        entry = [sql, seconds, 0, many]
+        self.entries.append(entry)
+        return entry
+
+    def summary(self):
+        repeats = {}
+        for sql, _, _, many in self.entries:
+            if not many:
+                key = _WHITESPACE.sub(' ', sql).strip()
+                repeats[key] = repeats.get(key, 0) + 1
+        threshold = app.config['N_PLUS_ONE_THRESHOLD']
+        return {
+            'seconds': time.perf_counter() - self.started,
+            'statements': len(self.entries),
+            'db_seconds': sum(entry[1] for entry in self.entries),
+            'rows': sum(entry[2] for entry in self.entries),
+            'repeated': {sql: count for sql, count in repeats.items() if count >= threshold},
+            'slow': [entry for entry in self.entries if entry[1] * 1000 >= app.config['SLOW_QUERY_MS']],
+        }
+
+def _metric_labels(labels):
+    escape = lambda value: str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}' if labels else ''
+
+class MetricsRegistry:
+    """Counters and histograms kept in process memory, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets),
+                                                     'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def render(self, gauges=()):
+        """Exposition text; gauges are (name, labels, value) read at scrape time"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: dict(value, counts=list(value['counts'])) for key, value in self._histograms.items()}
+        lines = []
+        described = set()
+
+        def header(name):
+            if name not in described and name in self._help:
+                kind, text = self._help[name]
+                lines.append(f'# HELP {name} {text}')
+                lines.append(f'# TYPE {name} {kind}')
+                described.add(name)
+
+        for name, labels, value in gauges:
+            header(name)
+            lines.append(f'{name}{_metric_labels(labels)} {value}')
+        for (name, labels), value in sorted(counters.items()):
+            header(name)
+            lines.append(f'{name}{_metric_labels(labels)} {value}')
+        for (name, labels), histogram in sorted(histograms.items()):
+            header(name)
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                lines.append(f'{name}_bucket{_metric_labels(labels + (("le", bound),))} {count}')
+            lines.append(f'{name}_bucket{_metric_labels(labels + (("le", "+Inf"),))} {histogram["count"]}')
+            lines.append(f'{name}_sum{_metric_labels(labels)} {histogram["sum"]}')
+            lines.append(f'{name}_count{_metric_labels(labels)} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+for _name, _kind, _text in (
+    ('erp_http_requests_total', 'counter', 'Requests served, by route, method and status'),
+    ('erp_http_request_duration_seconds', 'histogram', 'Request latency by route'),
+    ('erp_http_request_db_statements', 'histogram', 'SQL statements run per request, by route'),
+    ('erp_db_statements_total', 'counter', 'SQL statements run by requests, by route'),
+    ('erp_db_seconds_total', 'counter', 'Time spent in SQLite by requests, by route'),
+    ('erp_db_rows_total', 'counter', 'Rows fetched by requests, by route'),
+    ('erp_db_slow_queries_total', 'counter', 'Statements slower than ERP_SLOW_QUERY_MS, by route'),
+    ('erp_db_n_plus_one_total', 'counter', 'Requests that repeated one statement ERP_N_PLUS_ONE_THRESHOLD times or more'),
+    ('erp_db_pool_connections', 'gauge', 'Pooled SQLite connections by state'),
+    ('erp_db_pool_events_total', 'counter', 'Connection pool hits, misses, waits and timeouts'),
+    ('erp_login_attempts_total', 'counter', 'Login attempts by result: success, failure, throttled or busy'),
+):
+    metrics.describe(_name, _kind, _text)
+
+recent_slow_queries = deque(maxlen=RECENT_SLOW_QUERIES)
+
+def configure_slow_query_log():
+    path = app.config['SLOW_QUERY_LOG']
+    if path and not slow_query_logger.handlers:
+        handler = logging.FileHandler(path, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.setLevel(logging.INFO)
+
+configure_slow_query_log()
+
+def finish_profile(profile, status):
+    """Fold a finished request's profile into the metrics; returns its summary"""
+    summary = profile.summary()
+    endpoint = request.endpoint or 'unknown'
+    route = (('endpoint', endpoint),)
+    metrics.inc('erp_http_requests_total', route + (('method', request.method), ('status', status)))
+    metrics.observe('erp_http_request_duration_seconds', route, summary['seconds'], LATENCY_BUCKETS)
+    metrics.observe('erp_http_request_db_statements', route, summary['statements'], STATEMENT_BUCKETS)
+    metrics.inc('erp_db_statements_total', route, summary['statements'])
+    metrics.inc('erp_db_seconds_total', route, summary['db_seconds'])
+    metrics.inc('erp_db_rows_total', route, summary['rows'])
+    for sql, seconds, rows, _ in summary['slow']:
+        metrics.inc('erp_db_slow_queries_total', route)
+        statement = _WHITESPACE.sub(' ', sql).strip()
+        recent_slow_queries.append({'endpoint': endpoint, 'ms': round(seconds * 1000, 1), 'rows': rows,
+                                    'sql': statement, 'at': datetime.now().isoformat(timespec='seconds')})
+        slow_query_logger.warning('slow query %.1f ms, %d rows, %s: %s', seconds * 1000, rows, endpoint, statement)
+    for sql, count in summary['repeated'].items():
+        metrics.inc('erp_db_n_plus_one_total', route)
+        slow_query_logger.warning('possible N+1 in %s: %d executions of %s', endpoint, count, sql)
+    return summary
+
+@app.before_request
+def start_profile():
+    if app.config['INSTRUMENTATION']:
+        g.profile = RequestProfile()
+        # Opening the session may already have taken the request's connection
+        if isinstance(g.get('db'), InstrumentedConnection):
+            g.db.profile = g.profile
+
+@app.after_request
+def record_profile(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        summary = finish_profile(profile, response.status_code)
+        response.headers['Server-Timing'] = (
+            f"db;dur={summary['db_seconds'] * 1000:.1f};desc=\"{summary['statements']} statements\", "
+            f"app;dur={summary['seconds'] * 1000:.1f}")
+    return response
+
+@app.teardown_request
+def record_failed_profile(exception=None):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        finish_profile(profile, 500)
+
+def pool_gauges():
+    stats = get_pool().snapshot()
+    gauges = [('erp_db_pool_connections', (('state', state),), stats[state]) for state in ('open', 'idle', 'in_use')]
+    return gauges + [('erp_db_pool_events_total', (('event', event),), stats[event])
+                     for event in ('hits', 'misses', 'waits', 'timeouts')]
 
 def init_db():
     """Initialize the database with required tables"""
-    db = get_db()
+    pool = get_pool()
+    db = pool.acquire()
+    configure_storage(db)
     
     # Users table
     db.execute('''
@@ -285,335 +835,2523 @@ def init_db():
     # Create default admin user if not exists
     cursor = db.execute("SELECT * FROM users WHERE username = 'admin'")
     if not cursor.fetchone():
-        hashed_pw = generate_password_hash('admin123')
+        hashed_pw = hash_password('admin123')
         db.execute(
             "INSERT INTO users (username, password, full_name, role, email, language) VALUES (?, ?, ?, ?, ?, ?)",
             ('admin', hashed_pw, 'Sistem Yöneticisi', 'admin', 'admin@company.com', 'tr')
         )
         db.commit()
     
-    db.close()
+    run_migrations(db)
+    pool.release(db)
 
-# Login required decorator
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
-    return decorated_function
+# Report rollups: summary tables kept current by triggers so reports() reads
+# precomputed rows instead of grouping the full order history.
+ROLLUP_TABLES = '''
+    CREATE TABLE IF NOT EXISTS sales_daily_product (
+        day TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS sales_monthly_product (
+        month TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (month, product_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS sales_daily_customer (
+        day TEXT NOT NULL,
+        customer_id INTEGER NOT NULL,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, customer_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS sales_monthly_customer (
+        month TEXT NOT NULL,
+        customer_id INTEGER NOT NULL,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (month, customer_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS inventory_summary (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        inventory_value REAL NOT NULL DEFAULT 0
+    );
+'''
 
-# Routes
-@app.route('/')
-def index():
-    if 'user_id' in session:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('login'))
+def _product_rollup_sql(sign, row):
+    """Statements adding (sign=+1) or removing (sign=-1) one order item from the product rollups"""
+    order_date = f'(SELECT order_date FROM sales_orders WHERE id = {row}.order_id)'
+    return ''.join(f'''
+        INSERT INTO sales_{period}_product ({key}, product_id, quantity, revenue)
+        VALUES ({expr.format(order_date)}, {row}.product_id, {sign} * {row}.quantity, {sign} * {row}.subtotal)
+        ON CONFLICT({key}, product_id) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue;'''
+        for period, key, expr in (('daily', 'day', 'date({})'), ('monthly', 'month', "strftime('%Y-%m', {})")))
 
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    if request.method == 'POST':
-        username = request.form['username']
-        password = request.form['password']
-        
-        db = get_db()
-        user = db.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        db.close()
-        
-        if user and check_password_hash(user['password'], password):
-            session['user_id'] = user['id']
-            session['username'] = user['username']
-            session['full_name'] = user['full_name']
-            session['role'] = user['role']
-            session['language'] = user['language'] if user['language'] else 'tr'
-            return redirect(url_for('dashboard'))
-        
-        error = get_translation('invalid_credentials', session.get('language', 'tr'))
-        return render_template('login.html', error=error, t=get_translation)
-    
-    return render_template('login.html', t=get_translation)
+def _customer_rollup_sql(sign, row):
+    """Statements adding or removing one completed order from the customer rollups"""
+    return ''.join(f'''
+        INSERT INTO sales_{period}_customer ({key}, customer_id, order_count, total)
+        SELECT {expr.format(row + '.order_date')}, {row}.customer_id, {sign}, {sign} * COALESCE({row}.total_amount, 0)
+        WHERE {row}.status = 'completed'
+        ON CONFLICT({key}, customer_id) DO UPDATE SET
+            order_count = order_count + excluded.order_count,
+            total = total + excluded.total;'''
+        for period, key, expr in (('daily', 'day', 'date({})'), ('monthly', 'month', "strftime('%Y-%m', {})")))
 
-@app.route('/set-language/<lang>')
-def set_language(lang):
-    """Dil değiştirme / Change language"""
-    if lang in ['tr', 'en']:
-        session['language'] = lang
-        # Kullanıcı giriş yapmışsa veritabanını güncelle
-        if 'user_id' in session:
-            db = get_db()
-            db.execute('UPDATE users SET language = ? WHERE id = ?', (lang, session['user_id']))
-            db.commit()
-            db.close()
-    return redirect(request.referrer or url_for('dashboard'))
+def _product_rollup_move_sql(sign, date):
+    """Statements adding or removing all of NEW's items at the given order date"""
+    return ''.join(f'''
+        INSERT INTO sales_{period}_product ({key}, product_id, quantity, revenue)
+        SELECT {expr.format(date)}, product_id, {sign} * SUM(quantity), {sign} * SUM(subtotal)
+        FROM sales_order_items WHERE order_id = NEW.id
+        GROUP BY product_id
+        ON CONFLICT({key}, product_id) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue;'''
+        for period, key, expr in (('daily', 'day', 'date({})'), ('monthly', 'month', "strftime('%Y-%m', {})")))
 
-@app.route('/logout')
-def logout():
-    session.clear()
-    return redirect(url_for('login'))
+# Redating an order moves its items between the product rollups' date buckets
+ROLLUP_ORDER_DATE_TRIGGER = f'''
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_order_date AFTER UPDATE OF order_date ON sales_orders
+    WHEN OLD.order_date IS NOT NEW.order_date
+    BEGIN {_product_rollup_move_sql('-1', 'OLD.order_date')} {_product_rollup_move_sql('+1', 'NEW.order_date')}
+    END
+'''
 
-@app.route('/dashboard')
-@login_required
-def dashboard():
-    db = get_db()
-    
-    # Get statistics
-    stats = {
-        'total_products': db.execute('SELECT COUNT(*) as count FROM products').fetchone()['count'],
-        'low_stock': db.execute('SELECT COUNT(*) as count FROM products WHERE quantity <= reorder_level').fetchone()['count'],
-        'total_customers': db.execute('SELECT COUNT(*) as count FROM customers').fetchone()['count'],
-        'pending_orders': db.execute('SELECT COUNT(*) as count FROM sales_orders WHERE status = "pending"').fetchone()['count'],
-        'total_sales': db.execute('SELECT COALESCE(SUM(total_amount), 0) as total FROM sales_orders WHERE status = "completed"').fetchone()['total'],
-        'recent_orders': db.execute('''
-            SELECT so.*, c.name as customer_name 
-            FROM sales_orders so 
-            JOIN customers c ON so.customer_id = c.id 
-            ORDER BY so.order_date DESC LIMIT 5
-        ''').fetchall()
-    }
-    
-    db.close()
-    return render_template('dashboard.html', stats=stats, t=get_translation)
+ROLLUP_TRIGGERS = f'''
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_item_insert AFTER INSERT ON sales_order_items
+    BEGIN {_product_rollup_sql('+1', 'NEW')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_item_delete AFTER DELETE ON sales_order_items
+    BEGIN {_product_rollup_sql('-1', 'OLD')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_order_insert AFTER INSERT ON sales_orders
+    BEGIN {_customer_rollup_sql('+1', 'NEW')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_order_update
+    AFTER UPDATE OF status, total_amount, customer_id, order_date ON sales_orders
+    BEGIN {_customer_rollup_sql('-1', 'OLD')} {_customer_rollup_sql('+1', 'NEW')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_order_delete AFTER DELETE ON sales_orders
+    BEGIN {_customer_rollup_sql('-1', 'OLD')}
+    END;
+    {ROLLUP_ORDER_DATE_TRIGGER};
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_insert AFTER INSERT ON products
+    BEGIN
+        UPDATE inventory_summary
+        SET inventory_value = inventory_value + COALESCE(NEW.quantity * NEW.unit_price, 0)
+        WHERE id = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_update AFTER UPDATE OF quantity, unit_price ON products
+    BEGIN
+        UPDATE inventory_summary
+        SET inventory_value = inventory_value
+            + COALESCE(NEW.quantity * NEW.unit_price, 0) - COALESCE(OLD.quantity * OLD.unit_price, 0)
+        WHERE id = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_inventory_delete AFTER DELETE ON products
+    BEGIN
+        UPDATE inventory_summary
+        SET inventory_value = inventory_value - COALESCE(OLD.quantity * OLD.unit_price, 0)
+        WHERE id = 1;
+    END;
+'''
 
-# Product/Inventory routes
-@app.route('/products')
-@login_required
-def products():
-    db = get_db()
-    products = db.execute('''
-        SELECT p.*, s.name as supplier_name, m.mold_code
-        FROM products p 
-        LEFT JOIN suppliers s ON p.supplier_id = s.id
-        LEFT JOIN molds m ON p.mold_id = m.id
-        ORDER BY p.name
-    ''').fetchall()
-    db.close()
-    return render_template('products.html', products=products, t=get_translation)
+def rebuild_rollups(db):
+    """Recompute every report rollup from the source tables (caller commits)"""
+    db.execute('DELETE FROM sales_daily_product')
+    db.execute('DELETE FROM sales_monthly_product')
+    db.execute('DELETE FROM sales_daily_customer')
+    db.execute('DELETE FROM sales_monthly_customer')
+    db.execute('DELETE FROM inventory_summary')
+    for period, key, expr in (('daily', 'day', 'date(so.order_date)'),
+                              ('monthly', 'month', "strftime('%Y-%m', so.order_date)")):
+        db.execute(f'''
+            INSERT INTO sales_{period}_product ({key}, product_id, quantity, revenue)
+            SELECT {expr}, soi.product_id, SUM(soi.quantity), SUM(soi.subtotal)
+            FROM sales_order_items soi
+            JOIN sales_orders so ON soi.order_id = so.id
+            GROUP BY 1, 2
+        ''')
+        db.execute(f'''
+            INSERT INTO sales_{period}_customer ({key}, customer_id, order_count, total)
+            SELECT {expr}, so.customer_id, COUNT(*), COALESCE(SUM(so.total_amount), 0)
+            FROM sales_orders so
+            WHERE so.status = 'completed'
+            GROUP BY 1, 2
+        ''')
+    db.execute('''
+        INSERT INTO inventory_summary (id, inventory_value)
+        SELECT 1, COALESCE(SUM(quantity * unit_price), 0) FROM products
+    ''')
 
-@app.route('/products/add', methods=['GET', 'POST'])
-@login_required
-def add_product():
-    if request.method == 'POST':
-        db = get_db()
-        db.execute('''
-            INSERT INTO products (name, sku, description, category, product_type, material_type,
-                                material_grade, color, piece_weight, dimensions, quantity, unit,
-                                unit_price, cost_price, reorder_level, supplier_id, mold_id,
-                                cycle_time, pieces_per_hour, technical_drawing_no, packaging_qty,
-                                storage_location)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            request.form['name'],
-            request.form['sku'],
-            request.form.get('description', ''),
-            request.form.get('category', ''),
-            request.form.get('product_type', 'finished_good'),
-            request.form.get('material_type', ''),
-            request.form.get('material_grade', ''),
-            request.form.get('color', ''),
-            float(request.form.get('piece_weight', 0)) if request.form.get('piece_weight') else None,
-            request.form.get('dimensions', ''),
-            int(request.form.get('quantity', 0)),
-            request.form.get('unit', 'pcs'),
-            float(request.form['unit_price']),
-            float(request.form.get('cost_price', 0)) if request.form.get('cost_price') else None,
-            int(request.form.get('reorder_level', 10)),
-            int(request.form['supplier_id']) if request.form.get('supplier_id') else None,
-            int(request.form['mold_id']) if request.form.get('mold_id') else None,
-            int(request.form.get('cycle_time', 0)) if request.form.get('cycle_time') else None,
-            int(request.form.get('pieces_per_hour', 0)) if request.form.get('pieces_per_hour') else None,
-            request.form.get('technical_drawing_no', ''),
-            int(request.form.get('packaging_qty', 0)) if request.form.get('packaging_qty') else None,
-            request.form.get('storage_location', '')
-        ))
-        db.commit()
-        db.close()
-        return redirect(url_for('products'))
-    
-    db = get_db()
-    suppliers = db.execute('SELECT * FROM suppliers ORDER BY name').fetchall()
-    molds = db.execute('SELECT * FROM molds ORDER BY mold_code').fetchall()
-    db.close()
-    return render_template('product_form.html', product=None, suppliers=suppliers, molds=molds, t=get_translation)
+def create_report_rollups(db):
+    db.executescript(ROLLUP_TABLES)
+    db.executescript(ROLLUP_TRIGGERS)
+    rebuild_rollups(db)
 
-@app.route('/products/edit/<int:id>', methods=['GET', 'POST'])
-@login_required
-def edit_product(id):
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the report summary tables from orders and products."""
     db = get_db()
-    
-    if request.method == 'POST':
-        db.execute('''
-            UPDATE products 
-            SET name=?, sku=?, description=?, category=?, product_type=?, material_type=?,
-                material_grade=?, color=?, piece_weight=?, dimensions=?, quantity=?, unit=?,
-                unit_price=?, cost_price=?, reorder_level=?, supplier_id=?, mold_id=?,
-                cycle_time=?, pieces_per_hour=?, technical_drawing_no=?, packaging_qty=?,
-                storage_location=?, updated_at=?
-            WHERE id=?
-        ''', (
-            request.form['name'],
-            request.form['sku'],
-            request.form.get('description', ''),
-            request.form.get('category', ''),
-            request.form.get('product_type', 'finished_good'),
-            request.form.get('material_type', ''),
-            request.form.get('material_grade', ''),
-            request.form.get('color', ''),
-            float(request.form.get('piece_weight', 0)) if request.form.get('piece_weight') else None,
-            request.form.get('dimensions', ''),
-            int(request.form.get('quantity', 0)),
-            request.form.get('unit', 'pcs'),
-            float(request.form['unit_price']),
-            float(request.form.get('cost_price', 0)) if request.form.get('cost_price') else None,
-            int(request.form.get('reorder_level', 10)),
-            int(request.form['supplier_id']) if request.form.get('supplier_id') else None,
-            int(request.form['mold_id']) if request.form.get('mold_id') else None,
-            int(request.form.get('cycle_time', 0)) if request.form.get('cycle_time') else None,
-            int(request.form.get('pieces_per_hour', 0)) if request.form.get('pieces_per_hour') else None,
-            request.form.get('technical_drawing_no', ''),
-            int(request.form.get('packaging_qty', 0)) if request.form.get('packaging_qty') else None,
-            request.form.get('storage_location', ''),
-            datetime.now(),
-            id
-        ))
-        db.commit()
-        db.close()
-        return redirect(url_for('products'))
-    
-    product = db.execute('SELECT * FROM products WHERE id = ?', (id,)).fetchone()
-    suppliers = db.execute('SELECT * FROM suppliers ORDER BY name').fetchall()
-    molds = db.execute('SELECT * FROM molds ORDER BY mold_code').fetchall()
-    db.close()
-    return render_template('product_form.html', product=product, suppliers=suppliers, molds=molds, t=get_translation)
+    db.execute('BEGIN IMMEDIATE')
+    rebuild_rollups(db)
+    db.commit()
+    print('Report rollups rebuilt')
 
-@app.route('/products/delete/<int:id>')
-@login_required
-def delete_product(id):
+# Full-text search: one FTS5 index over products, customers, suppliers and order
+# numbers. Row ids encode the source row as ref_id * 8 + kind code so triggers
+# can replace or delete an entry without scanning the index. Each kind lists
+# the columns whose updates re-index the row, then the (title, code, body) values.
+SEARCH_KINDS = {
+    'product': (1, 'products', 'name, sku, technical_drawing_no, description, material_type, category', '''
+        {row}.name, {row}.sku || ' ' || COALESCE({row}.technical_drawing_no, ''),
+        COALESCE({row}.description, '') || ' ' || COALESCE({row}.material_type, '') || ' ' || COALESCE({row}.category, '')
+    '''),
+    'customer': (2, 'customers', 'name, email, phone, company, address', '''
+        {row}.name, COALESCE({row}.email, '') || ' ' || COALESCE({row}.phone, ''),
+        COALESCE({row}.company, '') || ' ' || COALESCE({row}.address, '')
+    '''),
+    'supplier': (3, 'suppliers', 'name, email, phone, contact_person, address', '''
+        {row}.name, COALESCE({row}.email, '') || ' ' || COALESCE({row}.phone, ''),
+        COALESCE({row}.contact_person, '') || ' ' || COALESCE({row}.address, '')
+    '''),
+    'sales_order': (4, 'sales_orders', 'order_number, customer_id', '''
+        {row}.order_number, '',
+        COALESCE((SELECT name FROM customers WHERE id = {row}.customer_id), '')
+    '''),
+    'production_order': (5, 'production_orders', 'order_number, operator_name, notes', '''
+        {row}.order_number, '',
+        COALESCE({row}.operator_name, '') || ' ' || COALESCE({row}.notes, '')
+    '''),
+}
+SEARCH_KIND_BY_CODE = {code: kind for kind, (code, _, _, _) in SEARCH_KINDS.items()}
+
+def _search_triggers():
+    statements = []
+    for kind, (code, table, watched, columns) in SEARCH_KINDS.items():
+        upsert = f'''
+            INSERT OR REPLACE INTO search_index (rowid, title, code, body)
+            VALUES (NEW.id * 8 + {code}, {columns.format(row='NEW')});'''
+        statements.append(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_search_{table}_insert AFTER INSERT ON {table}
+            BEGIN {upsert} END;
+            CREATE TRIGGER IF NOT EXISTS trg_search_{table}_update AFTER UPDATE OF {watched} ON {table}
+            BEGIN
+                DELETE FROM search_index WHERE rowid = OLD.id * 8 + {code};
+                {upsert}
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_search_{table}_delete AFTER DELETE ON {table}
+            BEGIN DELETE FROM search_index WHERE rowid = OLD.id * 8 + {code}; END;
+        ''')
+    return ''.join(statements)
+
+def rebuild_search_index(db):
+    """Repopulate the search index from the source tables (caller commits)"""
+    db.execute('DELETE FROM search_index')
+    for kind, (code, table, watched, columns) in SEARCH_KINDS.items():
+        db.execute(f'''
+            INSERT INTO search_index (rowid, title, code, body)
+            SELECT src.id * 8 + {code}, {columns.format(row='src')} FROM {table} src
+        ''')
+    db.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+
+def create_search_index(db):
+    db.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            title, code, body,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3 4'
+        )
+    ''')
+    db.executescript(_search_triggers())
+    rebuild_search_index(db)
+
+def build_match_query(text):
+    """Turn user input into an FTS5 query where every word is a quoted prefix"""
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+def search(db, text, kinds=None, limit=10):
+    """Ranked prefix search; returns dicts with kind, id, title and code"""
+    match = build_match_query(text)
+    if not match:
+        return []
+    sql = '''
+        SELECT rowid, title, code FROM search_index
+        WHERE search_index MATCH ?
+    '''
+    params = [match]
+    if kinds:
+        codes = [SEARCH_KINDS[k][0] for k in kinds if k in SEARCH_KINDS]
+        sql += f" AND (rowid % 8) IN ({', '.join('?' * len(codes))})"
+        params.extend(codes)
+    sql += ' ORDER BY bm25(search_index, 10.0, 5.0, 1.0) LIMIT ?'
+    params.append(limit)
+    return [{
+        'kind': SEARCH_KIND_BY_CODE[row['rowid'] % 8],
+        'id': row['rowid'] // 8,
+        'title': row['title'],
+        'code': row['code'].strip(),
+    } for row in db.execute(sql, params)]
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Repopulate the full-text search index."""
     db = get_db()
-    db.execute('DELETE FROM products WHERE id = ?', (id,))
+    db.execute('BEGIN IMMEDIATE')
+    rebuild_search_index(db)
     db.commit()
-    db.close()
-    return redirect(url_for('products'))
+    print('Search index rebuilt')
 
-# Customer routes
-@app.route('/customers')
-@login_required
-def customers():
-    db = get_db()
-    customers = db.execute('SELECT * FROM customers ORDER BY name').fetchall()
-    db.close()
-    return render_template('customers.html', customers=customers, t=get_translation)
+# Document numbering: counters in the sequences table are advanced atomically,
+# optionally a block at a time so each worker hands out numbers from memory.
+DOCUMENT_SEQUENCES = {
+    'sales_order': 'SO',
+    'production_order': 'PO',
+    'purchase_order': 'PUR',
+}
+app.config['SEQUENCE_BLOCK_SIZE'] = int(os.environ.get('ERP_SEQUENCE_BLOCK_SIZE', 1))
 
-@app.route('/customers/add', methods=['GET', 'POST'])
-@login_required
-def add_customer():
-    if request.method == 'POST':
-        db = get_db()
-        db.execute('''
-            INSERT INTO customers (name, email, phone, address, company)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            request.form['name'],
-            request.form.get('email', ''),
-            request.form.get('phone', ''),
-            request.form.get('address', ''),
-            request.form.get('company', '')
-        ))
-        db.commit()
-        db.close()
-        return redirect(url_for('customers'))
-    
-    return render_template('customer_form.html', customer=None, t=get_translation)
+def seed_sequences(db):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS sequences (
+            name TEXT PRIMARY KEY,
+            last_value INTEGER NOT NULL
+        )
+    ''')
+    for name, table in (('sales_order', 'sales_orders'), ('production_order', 'production_orders')):
+        prefix = DOCUMENT_SEQUENCES[name] + '-'
+        db.execute(f'''
+            INSERT OR IGNORE INTO sequences (name, last_value)
+            SELECT ?, COALESCE(MAX(CAST(substr(order_number, ?) AS INTEGER)), 0)
+            FROM {table} WHERE order_number LIKE ?
+        ''', (name, len(prefix) + 1, prefix + '%'))
 
-@app.route('/customers/edit/<int:id>', methods=['GET', 'POST'])
-@login_required
-def edit_customer(id):
-    db = get_db()
-    
-    if request.method == 'POST':
-        db.execute('''
-            UPDATE customers 
-            SET name=?, email=?, phone=?, address=?, company=?
-            WHERE id=?
-        ''', (
-            request.form['name'],
-            request.form.get('email', ''),
-            request.form.get('phone', ''),
-            request.form.get('address', ''),
-            request.form.get('company', ''),
-            id
-        ))
-        db.commit()
-        db.close()
-        return redirect(url_for('customers'))
-    
-    customer = db.execute('SELECT * FROM customers WHERE id = ?', (id,)).fetchone()
-    db.close()
-    return render_template('customer_form.html', customer=customer, t=get_translation)
+class SequenceAllocator:
+    """Hands out collision-free document numbers from the sequences table"""
 
-# Supplier routes
-@app.route('/suppliers')
-@login_required
-def suppliers():
-    db = get_db()
-    suppliers = db.execute('SELECT * FROM suppliers ORDER BY name').fetchall()
-    db.close()
-    return render_template('suppliers.html', suppliers=suppliers, t=get_translation)
+    def __init__(self, block_size=1):
+        self.block_size = max(1, block_size)
+        self._blocks = {}
+        self._lock = threading.Lock()
 
-@app.route('/suppliers/add', methods=['GET', 'POST'])
-@login_required
-def add_supplier():
-    if request.method == 'POST':
-        db = get_db()
-        db.execute('''
-            INSERT INTO suppliers (name, email, phone, address, contact_person)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            request.form['name'],
-            request.form.get('email', ''),
-            request.form.get('phone', ''),
-            request.form.get('address', ''),
-            request.form.get('contact_person', '')
-        ))
-        db.commit()
-        db.close()
-        return redirect(url_for('suppliers'))
-    
-    return render_template('supplier_form.html', supplier=None, t=get_translation)
+    def _reserve(self, db, name, size):
+        if db.in_transaction:
+            raise RuntimeError('allocate sequence numbers before starting the write transaction')
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            last = db.execute('''
+                INSERT INTO sequences (name, last_value) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET last_value = last_value + excluded.last_value
+                RETURNING last_value
+            ''', (name, size)).fetchone()[0]
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return last - size + 1, last
 
-@app.route('/suppliers/edit/<int:id>', methods=['GET', 'POST'])
-@login_required
-def edit_supplier(id):
-    db = get_db()
-    
-    if request.method == 'POST':
-        db.execute('''
-            UPDATE suppliers 
+    def next_value(self, db, name):
+        with self._lock:
+            start, end = self._blocks.get(name, (1, 0))
+            if start > end:
+                start, end = self._reserve(db, name, self.block_size)
+            self._blocks[name] = (start + 1, end)
+            return start
+
+sequence_allocator = SequenceAllocator(app.config['SEQUENCE_BLOCK_SIZE'])
+
+def next_document_number(db, name):
+    """Allocate the next number for a document type, e.g. SO-00042"""
+    return f'{DOCUMENT_SEQUENCES[name]}-{sequence_allocator.next_value(db, name):05d}'
+
+# Change counters: triggers bump a per-table version on every write so API
+# responses can be validated (ETag / Last-Modified) without reading row data.
+CHANGE_TRACKED_TABLES = ('products', 'customers', 'suppliers', 'molds', 'machines',
+                         'production_orders', 'sales_orders', 'sales_order_items')
+
+def create_change_counters(db):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+    for table in CHANGE_TRACKED_TABLES:
+        db.execute('INSERT OR IGNORE INTO table_versions (table_name) VALUES (?)', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                AFTER {event} ON {table} BEGIN
+                    UPDATE table_versions SET version = version + 1, changed_at = CURRENT_TIMESTAMP
+                    WHERE table_name = '{table}';
+                END
+            ''')
+
+def table_versions(db, tables):
+    """(version tag, last change time in UTC) covering the given tables"""
+    rows = db.execute(
+        'SELECT table_name, version, changed_at FROM table_versions '
+        'WHERE table_name IN (SELECT value FROM json_each(?)) ORDER BY table_name',
+        (json.dumps(list(tables)),)).fetchall()
+    tag = '.'.join(str(row['version']) for row in rows)
+    changed = max((row['changed_at'] for row in rows), default=None)
+    if changed:
+        changed = datetime.strptime(changed, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return tag, changed
+
+# Live events: write paths append to app_events in their own transaction and
+# one dispatcher thread per process fans new rows out to /events subscribers,
+# so events from every worker process reach every browser.
+app.config['EVENT_POLL_INTERVAL'] = float(os.environ.get('ERP_EVENT_POLL_INTERVAL', 1))
+app.config['EVENT_KEEPALIVE'] = float(os.environ.get('ERP_EVENT_KEEPALIVE', 15))
+app.config['EVENT_RETENTION'] = int(os.environ.get('ERP_EVENT_RETENTION', 3600))
+# Open /events streams per process. Under gevent (gunicorn_events.conf.py) an
+# idle stream is a greenlet; on a threaded server each holds a request thread,
+# so there the much lower EVENT_THREAD_SUBSCRIBERS applies (keep it below ERP_THREADS).
+app.config['EVENT_MAX_SUBSCRIBERS'] = int(os.environ.get('ERP_EVENT_MAX_SUBSCRIBERS', 1000))
+app.config['EVENT_THREAD_SUBSCRIBERS'] = int(os.environ.get('ERP_EVENT_THREAD_SUBSCRIBERS', 2))
+EVENT_QUEUE_SIZE = 256
+EVENT_BATCH_SIZE = 500
+
+# channel -> (table, columns sent with each event)
+EVENT_CHANNELS = {
+    'production': ('production_orders', 'id, order_number, status, quality_status, product_id, mold_id, '
+                                        'machine_id, produced_quantity, scrap_quantity'),
+    'machine': ('machines', 'id, machine_code, machine_name, status'),
+}
+
+def create_event_log(db):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS app_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def publish_event(db, channel, row_id, action='updated'):
+    """Queue a change event for a row (None for bulk changes) in the caller's transaction.
+
+    Call notify_subscribers() after committing so this process delivers it at once.
+    """
+    table, columns = EVENT_CHANNELS[channel]
+    row = None
+    if row_id is not None:
+        row = db.execute(f'SELECT {columns} FROM {table} WHERE id = ?', (row_id,)).fetchone()
+    payload = dict(row) if row is not None else {'id': row_id}
+    payload['action'] = action
+    db.execute('INSERT INTO app_events (channel, payload) VALUES (?, ?)', (channel, json.dumps(payload)))
+
+def event_stream_limit():
+    """Number of /events streams this process accepts"""
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('threading'):
+        return app.config['EVENT_MAX_SUBSCRIBERS']
+    return app.config['EVENT_THREAD_SUBSCRIBERS']
+
+class _Subscriber:
+    def __init__(self, channels):
+        self.channels = channels
+        self.queue = queue.Queue(EVENT_QUEUE_SIZE)
+        self.lagging = False
+
+class EventBroker:
+    """Per-process fan-out of app_events rows to SSE subscribers"""
+
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_id = None
+        self._last_prune = 0
+
+    def subscribe(self, channels=None):
+        subscriber = _Subscriber(set(channels) if channels else None)
+        with self._lock:
+            if len(self._subscribers) >= event_stream_limit():
+                raise OverflowError('too many live-update streams')
+            if self._last_id is None:
+                # Start from the current end of the log; older events are replayed by the route
+                pool = get_pool()
+                db = pool.acquire()
+                try:
+                    self._last_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM app_events').fetchone()[0]
+                finally:
+                    pool.release(db)
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='event-dispatch', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def notify(self):
+        self._wake.set()
+
+    def _dispatch(self, rows):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for row in rows:
+            for subscriber in subscribers:
+                if subscriber.channels is not None and row['channel'] not in subscriber.channels:
+                    continue
+                try:
+                    subscriber.queue.put_nowait((row['id'], row['channel'], row['payload']))
+                except queue.Full:
+                    # A stalled browser must not hold up the others; it reloads instead
+                    subscriber.lagging = True
+
+    def poll(self):
+        pool = get_pool()
+        db = pool.acquire()
+        try:
+            rows = db.execute('SELECT id, channel, payload FROM app_events WHERE id > ? ORDER BY id LIMIT ?',
+                              (self._last_id, EVENT_BATCH_SIZE)).fetchall()
+            if time.monotonic() - self._last_prune > 60:
+                self._last_prune = time.monotonic()
+                db.execute("DELETE FROM app_events WHERE created_at < datetime('now', ?)",
+                           (f"-{app.config['EVENT_RETENTION']} seconds",))
+                db.commit()
+        finally:
+            pool.release(db)
+        if rows:
+            self._last_id = rows[-1]['id']
+            self._dispatch(rows)
+        return len(rows)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if not self._subscribers:
+                continue
+            try:
+                while self.poll() == EVENT_BATCH_SIZE:
+                    pass
+            except sqlite3.Error as e:
+                app.logger.warning('Event dispatch failed: %s', e)
+
+event_broker = EventBroker(app.config['EVENT_POLL_INTERVAL'])
+
+def notify_subscribers():
+    event_broker.notify()
+
+# Machine telemetry: events are buffered in memory and written in batches to
+# machine_telemetry; each flush also advances mold shot counters and machine
+# running hours from the states reported since the machine's last event.
+app.config['TELEMETRY_TOKEN'] = os.environ.get('ERP_TELEMETRY_TOKEN', '')
+app.config['TELEMETRY_BATCH_SIZE'] = int(os.environ.get('ERP_TELEMETRY_BATCH_SIZE', 500))
+app.config['TELEMETRY_FLUSH_INTERVAL'] = float(os.environ.get('ERP_TELEMETRY_FLUSH_INTERVAL', 1))
+app.config['TELEMETRY_MAX_BUFFER'] = int(os.environ.get('ERP_TELEMETRY_MAX_BUFFER', 50000))
+# Longer silences are treated as the machine being offline, not running
+TELEMETRY_MAX_GAP_MS = 300 * 1000
+
+# Same vocabulary as machines.status; stored as the index
+TELEMETRY_STATES = ('idle', 'working', 'maintenance', 'broken')
+
+def create_telemetry_tables(db):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS machine_telemetry (
+            machine_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            mold_id INTEGER,
+            shots INTEGER NOT NULL DEFAULT 0,
+            cycle_ms INTEGER,
+            state INTEGER
+        )
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_machine_telemetry_machine_ts ON machine_telemetry(machine_id, ts)')
+    db.execute('ALTER TABLE machines ADD COLUMN run_seconds REAL DEFAULT 0')
+    db.execute('ALTER TABLE machines ADD COLUMN telemetry_state INTEGER')
+    db.execute('ALTER TABLE machines ADD COLUMN telemetry_ts INTEGER')
+    db.execute('ALTER TABLE production_orders ADD COLUMN telemetry_shots INTEGER DEFAULT 0')
+
+def parse_telemetry_event(data, now_ms=None):
+    """Validate one posted event; returns (machine key, ts ms, mold_id, shots, cycle ms, state code)"""
+    if not isinstance(data, dict):
+        raise ValueError('event must be an object')
+    if data.get('machine_id') is not None:
+        machine = int(data['machine_id'])
+    elif data.get('machine_code'):
+        machine = str(data['machine_code'])
+    else:
+        raise ValueError('machine_id or machine_code is required')
+    ts = data.get('ts')
+    if ts is None:
+        ts_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    elif isinstance(ts, (int, float)):
+        ts_ms = int(ts * 1000)
+    else:
+        parsed = datetime.fromisoformat(str(ts))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        ts_ms = int(parsed.timestamp() * 1000)
+    shots = int(data.get('shots') or 0)
+    if shots < 0:
+        raise ValueError('shots must not be negative')
+    cycle_ms = int(float(data['cycle_time']) * 1000) if data.get('cycle_time') is not None else None
+    state = data.get('state')
+    if state is not None:
+        if state not in TELEMETRY_STATES:
+            raise ValueError('state must be one of ' + ', '.join(TELEMETRY_STATES))
+        state = TELEMETRY_STATES.index(state)
+    mold_id = int(data['mold_id']) if data.get('mold_id') is not None else None
+    return machine, ts_ms, mold_id, shots, cycle_ms, state
+
+def write_telemetry(db, events):
+    """Write a batch of parsed events in one transaction.
+
+    Returns (written, rejected); events for unknown machines are rejected.
+    """
+    ids = sorted({e[0] for e in events if isinstance(e[0], int)})
+    codes = sorted({e[0] for e in events if isinstance(e[0], str)})
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        machines = {}
+        for row in db.execute('''
+            SELECT id, machine_code, status, telemetry_state, telemetry_ts FROM machines
+            WHERE id IN (SELECT value FROM json_each(?)) OR machine_code IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(ids), json.dumps(codes))):
+            machines[row['id']] = machines[row['machine_code']] = row
+        # The order running on a machine supplies the mold when an event has none
+        running = {}
+        for row in db.execute('''
+            SELECT id, machine_id, mold_id FROM production_orders
+            WHERE status = 'in_progress' AND machine_id IN (SELECT value FROM json_each(?))
+            ORDER BY id
+        ''', (json.dumps(sorted({row['id'] for row in machines.values()})),)):
+            running[row['machine_id']] = row
+        
+        rows, mold_shots, order_shots, machine_updates = [], {}, {}, []
+        accepted = sorted(((machines[e[0]]['id'],) + e[1:] for e in events if e[0] in machines),
+                          key=lambda e: (e[0], e[1]))
+        by_machine = {}
+        for event in accepted:
+            by_machine.setdefault(event[0], []).append(event)
+        for machine_id, machine_events in by_machine.items():
+            machine = machines[machine_id]
+            state, last_ts = machine['telemetry_state'], machine['telemetry_ts']
+            run_ms = 0
+            order = running.get(machine_id)
+            for _, ts, mold_id, shots, cycle_ms, event_state in machine_events:
+                if mold_id is None and order is not None:
+                    mold_id = order['mold_id']
+                if shots and mold_id is not None:
+                    mold_shots[mold_id] = mold_shots.get(mold_id, 0) + shots
+                    if order is not None and mold_id == order['mold_id']:
+                        order_shots[order['id']] = order_shots.get(order['id'], 0) + shots
+                rows.append((machine_id, ts, mold_id, shots, cycle_ms, event_state))
+                # Late events still count shots but never move the clock backwards
+                if last_ts is not None and ts < last_ts:
+                    continue
+                if state == TELEMETRY_STATES.index('working') and last_ts is not None \
+                        and ts - last_ts <= TELEMETRY_MAX_GAP_MS:
+                    run_ms += ts - last_ts
+                last_ts = ts
+                if event_state is not None:
+                    state = event_state
+            status = TELEMETRY_STATES[state] if state is not None else machine['status']
+            machine_updates.append((machine_id, run_ms / 1000, state, last_ts, status,
+                                    status != machine['status']))
+        
+        db.executemany('''
+            INSERT INTO machine_telemetry (machine_id, ts, mold_id, shots, cycle_ms, state)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+        db.executemany('''
+            UPDATE machines
+            SET total_hours = COALESCE(total_hours, 0) + CAST((COALESCE(run_seconds, 0) + :run) / 3600 AS INTEGER),
+                run_seconds = COALESCE(run_seconds, 0) + :run
+                              - 3600 * CAST((COALESCE(run_seconds, 0) + :run) / 3600 AS INTEGER),
+                telemetry_state = :state, telemetry_ts = :ts, status = :status
+            WHERE id = :id
+        ''', [{'id': machine_id, 'run': run, 'state': state, 'ts': ts, 'status': status}
+              for machine_id, run, state, ts, status, _ in machine_updates])
+        db.executemany('''
+            UPDATE molds
+            SET total_shots = total_shots + ?,
+                shots_since_maintenance = shots_since_maintenance + ?
+            WHERE id = ?
+        ''', [(shots, shots, mold_id) for mold_id, shots in mold_shots.items()])
+        db.executemany('UPDATE production_orders SET telemetry_shots = telemetry_shots + ? WHERE id = ?',
+                       [(shots, order_id) for order_id, shots in order_shots.items()])
+        for machine_id, _, _, _, _, changed in machine_updates:
+            if changed:
+                publish_event(db, 'machine', machine_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if any(update[5] for update in machine_updates):
+        notify_subscribers()
+    return len(rows), len(events) - len(rows)
+
+class TelemetryBuffer:
+    """In-memory event buffer flushed by a background thread in batched transactions"""
+
+    def __init__(self, batch_size, flush_interval, max_events):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self._events = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.stats = {'received': 0, 'written': 0, 'rejected': 0, 'flushes': 0,
+                      'failures': 0, 'last_flush_ms': 0.0}
+
+    def add(self, events):
+        with self._lock:
+            if len(self._events) + len(events) > self.max_events:
+                raise OverflowError('telemetry buffer full')
+            self._events.extend(events)
+            self.stats['received'] += len(events)
+            pending = len(self._events)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='telemetry-flush', daemon=True)
+                self._thread.start()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of events written"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+            if not events:
+                return 0
+            started = time.perf_counter()
+            pool = get_pool()
+            db = pool.acquire()
+            written = 0
+            try:
+                for i in range(0, len(events), self.batch_size):
+                    batch = events[i:i + self.batch_size]
+                    try:
+                        batch_written, rejected = write_telemetry(db, batch)
+                    except sqlite3.Error:
+                        # Keep the unwritten events for the next attempt
+                        with self._lock:
+                            self._events[:0] = events[i:]
+                        self.stats['failures'] += 1
+                        raise
+                    written += batch_written
+                    self.stats['written'] += batch_written
+                    self.stats['rejected'] += rejected
+            finally:
+                pool.release(db)
+            self.stats['flushes'] += 1
+            self.stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            return written
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                app.logger.warning('Telemetry flush failed: %s', e)
+
+    def snapshot(self):
+        with self._lock:
+            pending = len(self._events)
+        return dict(self.stats, pending=pending)
+
+telemetry_buffer = TelemetryBuffer(app.config['TELEMETRY_BATCH_SIZE'],
+                                   app.config['TELEMETRY_FLUSH_INTERVAL'],
+                                   app.config['TELEMETRY_MAX_BUFFER'])
+
+# OEE: availability x performance x quality from production order data.
+# Windows are split into shift intervals; the additive components of every
+# fully elapsed shift (run time, ideal time, counts per machine and mold) are
+# stored in oee_period_stats and reused, so only open or partial shifts are
+# computed per request. A trigger drops cached shifts when an order inside
+# them changes.
+app.config['SHIFTS'] = os.environ.get('ERP_SHIFTS', 'A=06:00-14:00,B=14:00-22:00,C=22:00-06:00')
+
+def parse_shifts(spec):
+    """'A=06:00-14:00,B=14:00-22:00' -> [(name, start minute, end minute)]"""
+    shifts = []
+    for part in spec.split(','):
+        name, _, hours = part.strip().partition('=')
+        start, _, end = hours.partition('-')
+        minutes = [int(h) * 60 + int(m) for h, m in (t.split(':') for t in (start, end))]
+        shifts.append((name.strip(), minutes[0], minutes[1]))
+    return shifts
+
+SHIFTS = parse_shifts(app.config['SHIFTS'])
+
+OEE_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+OEE_GROUPS = ('machine', 'mold', 'shift')
+
+OEE_CACHE_TABLES = '''
+    CREATE TABLE IF NOT EXISTS oee_periods (
+        period_start TEXT PRIMARY KEY,
+        period_end TEXT NOT NULL,
+        shift TEXT NOT NULL,
+        computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS oee_period_stats (
+        period_start TEXT NOT NULL,
+        machine_id INTEGER,
+        mold_id INTEGER NOT NULL,
+        run_seconds REAL NOT NULL,
+        ideal_seconds REAL NOT NULL,
+        total_count REAL NOT NULL,
+        good_count REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_oee_period_stats_period ON oee_period_stats(period_start);
+    CREATE TRIGGER IF NOT EXISTS trg_oee_invalidate
+    AFTER UPDATE OF actual_start_date, actual_end_date, produced_quantity, scrap_quantity,
+                    quality_status, machine_id, mold_id ON production_orders
+    WHEN COALESCE(OLD.actual_start_date, NEW.actual_start_date) IS NOT NULL BEGIN
+        DELETE FROM oee_period_stats WHERE period_start IN (
+            SELECT period_start FROM oee_periods
+            WHERE period_end > MIN(COALESCE(OLD.actual_start_date, NEW.actual_start_date),
+                                   COALESCE(NEW.actual_start_date, OLD.actual_start_date))
+              AND period_start < MAX(COALESCE(OLD.actual_end_date, '9999'), COALESCE(NEW.actual_end_date, '9999')));
+        DELETE FROM oee_periods
+        WHERE period_end > MIN(COALESCE(OLD.actual_start_date, NEW.actual_start_date),
+                               COALESCE(NEW.actual_start_date, OLD.actual_start_date))
+          AND period_start < MAX(COALESCE(OLD.actual_end_date, '9999'), COALESCE(NEW.actual_end_date, '9999'));
+    END;
+'''
+
+def create_oee_cache(db):
+    db.executescript(OEE_CACHE_TABLES)
+
+# Run time, prorated counts and ideal time of every order overlapping each
+# interval, per (interval, machine, mold). Counts are spread evenly over an
+# order's run; ideal time per piece is the mold cycle over its cavities,
+# falling back to the product's pieces_per_hour.
+OEE_COMPONENTS_QUERY = '''
+    WITH iv AS (
+        SELECT json_extract(value, '$[0]') AS idx,
+               julianday(json_extract(value, '$[1]')) AS s,
+               julianday(json_extract(value, '$[2]')) AS e
+        FROM json_each(:intervals)
+    ),
+    o AS (
+        SELECT po.machine_id, po.mold_id,
+               julianday(po.actual_start_date) AS js,
+               julianday(COALESCE(po.actual_end_date, :now)) AS je,
+               po.produced_quantity + po.scrap_quantity AS total,
+               CASE WHEN po.quality_status = 'failed' THEN 0 ELSE po.produced_quantity END AS good,
+               COALESCE(m.cycle_time * 1.0 / NULLIF(m.cavity_count, 0),
+                        3600.0 / NULLIF(p.pieces_per_hour, 0)) AS ideal
+        FROM production_orders po
+        JOIN molds m ON po.mold_id = m.id
+        JOIN products p ON po.product_id = p.id
+        WHERE po.actual_start_date IS NOT NULL
+          AND po.actual_start_date < :end
+          AND COALESCE(po.actual_end_date, :now) > :start
+    ),
+    overlap AS (
+        SELECT iv.idx, o.machine_id, o.mold_id, o.total, o.good, o.ideal,
+               MIN(o.je, iv.e) - MAX(o.js, iv.s) AS days,
+               (MIN(o.je, iv.e) - MAX(o.js, iv.s)) / NULLIF(o.je - o.js, 0) AS share
+        FROM iv JOIN o ON o.js < iv.e AND o.je > iv.s
+    )
+    SELECT idx, machine_id, mold_id,
+           SUM(days) * 86400 AS run_seconds,
+           SUM(COALESCE(ideal, 0) * total * COALESCE(share, 0)) AS ideal_seconds,
+           SUM(total * COALESCE(share, 0)) AS total_count,
+           SUM(good * COALESCE(share, 0)) AS good_count
+    FROM overlap
+    GROUP BY idx, machine_id, mold_id
+'''
+
+def shift_intervals(start, end, now=None):
+    """[(shift label, interval start, interval end, cacheable)] covering [start, end)"""
+    now = now or datetime.now()
+    intervals = []
+    day = datetime.combine(start.date(), datetime.min.time()) - timedelta(days=1)
+    while day < end:
+        for name, first, last in SHIFTS:
+            shift_start = day + timedelta(minutes=first)
+            shift_end = day + timedelta(minutes=last if last > first else last + 1440)
+            s, e = max(shift_start, start), min(shift_end, end)
+            if s < e:
+                full = s == shift_start and e == shift_end
+                intervals.append((f'{shift_start:%Y-%m-%d} {name}', s, e, full and shift_end <= now))
+        day += timedelta(days=1)
+    return intervals
+
+def oee_components(db, start, end, now=None):
+    """Per-interval component rows for [start, end), served from the closed-shift cache where possible.
+
+    Returns (intervals, rows, stats); rows are dicts keyed by interval index.
+    """
+    now = now or datetime.now()
+    intervals = shift_intervals(start, end, now)
+    cacheable = {iv[1].strftime(OEE_TIME_FORMAT): i for i, iv in enumerate(intervals) if iv[3]}
+    cached = {row['period_start'] for row in db.execute(
+        'SELECT period_start FROM oee_periods WHERE period_start IN (SELECT value FROM json_each(?))',
+        (json.dumps(list(cacheable)),))}
+    rows = [dict(row, idx=cacheable[row['period_start']]) for row in db.execute('''
+        SELECT period_start, machine_id, mold_id, run_seconds, ideal_seconds, total_count, good_count
+        FROM oee_period_stats WHERE period_start IN (SELECT value FROM json_each(?))
+    ''', (json.dumps(sorted(cached)),))]
+    
+    missing = [i for i, iv in enumerate(intervals) if iv[1].strftime(OEE_TIME_FORMAT) not in cached or not iv[3]]
+    if missing:
+        params = {
+            'intervals': json.dumps([[i, intervals[i][1].strftime(OEE_TIME_FORMAT),
+                                      intervals[i][2].strftime(OEE_TIME_FORMAT)] for i in missing]),
+            'start': min(intervals[i][1] for i in missing).strftime(OEE_TIME_FORMAT),
+            'end': max(intervals[i][2] for i in missing).strftime(OEE_TIME_FORMAT),
+            'now': now.strftime(OEE_TIME_FORMAT),
+        }
+        computed = [dict(row) for row in db.execute(OEE_COMPONENTS_QUERY, params)]
+        rows.extend(computed)
+        closed = [i for i in missing if intervals[i][3]]
+        if closed:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.executemany('INSERT OR IGNORE INTO oee_periods (period_start, period_end, shift) VALUES (?, ?, ?)',
+                               [(intervals[i][1].strftime(OEE_TIME_FORMAT), intervals[i][2].strftime(OEE_TIME_FORMAT),
+                                 intervals[i][0]) for i in closed])
+                db.executemany('''
+                    INSERT INTO oee_period_stats (period_start, machine_id, mold_id, run_seconds,
+                                                  ideal_seconds, total_count, good_count)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', [(intervals[row['idx']][1].strftime(OEE_TIME_FORMAT), row['machine_id'], row['mold_id'],
+                       row['run_seconds'], row['ideal_seconds'], row['total_count'], row['good_count'])
+                      for row in computed if intervals[row['idx']][3]])
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+    return intervals, rows, {'intervals': len(intervals), 'cached': len(intervals) - len(missing),
+                             'computed': len(missing)}
+
+def oee_ratios(planned, run, ideal, total, good):
+    availability = run / planned if planned else 0.0
+    performance = ideal / run if run else 0.0
+    quality = good / total if total else 0.0
+    return {
+        'planned_seconds': round(planned, 1),
+        'run_seconds': round(run, 1),
+        'total_count': round(total, 1),
+        'good_count': round(good, 1),
+        'availability': round(availability, 4),
+        'performance': round(performance, 4),
+        'quality': round(quality, 4),
+        'oee': round(availability * performance * quality, 4),
+    }
+
+def compute_oee(db, start, end, group='machine', now=None):
+    """OEE per machine, mold or shift over [start, end).
+
+    Planned time is the shift time in the window (per machine for machine
+    and mold groups, times the number of machines for shift groups).
+    """
+    if group not in OEE_GROUPS:
+        raise ValueError('group must be one of ' + ', '.join(OEE_GROUPS))
+    intervals, rows, stats = oee_components(db, start, end, now)
+    shift_seconds = sum((iv[2] - iv[1]).total_seconds() for iv in intervals)
+    
+    totals = {}
+    if group == 'machine':
+        labels = {row['id']: row['machine_code'] for row in db.execute('SELECT id, machine_code FROM machines ORDER BY machine_code')}
+        totals = {machine_id: [0.0, 0.0, 0.0, 0.0] for machine_id in labels}
+        planned = lambda key: shift_seconds
+    elif group == 'mold':
+        labels = {row['id']: row['mold_code'] for row in db.execute('SELECT id, mold_code FROM molds ORDER BY mold_code')}
+        planned = lambda key: shift_seconds
+    else:
+        labels = {i: iv[0] for i, iv in enumerate(intervals)}
+        totals = {i: [0.0, 0.0, 0.0, 0.0] for i in labels}
+        machine_count = db.execute('SELECT COUNT(*) FROM machines').fetchone()[0] or 1
+        planned = lambda key: (intervals[key][2] - intervals[key][1]).total_seconds() * machine_count
+    
+    key_of = {'machine': 'machine_id', 'mold': 'mold_id', 'shift': 'idx'}[group]
+    for row in rows:
+        acc = totals.setdefault(row[key_of], [0.0, 0.0, 0.0, 0.0])
+        acc[0] += row['run_seconds'] or 0
+        acc[1] += row['ideal_seconds'] or 0
+        acc[2] += row['total_count'] or 0
+        acc[3] += row['good_count'] or 0
+    
+    results = []
+    for key, (run, ideal, total, good) in totals.items():
+        result = {group: labels.get(key, '-'), 'id': key if group != 'shift' else None}
+        if group == 'shift':
+            result['start'] = intervals[key][1].strftime(OEE_TIME_FORMAT)
+            result['end'] = intervals[key][2].strftime(OEE_TIME_FORMAT)
+        result.update(oee_ratios(planned(key), run, ideal, total, good))
+        results.append(result)
+    if group == 'shift':
+        results.sort(key=lambda r: r['start'])
+    else:
+        results.sort(key=lambda r: str(r[group]))
+    return results, stats
+
+# MRP: nets open sales demand plus safety stock against stock, production in
+# progress and open purchase orders for the whole catalogue in one pass, and
+# turns finished-good shortfalls into raw material needs (piece_weight grams
+# per piece, by material_type). Triggers record in mrp_dirty which products'
+# inputs changed so later runs recompute only those.
+MRP_TABLES = '''
+    CREATE TABLE IF NOT EXISTS mrp_results (
+        product_id INTEGER PRIMARY KEY,
+        product_type TEXT,
+        material_type TEXT,
+        demand REAL NOT NULL DEFAULT 0,
+        on_hand REAL NOT NULL DEFAULT 0,
+        in_production REAL NOT NULL DEFAULT 0,
+        on_order REAL NOT NULL DEFAULT 0,
+        safety_stock REAL NOT NULL DEFAULT 0,
+        material_demand REAL NOT NULL DEFAULT 0,
+        net_requirement REAL NOT NULL DEFAULT 0,
+        action TEXT,
+        proposed_quantity REAL NOT NULL DEFAULT 0,
+        material_kg REAL NOT NULL DEFAULT 0,
+        computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_mrp_results_material ON mrp_results(material_type, product_type);
+    CREATE TABLE IF NOT EXISTS mrp_dirty (product_id INTEGER PRIMARY KEY);
+'''
+
+def _mrp_dirty_triggers():
+    # No OR IGNORE: an outer UPSERT's conflict policy would override it inside the
+    # trigger, so rows already marked are skipped explicitly
+    mark = ('INSERT INTO mrp_dirty (product_id) SELECT {0} '
+            'WHERE NOT EXISTS (SELECT 1 FROM mrp_dirty WHERE product_id = {0});')
+    mark_order = ('INSERT INTO mrp_dirty (product_id) SELECT DISTINCT product_id FROM {} WHERE {} = {} '
+                  'AND product_id NOT IN (SELECT product_id FROM mrp_dirty);')
+    triggers = {
+        ('products', 'INSERT'): mark.format('NEW.id'),
+        ('products', 'UPDATE OF quantity, reorder_level, piece_weight, material_type, product_type, '
+                     'mold_id, supplier_id, packaging_qty'): mark.format('NEW.id'),
+        ('products', 'DELETE'): mark.format('OLD.id'),
+        ('sales_order_items', 'INSERT'): mark.format('NEW.product_id'),
+        ('sales_order_items', 'UPDATE'): mark.format('OLD.product_id') + mark.format('NEW.product_id'),
+        ('sales_order_items', 'DELETE'): mark.format('OLD.product_id'),
+        ('sales_orders', 'UPDATE OF status'): mark_order.format('sales_order_items', 'order_id', 'NEW.id'),
+        ('sales_orders', 'DELETE'): mark_order.format('sales_order_items', 'order_id', 'OLD.id'),
+        ('production_orders', 'INSERT'): mark.format('NEW.product_id'),
+        ('production_orders', 'UPDATE OF product_id, status, planned_quantity, produced_quantity, quality_status'):
+            mark.format('OLD.product_id') + mark.format('NEW.product_id'),
+        ('production_orders', 'DELETE'): mark.format('OLD.product_id'),
+        ('purchase_order_items', 'INSERT'): mark.format('NEW.product_id'),
+        ('purchase_order_items', 'UPDATE'): mark.format('OLD.product_id') + mark.format('NEW.product_id'),
+        ('purchase_order_items', 'DELETE'): mark.format('OLD.product_id'),
+        ('purchase_orders', 'UPDATE OF status'): mark_order.format('purchase_order_items', 'po_id', 'NEW.id'),
+        ('purchase_orders', 'DELETE'): mark_order.format('purchase_order_items', 'po_id', 'OLD.id'),
+    }
+    sql = []
+    for n, ((table, event), body) in enumerate(triggers.items()):
+        sql.append(f'DROP TRIGGER IF EXISTS trg_mrp_dirty_{table}_{n};')
+        sql.append(f'CREATE TRIGGER trg_mrp_dirty_{table}_{n} AFTER {event} ON {table} '
+                   f'BEGIN {body} END;')
+    return '\n'.join(sql)
+
+def create_mrp_tables(db):
+    db.executescript(MRP_TABLES)
+    create_mrp_dirty_triggers(db)
+
+def create_mrp_dirty_triggers(db):
+    """(Re)create the mrp_dirty triggers; also replaces the OR IGNORE versions of migration 10"""
+    db.executescript(_mrp_dirty_triggers())
+
+# Inputs per product, each one grouped query; :ids is a JSON array or NULL for all
+MRP_INPUT_QUERIES = {
+    'demand': '''
+        SELECT soi.product_id, SUM(soi.quantity) FROM sales_order_items soi
+        JOIN sales_orders so ON soi.order_id = so.id
+        WHERE so.status = 'pending'
+          AND (:ids IS NULL OR soi.product_id IN (SELECT value FROM json_each(:ids)))
+        GROUP BY soi.product_id
+    ''',
+    # Remaining planned/running quantity, plus finished output waiting for inspection
+    'in_production': '''
+        SELECT product_id, SUM(CASE
+                   WHEN status IN ('planned', 'in_progress') THEN MAX(planned_quantity - produced_quantity, 0)
+                   WHEN status = 'completed' AND quality_status = 'pending' THEN produced_quantity
+                   ELSE 0 END)
+        FROM production_orders
+        WHERE (:ids IS NULL OR product_id IN (SELECT value FROM json_each(:ids)))
+        GROUP BY product_id
+    ''',
+    # Material for orders not yet started, in kg
+    'planned_material': '''
+        SELECT po.product_id, SUM(MAX(po.planned_quantity - po.produced_quantity, 0)) * COALESCE(p.piece_weight, 0) / 1000.0
+        FROM production_orders po JOIN products p ON po.product_id = p.id
+        WHERE po.status = 'planned'
+          AND (:ids IS NULL OR po.product_id IN (SELECT value FROM json_each(:ids)))
+        GROUP BY po.product_id
+    ''',
+    # Not yet received on open purchase orders
+    'on_order': '''
+        SELECT poi.product_id, SUM(MAX(poi.quantity - poi.received_quantity, 0)) FROM purchase_order_items poi
+        JOIN purchase_orders po ON poi.po_id = po.id
+        WHERE po.status NOT IN ('received', 'cancelled')
+          AND (:ids IS NULL OR poi.product_id IN (SELECT value FROM json_each(:ids)))
+        GROUP BY poi.product_id
+    ''',
+}
+
+MRP_RESULT_COLUMNS = ('product_id', 'product_type', 'material_type', 'demand', 'on_hand', 'in_production',
+                      'on_order', 'safety_stock', 'material_demand', 'net_requirement', 'action',
+                      'proposed_quantity', 'material_kg')
+
+def mrp_net(row):
+    """Net requirement and proposal for one result row (updated in place)"""
+    gross = row['demand'] + row['material_demand'] + row['safety_stock']
+    row['net_requirement'] = max(0, gross - row['on_hand'] - row['in_production'] - row['on_order'])
+    row['action'] = None
+    if row['net_requirement'] > 0:
+        row['action'] = 'produce' if row['product_type'] == 'finished_good' else 'purchase'
+    row['proposed_quantity'] = row['net_requirement']
+
+def run_mrp(db, full=False):
+    """Recompute MRP results for dirty products (or all of them) in one transaction.
+
+    Returns counters for the run.
+    """
+    started = time.perf_counter()
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        if not full and not db.execute('SELECT 1 FROM mrp_results LIMIT 1').fetchone():
+            full = True
+        if full:
+            ids = None
+        else:
+            dirty = [row[0] for row in db.execute('SELECT product_id FROM mrp_dirty')]
+            if not dirty:
+                db.rollback()
+                return {'full': False, 'products': 0, 'proposals': 0, 'elapsed_ms': 0.0}
+            # Raw materials whose finished goods changed must be netted again
+            materials = {row[0] for row in db.execute('''
+                SELECT material_type FROM products WHERE id IN (SELECT value FROM json_each(:ids))
+                UNION SELECT material_type FROM mrp_results WHERE product_id IN (SELECT value FROM json_each(:ids))
+            ''', {'ids': json.dumps(dirty)}) if row[0]}
+            dirty.extend(row[0] for row in db.execute('''
+                SELECT id FROM products
+                WHERE product_type = 'raw_material' AND material_type IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(sorted(materials)),)))
+            ids = json.dumps(sorted(set(dirty)))
+        
+        products = db.execute('''
+            SELECT id, product_type, material_type, piece_weight, quantity, reorder_level, packaging_qty
+            FROM products WHERE (:ids IS NULL OR id IN (SELECT value FROM json_each(:ids)))
+            ORDER BY id
+        ''', {'ids': ids}).fetchall()
+        inputs = {name: dict(db.execute(sql, {'ids': ids}).fetchall()) for name, sql in MRP_INPUT_QUERIES.items()}
+        
+        rows = {}
+        for p in products:
+            row = {
+                'product_id': p['id'],
+                'product_type': p['product_type'],
+                'material_type': p['material_type'] or None,
+                'demand': inputs['demand'].get(p['id'], 0),
+                'on_hand': p['quantity'] or 0,
+                'in_production': inputs['in_production'].get(p['id'], 0),
+                'on_order': inputs['on_order'].get(p['id'], 0),
+                'safety_stock': p['reorder_level'] or 0,
+                'material_demand': 0,
+                'material_kg': inputs['planned_material'].get(p['id'], 0),
+            }
+            mrp_net(row)
+            if row['action'] == 'produce':
+                if p['packaging_qty']:
+                    row['proposed_quantity'] = -(-row['net_requirement'] // p['packaging_qty']) * p['packaging_qty']
+                row['material_kg'] += row['proposed_quantity'] * (p['piece_weight'] or 0) / 1000.0
+            rows[p['id']] = row
+        
+        # Raw material demand: kg of every finished good using the material,
+        # charged to the first raw material product of that type
+        need = {}
+        for row in rows.values():
+            if row['product_type'] == 'finished_good' and row['material_type']:
+                need[row['material_type']] = need.get(row['material_type'], 0) + row['material_kg']
+        if ids is not None:
+            for material, kg in db.execute('''
+                SELECT material_type, SUM(material_kg) FROM mrp_results
+                WHERE product_type = 'finished_good' AND material_type IS NOT NULL
+                  AND product_id NOT IN (SELECT value FROM json_each(?))
+                GROUP BY material_type
+            ''', (ids,)):
+                need[material] = need.get(material, 0) + kg
+        for row in rows.values():
+            if row['product_type'] == 'raw_material' and need.get(row['material_type']):
+                row['material_demand'] = need.pop(row['material_type'])
+                mrp_net(row)
+        
+        if ids is None:
+            db.execute('DELETE FROM mrp_results')
+        else:
+            db.execute('DELETE FROM mrp_results WHERE product_id IN (SELECT value FROM json_each(?))', (ids,))
+        db.executemany(f'''
+            INSERT INTO mrp_results ({', '.join(MRP_RESULT_COLUMNS)})
+            VALUES ({', '.join(':' + c for c in MRP_RESULT_COLUMNS)})
+        ''', list(rows.values()))
+        db.execute('DELETE FROM mrp_dirty')
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {
+        'full': full,
+        'products': len(rows),
+        'proposals': sum(1 for row in rows.values() if row['action']),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+def mrp_material_summary(db):
+    """Raw material kg required per material type, with the stock and orders of matching raw materials"""
+    return db.execute('''
+        SELECT f.material_type, f.required_kg,
+               COALESCE(r.on_hand, 0) as on_hand, COALESCE(r.on_order, 0) as on_order,
+               MAX(f.required_kg - COALESCE(r.on_hand, 0) - COALESCE(r.on_order, 0), 0) as shortfall_kg
+        FROM (SELECT material_type, SUM(material_kg) as required_kg FROM mrp_results
+              WHERE product_type = 'finished_good' AND material_type IS NOT NULL AND material_type != ''
+              GROUP BY material_type) f
+        LEFT JOIN (SELECT material_type, SUM(on_hand) as on_hand, SUM(on_order) as on_order FROM mrp_results
+                   WHERE product_type = 'raw_material' GROUP BY material_type) r
+          ON r.material_type = f.material_type
+        WHERE f.required_kg > 0
+        ORDER BY f.material_type
+    ''').fetchall()
+
+# Purchasing: orders go pending -> approved -> partial -> received (or
+# cancelled). Goods receipts raise stock and book the expense together.
+PURCHASE_RECEIVABLE_STATUSES = ('approved', 'partial')
+
+def create_purchasing_tables(db):
+    db.execute('ALTER TABLE purchase_order_items ADD COLUMN received_quantity INTEGER NOT NULL DEFAULT 0')
+    db.execute('ALTER TABLE purchase_orders ADD COLUMN expected_date DATE')
+    db.execute('ALTER TABLE purchase_orders ADD COLUMN approved_by INTEGER REFERENCES users(id)')
+    db.execute('ALTER TABLE purchase_orders ADD COLUMN approved_at TIMESTAMP')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_purchase_order_items_po ON purchase_order_items(po_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_purchase_orders_status_date ON purchase_orders(status, order_date)')
+    prefix = DOCUMENT_SEQUENCES['purchase_order'] + '-'
+    db.execute('''
+        INSERT OR IGNORE INTO sequences (name, last_value)
+        SELECT 'purchase_order', COALESCE(MAX(CAST(substr(po_number, ?) AS INTEGER)), 0)
+        FROM purchase_orders WHERE po_number LIKE ?
+    ''', (len(prefix) + 1, prefix + '%'))
+
+# Stock ledger: triggers on products append a movement for every change of
+# quantity, whichever code path made it. Writers that know why stock moved
+# put the reason in stock_movement_source for the length of their transaction.
+# Snapshots store every product's balance up to a movement id, so stock at a
+# past time is the latest earlier snapshot plus the few movements after it.
+app.config['STOCK_SNAPSHOT_MOVEMENTS'] = int(os.environ.get('ERP_STOCK_SNAPSHOT_MOVEMENTS', 5000))
+
+STOCK_LEDGER_TABLES = '''
+    CREATE TABLE IF NOT EXISTS stock_movements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        balance INTEGER NOT NULL,
+        reason TEXT NOT NULL,
+        reference_type TEXT,
+        reference_id INTEGER,
+        created_by INTEGER,
+        moved_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_stock_movements_product ON stock_movements(product_id);
+    CREATE INDEX IF NOT EXISTS idx_stock_movements_moved_at ON stock_movements(moved_at);
+    CREATE TABLE IF NOT EXISTS stock_movement_source (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        reason TEXT NOT NULL,
+        reference_type TEXT,
+        reference_id INTEGER,
+        user_id INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS stock_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        last_movement_id INTEGER NOT NULL,
+        taken_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS stock_snapshot_balances (
+        snapshot_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        PRIMARY KEY (snapshot_id, product_id)
+    ) WITHOUT ROWID;
+'''
+
+def _stock_ledger_triggers():
+    insert = '''
+        INSERT INTO stock_movements (product_id, quantity, balance, reason, reference_type, reference_id, created_by)
+        SELECT {id}, {delta}, {balance}, COALESCE(s.reason, '{reason}'), s.reference_type, s.reference_id, s.user_id
+        FROM (SELECT 1) LEFT JOIN stock_movement_source s ON s.id = 1;'''
+    triggers = {
+        'INSERT': ('COALESCE(NEW.quantity, 0) != 0',
+                   insert.format(id='NEW.id', delta='NEW.quantity', balance='NEW.quantity', reason='opening')),
+        'UPDATE OF quantity': ('COALESCE(NEW.quantity, 0) != COALESCE(OLD.quantity, 0)',
+                               insert.format(id='NEW.id', delta='COALESCE(NEW.quantity, 0) - COALESCE(OLD.quantity, 0)',
+                                             balance='COALESCE(NEW.quantity, 0)', reason='adjustment')),
+        'DELETE': ('COALESCE(OLD.quantity, 0) != 0',
+                   insert.format(id='OLD.id', delta='-OLD.quantity', balance='0', reason='deleted')),
+    }
+    return ''.join(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_stock_ledger_{event.split()[0].lower()} AFTER {event} ON products
+        WHEN {condition}
+        BEGIN{body}
+        END;''' for event, (condition, body) in triggers.items())
+
+def create_stock_ledger(db):
+    db.executescript(STOCK_LEDGER_TABLES + _stock_ledger_triggers())
+    # History starts from the stock on hand when the ledger is installed
+    db.execute('''
+        INSERT INTO stock_movements (product_id, quantity, balance, reason)
+        SELECT id, quantity, quantity, 'opening' FROM products WHERE COALESCE(quantity, 0) != 0
+    ''')
+
+def set_stock_source(db, reason, reference_type=None, reference_id=None, user_id=None):
+    """Label the stock movements written by the rest of this transaction.
+
+    Call clear_stock_source() before committing.
+    """
+    db.execute('''
+        INSERT OR REPLACE INTO stock_movement_source (id, reason, reference_type, reference_id, user_id)
+        VALUES (1, ?, ?, ?, ?)
+    ''', (reason, reference_type, reference_id, user_id))
+
+def clear_stock_source(db):
+    db.execute('DELETE FROM stock_movement_source')
+
+def parse_stock_time(value):
+    """Ledger timestamp for an as-of date or date-time; a bare date means the end of that day"""
+    if len(value) == 10:
+        moment = datetime.fromisoformat(value) + timedelta(days=1) - timedelta(seconds=1)
+    else:
+        moment = datetime.fromisoformat(value)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def take_stock_snapshot(db):
+    """Store every product's balance up to the latest movement; returns the snapshot id (None if unchanged).
+
+    Balances are the previous snapshot plus the movements after it, so a
+    snapshot never replays the whole ledger.
+    """
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        last = db.execute('SELECT COALESCE(MAX(id), 0) FROM stock_movements').fetchone()[0]
+        previous = db.execute('SELECT id, last_movement_id FROM stock_snapshots ORDER BY id DESC LIMIT 1').fetchone()
+        if previous is not None and previous['last_movement_id'] == last:
+            db.rollback()
+            return None
+        snapshot_id = db.execute('INSERT INTO stock_snapshots (last_movement_id) VALUES (?)', (last,)).lastrowid
+        db.execute('''
+            INSERT INTO stock_snapshot_balances (snapshot_id, product_id, quantity)
+            SELECT :snapshot, product_id, SUM(quantity) FROM (
+                SELECT product_id, quantity FROM stock_snapshot_balances WHERE snapshot_id = :previous
+                UNION ALL
+                SELECT product_id, quantity FROM stock_movements WHERE id > :after AND id <= :last
+            )
+            GROUP BY product_id
+            HAVING SUM(quantity) != 0
+        ''', {'snapshot': snapshot_id, 'previous': previous['id'] if previous else None,
+              'after': previous['last_movement_id'] if previous else 0, 'last': last})
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return snapshot_id
+
+def stock_balances(db, as_of=None, product_ids=None):
+    """On-hand quantity per product at a ledger timestamp (now if None).
+
+    Returns ({product_id: quantity}, movements scanned); products with no
+    stock are left out.
+    """
+    as_of = as_of or '9999-12-31 23:59:59'
+    snapshot = db.execute('''
+        SELECT id, last_movement_id FROM stock_snapshots WHERE taken_at <= ?
+        ORDER BY id DESC LIMIT 1
+    ''', (as_of,)).fetchone()
+    # Movement ids follow time, so the delta is the id range up to the first later movement
+    later = db.execute('SELECT id FROM stock_movements WHERE moved_at > ? ORDER BY moved_at, id LIMIT 1',
+                       (as_of,)).fetchone()
+    params = {
+        'snapshot': snapshot['id'] if snapshot else None,
+        'after': snapshot['last_movement_id'] if snapshot else 0,
+        'before': later[0] if later else None,
+        'ids': json.dumps(product_ids) if product_ids is not None else None,
+    }
+    product_filter = 'AND (:ids IS NULL OR product_id IN (SELECT value FROM json_each(:ids)))'
+    balances = {row[0]: row[1] for row in db.execute(f'''
+        SELECT product_id, quantity FROM stock_snapshot_balances
+        WHERE snapshot_id = :snapshot {product_filter}
+    ''', params)}
+    scanned = 0
+    for product_id, quantity, count in db.execute(f'''
+        SELECT product_id, SUM(quantity), COUNT(*) FROM stock_movements
+        WHERE id > :after AND (:before IS NULL OR id < :before) {product_filter}
+        GROUP BY product_id
+    ''', params):
+        balances[product_id] = balances.get(product_id, 0) + quantity
+        scanned += count
+    return {product_id: quantity for product_id, quantity in balances.items() if quantity}, scanned
+
+def maybe_take_stock_snapshot(db):
+    """Snapshot once ERP_STOCK_SNAPSHOT_MOVEMENTS movements have built up since the last one"""
+    pending = db.execute('''
+        SELECT COUNT(*) FROM stock_movements
+        WHERE id > (SELECT COALESCE(MAX(last_movement_id), 0) FROM stock_snapshots)
+    ''').fetchone()[0]
+    if pending >= app.config['STOCK_SNAPSHOT_MOVEMENTS']:
+        return take_stock_snapshot(db)
+    return None
+
+def reconcile_stock(db, fix=False, user_id=None):
+    """Compare the ledger balance of every product with products.quantity.
+
+    Returns the differences; with fix=True a 'reconciliation' movement is
+    written for each so the ledger matches the live column again.
+    """
+    ledger, _ = stock_balances(db)
+    live = {row[0]: row[1] or 0 for row in db.execute('SELECT id, quantity FROM products')}
+    differences = [
+        {'product_id': product_id, 'quantity': live.get(product_id, 0), 'ledger': ledger.get(product_id, 0),
+         'difference': live.get(product_id, 0) - ledger.get(product_id, 0)}
+        for product_id in sorted(set(live) | set(ledger))
+        if live.get(product_id, 0) != ledger.get(product_id, 0)
+    ]
+    if fix and differences:
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany('''
+                INSERT INTO stock_movements (product_id, quantity, balance, reason, created_by)
+                VALUES (?, ?, ?, 'reconciliation', ?)
+            ''', [(row['product_id'], row['difference'], row['quantity'], user_id) for row in differences])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    return differences
+
+@app.cli.command('stock-snapshot')
+def stock_snapshot_command():
+    """Store current stock balances so past stock queries start from here."""
+    snapshot_id = take_stock_snapshot(get_db())
+    click.echo(f'Snapshot {snapshot_id} stored.' if snapshot_id else 'No movements since the last snapshot.')
+
+@app.cli.command('reconcile-stock')
+@click.option('--fix', is_flag=True, help='Post reconciliation movements for the differences.')
+def reconcile_stock_command(fix):
+    """Compare the stock ledger with on-hand quantities."""
+    differences = reconcile_stock(get_db(), fix=fix)
+    for row in differences:
+        click.echo(f"product {row['product_id']}: on hand {row['quantity']}, ledger {row['ledger']}")
+    click.echo(f'{len(differences)} difference(s){" fixed" if fix and differences else ""}.')
+    if differences and not fix:
+        raise SystemExit(1)
+
+# Server-side sessions: the cookie carries only a random session id; the data
+# lives in a store (the sessions table, shared by every worker, or process
+# memory). Deleting a user's rows signs them out everywhere.
+app.config['SESSION_STORE'] = os.environ.get('ERP_SESSION_STORE', 'sqlite')
+# Sessions unused for this long expire; active ones are extended in the background
+app.config['SESSION_IDLE_TIMEOUT'] = int(os.environ.get('ERP_SESSION_IDLE_TIMEOUT', 8 * 3600))
+
+def create_session_table(db):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)')
+
+class SQLiteSessionStore:
+    """Sessions in the sessions table, read and written on the request's connection"""
+
+    def __init__(self):
+        self._last_purge = 0
+
+    def load(self, sid):
+        row = get_db().execute('SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at > ?',
+                               (sid, time.time())).fetchone()
+        return (json.loads(row['data']), row['expires_at']) if row else (None, None)
+
+    def _write(self, sql, params=()):
+        # Sessions are saved after the view has finished, so reuse the request's
+        # connection rather than holding a second one. Anything the view left
+        # uncommitted is rolled back first, as releasing the connection would do.
+        request_db = g.get('db') if has_app_context() else None
+        if request_db is not None:
+            pool, db = None, request_db
+            if db.in_transaction:
+                db.rollback()
+        else:
+            pool = get_pool()
+            db = pool.acquire()
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            count = db.execute(sql, params).rowcount
+            if time.monotonic() - self._last_purge > 60:
+                self._last_purge = time.monotonic()
+                db.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if pool is not None:
+                pool.release(db)
+        return count
+
+    def save(self, sid, data, expires_at):
+        self._write('INSERT OR REPLACE INTO sessions (id, user_id, data, expires_at) VALUES (?, ?, ?, ?)',
+                    (sid, data.get('user_id'), json.dumps(data), expires_at))
+
+    def delete(self, sid):
+        self._write('DELETE FROM sessions WHERE id = ?', (sid,))
+
+    def revoke(self, user_id=None):
+        """Delete every session of one user, or of everyone; returns the number deleted"""
+        if user_id is None:
+            return self._write('DELETE FROM sessions')
+        return self._write('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+
+class MemorySessionStore:
+    """Sessions in this process's memory: fast, but lost on restart and not
+    shared between workers, so only suitable for a single process"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_purge = 0
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._sessions.get(sid)
+        if entry is None or entry[1] <= time.time():
+            return None, None
+        return json.loads(entry[0]), entry[1]
+
+    def save(self, sid, data, expires_at):
+        now = time.time()
+        with self._lock:
+            self._sessions[sid] = (json.dumps(data), expires_at, data.get('user_id'))
+            if time.monotonic() - self._last_purge > 60:
+                self._last_purge = time.monotonic()
+                self._sessions = {key: entry for key, entry in self._sessions.items() if entry[1] > now}
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def revoke(self, user_id=None):
+        with self._lock:
+            before = len(self._sessions)
+            if user_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions = {key: entry for key, entry in self._sessions.items() if entry[2] != user_id}
+            return before - len(self._sessions)
+
+SESSION_STORES = {'sqlite': SQLiteSessionStore, 'memory': MemorySessionStore}
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, data=None, sid=None, expires_at=None):
+        super().__init__(data, lambda session: setattr(session, 'modified', True))
+        self.sid = sid
+        self.expires_at = expires_at
+        self.stale_sid = None
+        self.modified = False
+
+    def rotate(self):
+        """Move the data to a new id, e.g. at login, so an id known before login is useless after it"""
+        if self.sid:
+            self.stale_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        # Static files never read the session
+        if request.path.startswith(app.static_url_path + '/'):
+            return ServerSideSession()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data, expires_at = self.store.load(sid)
+            if data is not None:
+                return ServerSideSession(data, sid, expires_at)
+        return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.stale_sid:
+            self.store.delete(session.stale_sid)
+        if not session:
+            if session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        timeout = app.config['SESSION_IDLE_TIMEOUT']
+        now = time.time()
+        # Unchanged sessions are only rewritten once half their idle time has passed
+        if not session.modified and session.expires_at and session.expires_at - now > timeout / 2:
+            return
+        new = session.sid is None
+        if new:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.save(session.sid, dict(session), now + timeout)
+        if new or session.permanent:
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+if app.config['SESSION_STORE'] in SESSION_STORES:
+    app.session_interface = ServerSideSessionInterface(SESSION_STORES[app.config['SESSION_STORE']]())
+
+def revoke_sessions(user_id=None):
+    """Sign out one user (or everyone) on every device; returns the number of sessions ended"""
+    user_cache.invalidate(user_id)
+    if not isinstance(app.session_interface, ServerSideSessionInterface):
+        raise RuntimeError('sessions are stored in cookies (ERP_SESSION_STORE=cookie) and cannot be revoked')
+    return app.session_interface.store.revoke(user_id)
+
+@app.cli.command('revoke-sessions')
+@click.argument('username', required=False)
+@click.option('--all', 'everyone', is_flag=True, help='Sign out every user.')
+def revoke_sessions_command(username, everyone):
+    """Sign a user (or everyone, with --all) out of all sessions."""
+    if not username and not everyone:
+        raise click.UsageError('give a USERNAME or --all')
+    user_id = None
+    if username:
+        user = get_db().execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
+        if user is None:
+            raise click.ClickException(f'No user named {username}')
+        user_id = user['id']
+    click.echo(f'{revoke_sessions(user_id)} session(s) ended.')
+
+# Signed-in users: user records are cached per process, so authenticated
+# requests need no users query. Entries expire after USER_CACHE_TTL seconds,
+# which bounds how long another worker's change to a user can go unseen here.
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('ERP_USER_CACHE_SIZE', 1000))
+app.config['USER_CACHE_TTL'] = float(os.environ.get('ERP_USER_CACHE_TTL', 60))
+
+class UserCache:
+    """LRU cache of user records (without password hashes), keyed by user id"""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, user_id, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._users.move_to_end(user_id)
+                self.stats['hits'] += 1
+                return entry[1]
+            self.stats['misses'] += 1
+        user = load(user_id)
+        if user is not None:
+            with self._lock:
+                self._users[user_id] = (now + self.ttl, user)
+                self._users.move_to_end(user_id)
+                while len(self._users) > self.size:
+                    self._users.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id=None):
+        """Forget one user, or everyone; call after updating users"""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+            self.stats['invalidations'] += 1
+
+user_cache = UserCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+def load_user(user_id):
+    row = get_db().execute('SELECT id, username, full_name, role, email, language FROM users WHERE id = ?',
+                           (user_id,)).fetchone()
+    return dict(row) if row else None
+
+def current_user():
+    """The signed-in user's record, or None"""
+    if 'user' not in g:
+        user_id = session.get('user_id')
+        g.user = user_cache.get(user_id, load_user) if user_id is not None else None
+    return g.user
+
+@app.context_processor
+def inject_user():
+    return {'current_user': current_user()}
+
+# Schema migrations: (version, description, statements), applied in order at startup.
+# Never edit a migration that has shipped; append a new one instead.
+MIGRATIONS = [
+    (1, 'indexes for dashboard, reports and production queries', [
+        'CREATE INDEX IF NOT EXISTS idx_sales_order_items_product ON sales_order_items(product_id)',
+        'CREATE INDEX IF NOT EXISTS idx_sales_order_items_order ON sales_order_items(order_id)',
+        'CREATE INDEX IF NOT EXISTS idx_sales_orders_customer ON sales_orders(customer_id)',
+        'CREATE INDEX IF NOT EXISTS idx_sales_orders_status_date ON sales_orders(status, order_date, total_amount)',
+        'CREATE INDEX IF NOT EXISTS idx_sales_orders_order_date ON sales_orders(order_date)',
+        'CREATE INDEX IF NOT EXISTS idx_production_orders_created_at ON production_orders(created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_production_orders_status ON production_orders(status)',
+        'CREATE INDEX IF NOT EXISTS idx_production_orders_mold ON production_orders(mold_id)',
+        # Low-stock filters are written as "quantity - reorder_level <= 0" to use this index
+        'CREATE INDEX IF NOT EXISTS idx_products_stock_gap ON products((quantity - reorder_level))',
+    ]),
+    (2, 'report rollup tables and triggers', [create_report_rollups]),
+    (3, 'sort indexes for paginated list pages', [
+        'CREATE INDEX IF NOT EXISTS idx_products_name ON products(name)',
+        'CREATE INDEX IF NOT EXISTS idx_customers_name ON customers(name)',
+        'CREATE INDEX IF NOT EXISTS idx_suppliers_name ON suppliers(name)',
+        'DROP INDEX IF EXISTS idx_production_orders_status',
+        'CREATE INDEX IF NOT EXISTS idx_production_orders_status_created ON production_orders(status, created_at)',
+    ]),
+    (4, 'full-text search index', [create_search_index]),
+    (5, 'document number sequences', [seed_sequences]),
+    (6, 'per-table change counters', [create_change_counters]),
+    (7, 'live event log', [create_event_log]),
+    (8, 'machine telemetry', [create_telemetry_tables]),
+    (9, 'OEE closed-shift cache', [create_oee_cache]),
+    (10, 'MRP results and change tracking', [create_mrp_tables]),
+    (11, 'purchase order receiving', [create_purchasing_tables]),
+    (12, 'stock movement ledger and snapshots', [create_stock_ledger]),
+    (13, 'server-side sessions', [create_session_table]),
+    (14, 'MRP change triggers safe under product upserts', [create_mrp_dirty_triggers]),
+    (15, 'product rollups follow order date changes', [ROLLUP_ORDER_DATE_TRIGGER, rebuild_rollups]),
+]
+
+def get_schema_version(db):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return db.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def run_migrations(db):
+    """Apply every migration newer than the recorded schema version"""
+    current = get_schema_version(db)
+    db.commit()
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            # Another process may have migrated while we waited for the lock
+            if get_schema_version(db) >= version:
+                db.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(db)
+                else:
+                    db.execute(step)
+            db.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                       (version, description))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+# Hot read queries that must be answered from an index.
+# Whole-table aggregates and reads of the small report rollup tables are not listed.
+HOT_QUERIES = {
+    'dashboard.low_stock': 'SELECT COUNT(*) FROM products WHERE quantity - reorder_level <= 0',
+    'dashboard.pending_orders': "SELECT COUNT(*) FROM sales_orders WHERE status = 'pending'",
+    'dashboard.total_sales': "SELECT COALESCE(SUM(total_amount), 0) FROM sales_orders WHERE status = 'completed'",
+    'dashboard.recent_orders': '''
+        SELECT so.*, c.name as customer_name
+        FROM sales_orders so JOIN customers c ON so.customer_id = c.id
+        ORDER BY so.order_date DESC LIMIT 5
+    ''',
+    'reports.low_stock_items': 'SELECT * FROM products WHERE quantity - reorder_level <= 0',
+    'production.orders': '''
+        SELECT po.*, p.name as product_name, p.sku, m.mold_code, mc.machine_code
+        FROM production_orders po
+        JOIN products p ON po.product_id = p.id
+        JOIN molds m ON po.mold_id = m.id
+        LEFT JOIN machines mc ON po.machine_id = mc.id
+        ORDER BY po.created_at DESC
+    ''',
+    'production.by_status': "SELECT id FROM production_orders WHERE status = 'in_progress'",
+    'production.by_mold': 'SELECT id FROM production_orders WHERE mold_id = 1',
+    'sales.items_by_product': 'SELECT order_id FROM sales_order_items WHERE product_id = 1',
+    'stock.movements_by_product': 'SELECT id FROM stock_movements WHERE product_id = 1 AND id > 0',
+}
+
+def check_query_plans(db, queries=None):
+    """Return {query name: plan lines} for hot queries that scan a table without an index"""
+    failures = {}
+    for name, sql in (queries or HOT_QUERIES).items():
+        plan = [row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + sql)]
+        if any(line.startswith('SCAN ') and ' USING ' not in line for line in plan):
+            failures[name] = plan
+    return failures
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if any hot query still needs a full table scan."""
+    db = get_db()
+    failures = check_query_plans(db)
+    for name, plan in failures.items():
+        print(f'{name}: ' + ' | '.join(plan))
+    if failures:
+        raise SystemExit(1)
+    print(f'{len(HOT_QUERIES)} hot queries use indexes')
+
+# In-process caches
+class TTLCache:
+    """Small thread-safe cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get_or_compute(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self.stats['hits'] += 1
+                return entry[1]
+            self.stats['misses'] += 1
+            generation = self._generation
+        value = compute()
+        with self._lock:
+            # Skip storing if a write invalidated the cache while we computed
+            if generation == self._generation:
+                self._data[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self._generation += 1
+            self.stats['invalidations'] += 1
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+app.config['DASHBOARD_CACHE_TTL'] = float(os.environ.get('ERP_DASHBOARD_CACHE_TTL', 30))
+dashboard_cache = TTLCache(app.config['DASHBOARD_CACHE_TTL'])
+
+DASHBOARD_STATS_QUERY = '''
+    SELECT
+        (SELECT COUNT(*) FROM products) as total_products,
+        (SELECT COUNT(*) FROM products WHERE quantity - reorder_level <= 0) as low_stock,
+        (SELECT COUNT(*) FROM customers) as total_customers,
+        (SELECT COUNT(*) FROM sales_orders WHERE status = 'pending') as pending_orders,
+        (SELECT COALESCE(SUM(total_amount), 0) FROM sales_orders WHERE status = 'completed') as total_sales
+'''
+
+def load_dashboard_stats():
+    db = get_db()
+    stats = dict(db.execute(DASHBOARD_STATS_QUERY).fetchone())
+    stats['recent_orders'] = [dict(row) for row in db.execute('''
+        SELECT so.*, c.name as customer_name 
+        FROM sales_orders so 
+        JOIN customers c ON so.customer_id = c.id 
+        ORDER BY so.order_date DESC LIMIT 5
+    ''')]
+    return stats
+
+def invalidate_dashboard():
+    """Call after committing a write that changes dashboard figures"""
+    dashboard_cache.invalidate()
+
+# List pages: keyset pagination with server-side sort and filter.
+# "sort" maps the ?sort= value to an SQL expression; rows are ordered by
+# (sort expression, id) so a page boundary is a seek, never an OFFSET.
+LIST_VIEWS = {
+    'products': {
+        'select': '''
+            SELECT p.*, s.name as supplier_name, m.mold_code
+            FROM products p
+            LEFT JOIN suppliers s ON p.supplier_id = s.id
+            LEFT JOIN molds m ON p.mold_id = m.id
+        ''',
+        'from': 'products p',
+        'id': 'p.id',
+        'sort': {'name': 'p.name', 'sku': 'p.sku', 'quantity': 'p.quantity', 'unit_price': 'p.unit_price'},
+        'default_sort': ('name', 'asc'),
+        'search': ['p.name', 'p.sku', 'p.category', 'p.material_type', 'p.color'],
+        'filters': {'category': 'p.category = ?', 'low_stock': 'p.quantity - p.reorder_level <= 0'},
+    },
+    'customers': {
+        'select': 'SELECT * FROM customers',
+        'from': 'customers',
+        'id': 'id',
+        'sort': {'name': 'name', 'company': "COALESCE(company, '')", 'created_at': 'created_at'},
+        'default_sort': ('name', 'asc'),
+        'search': ['name', 'company', 'email', 'phone'],
+        'filters': {},
+    },
+    'suppliers': {
+        'select': 'SELECT * FROM suppliers',
+        'from': 'suppliers',
+        'id': 'id',
+        'sort': {'name': 'name', 'created_at': 'created_at'},
+        'default_sort': ('name', 'asc'),
+        'search': ['name', 'contact_person', 'email', 'phone'],
+        'filters': {},
+    },
+    'molds': {
+        'select': 'SELECT * FROM molds',
+        'from': 'molds',
+        'id': 'id',
+        'sort': {'mold_code': 'mold_code', 'mold_name': 'mold_name', 'total_shots': 'total_shots'},
+        'default_sort': ('mold_code', 'asc'),
+        'search': ['mold_code', 'mold_name', 'compatible_materials', 'location'],
+        'filters': {'status': 'status = ?'},
+    },
+    'machines': {
+        'select': 'SELECT * FROM machines',
+        'from': 'machines',
+        'id': 'id',
+        'sort': {'machine_code': 'machine_code', 'machine_name': 'machine_name', 'tonnage': 'COALESCE(tonnage, 0)'},
+        'default_sort': ('machine_code', 'asc'),
+        'search': ['machine_code', 'machine_name', 'brand', 'model', 'section'],
+        'filters': {'status': 'status = ?'},
+    },
+    'production': {
+        'select': '''
+            SELECT po.*, p.name as product_name, p.sku, m.mold_code, mc.machine_code
+            FROM production_orders po
+            JOIN products p ON po.product_id = p.id
+            JOIN molds m ON po.mold_id = m.id
+            LEFT JOIN machines mc ON po.machine_id = mc.id
+        ''',
+        'from': 'production_orders po',
+        'id': 'po.id',
+        'sort': {'created_at': 'po.created_at', 'order_number': 'po.order_number',
+                 'planned_start': "COALESCE(po.planned_start_date, '')"},
+        'default_sort': ('created_at', 'desc'),
+        'search': ['po.order_number', 'po.operator_name', 'po.notes'],
+        'filters': {'status': 'po.status = ?', 'quality_status': 'po.quality_status = ?', 'mold_id': 'po.mold_id = ?'},
+    },
+    'sales': {
+        'select': '''
+            SELECT so.*, c.name as customer_name 
+            FROM sales_orders so 
+            JOIN customers c ON so.customer_id = c.id
+        ''',
+        'from': 'sales_orders so',
+        'id': 'so.id',
+        'sort': {'order_date': 'so.order_date', 'order_number': 'so.order_number', 'total_amount': 'so.total_amount'},
+        'default_sort': ('order_date', 'desc'),
+        'search': ['so.order_number', 'so.notes'],
+        'filters': {'status': 'so.status = ?', 'customer_id': 'so.customer_id = ?'},
+    },
+    'purchases': {
+        'select': '''
+            SELECT po.*, s.name as supplier_name
+            FROM purchase_orders po
+            JOIN suppliers s ON po.supplier_id = s.id
+        ''',
+        'from': 'purchase_orders po',
+        'id': 'po.id',
+        'sort': {'order_date': 'po.order_date', 'po_number': 'po.po_number', 'total_amount': 'po.total_amount',
+                 'expected_date': "COALESCE(po.expected_date, '')"},
+        'default_sort': ('order_date', 'desc'),
+        'search': ['po.po_number', 'po.notes'],
+        'filters': {'status': 'po.status = ?', 'supplier_id': 'po.supplier_id = ?'},
+    },
+}
+
+app.config['LIST_PAGE_SIZE'] = int(os.environ.get('ERP_LIST_PAGE_SIZE', 50))
+app.config['LIST_MAX_PAGE_SIZE'] = int(os.environ.get('ERP_LIST_MAX_PAGE_SIZE', 200))
+app.config['LIST_COUNT_TTL'] = float(os.environ.get('ERP_LIST_COUNT_TTL', 15))
+list_count_cache = TTLCache(app.config['LIST_COUNT_TTL'])
+
+def encode_cursor(sort_value, row_id):
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+def list_filters(view, args):
+    """Translate request args into WHERE clauses and parameters for a list view"""
+    where, params = [], []
+    q = (args.get('q') or '').strip()
+    if q:
+        where.append('(' + ' OR '.join(f'{col} LIKE ?' for col in view['search']) + ')')
+        params.extend([f'%{q}%'] * len(view['search']))
+    for name, clause in view['filters'].items():
+        value = args.get(name)
+        if not value:
+            continue
+        if '?' in clause:
+            where.append(clause)
+            params.append(value)
+        elif value in ('1', 'true', 'yes'):
+            where.append(clause)
+    return where, params
+
+def list_sort(view, args):
+    """Validated (sort key, order) for a list view"""
+    sort = args.get('sort') if args.get('sort') in view['sort'] else view['default_sort'][0]
+    order = args.get('order') if args.get('order') in ('asc', 'desc') else view['default_sort'][1]
+    return sort, order
+
+def paginate(name, args, db=None, cache_tag=None):
+    """Return one bounded page of a list view plus cursors and the (cached) total count.
+
+    cache_tag (e.g. a table version) is added to the count cache key so a new
+    tag forces a fresh count.
+    """
+    view = LIST_VIEWS[name]
+    db = db or get_db()
+    sort, order = list_sort(view, args)
+    try:
+        per_page = int(args.get('per_page', app.config['LIST_PAGE_SIZE']))
+    except ValueError:
+        per_page = app.config['LIST_PAGE_SIZE']
+    per_page = max(1, min(per_page, app.config['LIST_MAX_PAGE_SIZE']))
+    sort_expr, id_expr = view['sort'][sort], view['id']
+
+    where, params = list_filters(view, args)
+    count_sql = f"SELECT COUNT(*) FROM {view['from']}" + (' WHERE ' + ' AND '.join(where) if where else '')
+    total = list_count_cache.get_or_compute(
+        (count_sql, tuple(params), cache_tag), lambda: db.execute(count_sql, params).fetchone()[0])
+
+    after = decode_cursor(args['after']) if args.get('after') else None
+    before = decode_cursor(args['before']) if args.get('before') and not after else None
+    backwards = before is not None
+    ascending = (order == 'asc') != backwards
+    seek = after or before
+    if seek:
+        where = where + [f"({sort_expr}, {id_expr}) {'>' if ascending else '<'} (?, ?)"]
+        params = params + list(seek)
+    direction = 'ASC' if ascending else 'DESC'
+    sql = view['select'].replace('SELECT ', f'SELECT {sort_expr} as _sort_key, ', 1)
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += f' ORDER BY {sort_expr} {direction}, {id_expr} {direction} LIMIT ?'
+    rows = db.execute(sql, params + [per_page + 1]).fetchall()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = seek is not None, more
+    return {
+        'items': rows,
+        'total': total,
+        'per_page': per_page,
+        'sort': sort,
+        'order': order,
+        'q': args.get('q', ''),
+        'next_cursor': encode_cursor(rows[-1]['_sort_key'], rows[-1]['id']) if rows and has_next else None,
+        'prev_cursor': encode_cursor(rows[0]['_sort_key'], rows[0]['id']) if rows and has_prev else None,
+    }
+
+@app.context_processor
+def list_url_helpers():
+    def page_url(**changes):
+        """URL of the current list page with some query arguments replaced"""
+        args = request.args.to_dict()
+        # Any change (a new cursor, sort or filter) replaces the current cursor
+        args.pop('after', None)
+        args.pop('before', None)
+        args.update(changes)
+        return url_for(request.endpoint, **{k: v for k, v in args.items() if v not in (None, '')})
+
+    def export_url(fmt, name=None):
+        """Server-side export of the current list (same filters and sort, all pages)"""
+        args = {k: v for k, v in request.args.items() if k not in ('after', 'before', 'per_page') and v}
+        return url_for('export', name=name or request.endpoint, fmt=fmt, **args)
+    return {'page_url': page_url, 'export_url': export_url}
+
+# Login throttling: token buckets per user name and per client address are
+# checked before any password work, and hashing runs on a small fixed thread
+# pool so a burst of logins cannot take more than that many cores.
+app.config['LOGIN_USER_BURST'] = int(os.environ.get('ERP_LOGIN_USER_BURST', 5))
+app.config['LOGIN_USER_PER_MINUTE'] = float(os.environ.get('ERP_LOGIN_USER_PER_MINUTE', 5))
+# Generous by default: at shift start a whole plant may log in through one NAT address
+app.config['LOGIN_IP_BURST'] = int(os.environ.get('ERP_LOGIN_IP_BURST', 50))
+app.config['LOGIN_IP_PER_MINUTE'] = float(os.environ.get('ERP_LOGIN_IP_PER_MINUTE', 30))
+app.config['LOGIN_HASH_WORKERS'] = int(os.environ.get('ERP_LOGIN_HASH_WORKERS', 2))
+app.config['LOGIN_HASH_QUEUE'] = int(os.environ.get('ERP_LOGIN_HASH_QUEUE', 32))
+# Werkzeug method string; stored hashes made another way are replaced at the next login
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('ERP_PASSWORD_HASH_METHOD', 'scrypt')
+LOGIN_BUCKET_KEYS = 10000
+
+class TokenBuckets:
+    """One token bucket per key, in memory; the least recently used keys are
+    dropped beyond max_keys. A capacity of 0 disables the limit."""
+
+    def __init__(self, capacity, per_minute, max_keys=LOGIN_BUCKET_KEYS):
+        self.capacity = capacity
+        self.rate = per_minute / 60
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Spend a token; returns 0 if one was available, else the seconds until one is"""
+        if self.capacity <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / self.rate if self.rate > 0 else 3600
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+class PasswordHasher:
+    """Runs password hashing on `workers` threads; callers beyond the workers
+    plus `queue_size` waiting are turned away instead of piling up"""
+
+    def __init__(self, workers, queue_size):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(max(1, workers) + queue_size)
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise OverflowError('password hashing queue full')
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+login_user_buckets = TokenBuckets(app.config['LOGIN_USER_BURST'], app.config['LOGIN_USER_PER_MINUTE'])
+login_ip_buckets = TokenBuckets(app.config['LOGIN_IP_BURST'], app.config['LOGIN_IP_PER_MINUTE'])
+password_hasher = PasswordHasher(app.config['LOGIN_HASH_WORKERS'], app.config['LOGIN_HASH_QUEUE'])
+_password_policy = None
+
+def hash_password(password):
+    return generate_password_hash(password, app.config['PASSWORD_HASH_METHOD'])
+
+def password_policy():
+    """(method prefix of new hashes, a hash to check unknown user names against)"""
+    global _password_policy
+    if _password_policy is None:
+        dummy = hash_password(secrets.token_hex(16))
+        _password_policy = (dummy.split('$', 1)[0], dummy)
+    return _password_policy
+
+def verify_login(db, username, password):
+    """The user row if the password matches, else None; raises OverflowError when
+    the hash pool is saturated. Unknown names cost a hash too, so they are not
+    told apart by timing, and outdated hashes are upgraded on success."""
+    user = db.execute('SELECT id, password, language FROM users WHERE username = ?', (username,)).fetchone()
+
+    def check():
+        method, dummy = password_policy()
+        if not check_password_hash(user['password'] if user else dummy, password) or user is None:
+            return False, None
+        return True, hash_password(password) if user['password'].split('$', 1)[0] != method else None
+
+    ok, new_hash = password_hasher.run(check)
+    if not ok:
+        return None
+    if new_hash:
+        db.execute('UPDATE users SET password = ? WHERE id = ?', (new_hash, user['id']))
+        db.commit()
+    return user
+
+# Login required decorator
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session or current_user() is None:
+            return redirect(url_for('login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+# Routes
+@app.route('/')
+def index():
+    if 'user_id' in session:
+        return redirect(url_for('dashboard'))
+    return redirect(url_for('login'))
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        
+        # A throttled address does not also spend the user's tokens
+        wait = login_ip_buckets.take(request.remote_addr) or login_user_buckets.take(username)
+        if wait:
+            metrics.inc('erp_login_attempts_total', (('result', 'throttled'),))
+            return render_template('login.html', error=get_translation('too_many_login_attempts')), \
+                429, {'Retry-After': str(int(wait) + 1)}
+        try:
+            user = verify_login(get_db(), username, password)
+        except OverflowError:
+            metrics.inc('erp_login_attempts_total', (('result', 'busy'),))
+            return render_template('login.html', error=get_translation('login_busy')), 503, {'Retry-After': '1'}
+        
+        metrics.inc('erp_login_attempts_total', (('result', 'success' if user else 'failure'),))
+        if user:
+            session.clear()
+            if isinstance(session, ServerSideSession):
+                session.rotate()
+            # Name and role are read from the user cache (current_user), not the session
+            session['user_id'] = user['id']
+            session['language'] = user['language'] if user['language'] else DEFAULT_LANGUAGE
+            return redirect(url_for('dashboard'))
+        
+        error = get_translation('invalid_credentials')
+        return render_template('login.html', error=error)
+    
+    return render_template('login.html')
+
+@app.route('/set-language/<lang>')
+def set_language(lang):
+    """Dil değiştirme / Change language"""
+    if lang in TRANSLATIONS:
+        session['language'] = lang
+        # Kullanıcı giriş yapmışsa veritabanını güncelle (only when it changes)
+        user = current_user()
+        if user and user['language'] != lang:
+            db = get_db()
+            db.execute('UPDATE users SET language = ? WHERE id = ?', (lang, user['id']))
+            db.commit()
+            user_cache.invalidate(user['id'])
+    return redirect(request.referrer or url_for('dashboard'))
+
+@app.route('/logout')
+def logout():
+    session.clear()
+    return redirect(url_for('login'))
+
+@app.route('/dashboard')
+@login_required
+def dashboard():
+    stats = dashboard_cache.get_or_compute('stats', load_dashboard_stats)
+    return render_template('dashboard.html', stats=stats)
+
+# Form value coercion, shared by the form handlers and bulk import
+def product_form_values(form):
+    """Column values for products, in PRODUCT_COLUMNS order"""
+    return (
+        form['name'],
+        form['sku'],
+        form.get('description', ''),
+        form.get('category', ''),
+        form.get('product_type', 'finished_good'),
+        form.get('material_type', ''),
+        form.get('material_grade', ''),
+        form.get('color', ''),
+        float(form.get('piece_weight', 0)) if form.get('piece_weight') else None,
+        form.get('dimensions', ''),
+        int(form.get('quantity', 0)),
+        form.get('unit', 'pcs'),
+        float(form['unit_price']),
+        float(form.get('cost_price', 0)) if form.get('cost_price') else None,
+        int(form.get('reorder_level', 10)),
+        int(form['supplier_id']) if form.get('supplier_id') else None,
+        int(form['mold_id']) if form.get('mold_id') else None,
+        int(form.get('cycle_time', 0)) if form.get('cycle_time') else None,
+        int(form.get('pieces_per_hour', 0)) if form.get('pieces_per_hour') else None,
+        form.get('technical_drawing_no', ''),
+        int(form.get('packaging_qty', 0)) if form.get('packaging_qty') else None,
+        form.get('storage_location', '')
+    )
+
+def customer_form_values(form):
+    """Column values for customers, in CUSTOMER_COLUMNS order"""
+    return (
+        form['name'],
+        form.get('email', ''),
+        form.get('phone', ''),
+        form.get('address', ''),
+        form.get('company', '')
+    )
+
+def supplier_form_values(form):
+    """Column values for suppliers, in SUPPLIER_COLUMNS order"""
+    return (
+        form['name'],
+        form.get('email', ''),
+        form.get('phone', ''),
+        form.get('address', ''),
+        form.get('contact_person', '')
+    )
+
+def mold_form_values(form):
+    """Column values for molds, in MOLD_COLUMNS order"""
+    return (
+        form['mold_code'],
+        form['mold_name'],
+        int(form['cavity_count']),
+        form.get('compatible_materials', ''),
+        int(form['required_tonnage_min']) if form.get('required_tonnage_min') else None,
+        int(form['required_tonnage_max']) if form.get('required_tonnage_max') else None,
+        int(form['cycle_time']) if form.get('cycle_time') else None,
+        form.get('status', 'active'),
+        int(form.get('total_shots', 0)),
+        int(form.get('maintenance_interval', 500000)),
+        form.get('last_maintenance_date'),
+        form.get('next_maintenance_date'),
+        form.get('location', ''),
+        float(form.get('weight', 0)) if form.get('weight') else None,
+        form.get('dimensions', ''),
+        form.get('notes', '')
+    )
+
+def machine_form_values(form):
+    """Column values for machines, in MACHINE_COLUMNS order"""
+    return (
+        form['machine_code'],
+        form['machine_name'],
+        form.get('brand', ''),
+        form.get('model', ''),
+        int(form['tonnage']) if form.get('tonnage') else None,
+        int(form.get('injection_unit', 0)) if form.get('injection_unit') else None,
+        int(form.get('screw_diameter', 0)) if form.get('screw_diameter') else None,
+        int(form.get('max_shot_weight', 0)) if form.get('max_shot_weight') else None,
+        int(form.get('min_mold_size', 0)) if form.get('min_mold_size') else None,
+        int(form.get('max_mold_size', 0)) if form.get('max_mold_size') else None,
+        int(form.get('power_consumption', 0)) if form.get('power_consumption') else None,
+        form.get('status', 'idle'),
+        form.get('location', ''),
+        form.get('section', ''),
+        form.get('last_maintenance_date'),
+        form.get('next_maintenance_date'),
+        int(form.get('maintenance_interval_days', 90)),
+        int(form.get('total_hours', 0)),
+        form.get('notes', '')
+    )
+
+def production_form_values(form):
+    """Planning values for production orders, in PRODUCTION_COLUMNS order"""
+    return (
+        int(form['product_id']),
+        int(form['mold_id']),
+        int(form['machine_id']) if form.get('machine_id') else None,
+        form.get('operator_name', ''),
+        int(form['planned_quantity']),
+        form.get('planned_start_date'),
+        form.get('planned_end_date'),
+        form.get('notes', '')
+    )
+
+PRODUCT_COLUMNS = ('name', 'sku', 'description', 'category', 'product_type', 'material_type',
+                   'material_grade', 'color', 'piece_weight', 'dimensions', 'quantity', 'unit',
+                   'unit_price', 'cost_price', 'reorder_level', 'supplier_id', 'mold_id',
+                   'cycle_time', 'pieces_per_hour', 'technical_drawing_no', 'packaging_qty',
+                   'storage_location')
+CUSTOMER_COLUMNS = ('name', 'email', 'phone', 'address', 'company')
+SUPPLIER_COLUMNS = ('name', 'email', 'phone', 'address', 'contact_person')
+MOLD_COLUMNS = ('mold_code', 'mold_name', 'cavity_count', 'compatible_materials',
+                'required_tonnage_min', 'required_tonnage_max', 'cycle_time', 'status',
+                'total_shots', 'maintenance_interval', 'last_maintenance_date',
+                'next_maintenance_date', 'location', 'weight', 'dimensions', 'notes')
+MACHINE_COLUMNS = ('machine_code', 'machine_name', 'brand', 'model', 'tonnage',
+                   'injection_unit', 'screw_diameter', 'max_shot_weight',
+                   'min_mold_size', 'max_mold_size', 'power_consumption',
+                   'status', 'location', 'section', 'last_maintenance_date',
+                   'next_maintenance_date', 'maintenance_interval_days',
+                   'total_hours', 'notes')
+PRODUCTION_COLUMNS = ('product_id', 'mold_id', 'machine_id', 'operator_name', 'planned_quantity',
+                      'planned_start_date', 'planned_end_date', 'notes')
+
+# Product/Inventory routes
+@app.route('/products')
+@login_required
+def products():
+    db = get_db()
+    page = paginate('products', request.args, db)
+    return render_template('products.html', products=page['items'], page=page)
+
+@app.route('/products/add', methods=['GET', 'POST'])
+@login_required
+def add_product():
+    if request.method == 'POST':
+        db = get_db()
+        db.execute('''
+            INSERT INTO products (name, sku, description, category, product_type, material_type,
+                                material_grade, color, piece_weight, dimensions, quantity, unit,
+                                unit_price, cost_price, reorder_level, supplier_id, mold_id,
+                                cycle_time, pieces_per_hour, technical_drawing_no, packaging_qty,
+                                storage_location)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', product_form_values(request.form))
+        db.commit()
+        invalidate_dashboard()
+        return redirect(url_for('products'))
+    
+    db = get_db()
+    suppliers = db.execute('SELECT * FROM suppliers ORDER BY name').fetchall()
+    molds = db.execute('SELECT * FROM molds ORDER BY mold_code').fetchall()
+    return render_template('product_form.html', product=None, suppliers=suppliers, molds=molds)
+
+@app.route('/products/edit/<int:id>', methods=['GET', 'POST'])
+@login_required
+def edit_product(id):
+    db = get_db()
+    
+    if request.method == 'POST':
+        set_stock_source(db, 'adjustment', 'product', id, session['user_id'])
+        db.execute('''
+            UPDATE products 
+            SET name=?, sku=?, description=?, category=?, product_type=?, material_type=?,
+                material_grade=?, color=?, piece_weight=?, dimensions=?, quantity=?, unit=?,
+                unit_price=?, cost_price=?, reorder_level=?, supplier_id=?, mold_id=?,
+                cycle_time=?, pieces_per_hour=?, technical_drawing_no=?, packaging_qty=?,
+                storage_location=?, updated_at=?
+            WHERE id=?
+        ''', product_form_values(request.form) + (datetime.now(), id))
+        clear_stock_source(db)
+        db.commit()
+        invalidate_dashboard()
+        return redirect(url_for('products'))
+    
+    product = db.execute('SELECT * FROM products WHERE id = ?', (id,)).fetchone()
+    suppliers = db.execute('SELECT * FROM suppliers ORDER BY name').fetchall()
+    molds = db.execute('SELECT * FROM molds ORDER BY mold_code').fetchall()
+    return render_template('product_form.html', product=product, suppliers=suppliers, molds=molds)
+
+@app.route('/products/delete/<int:id>')
+@login_required
+def delete_product(id):
+    db = get_db()
+    db.execute('DELETE FROM products WHERE id = ?', (id,))
+    db.commit()
+    invalidate_dashboard()
+    return redirect(url_for('products'))
+
+# Customer routes
+@app.route('/customers')
+@login_required
+def customers():
+    db = get_db()
+    page = paginate('customers', request.args, db)
+    return render_template('customers.html', customers=page['items'], page=page)
+
+@app.route('/customers/add', methods=['GET', 'POST'])
+@login_required
+def add_customer():
+    if request.method == 'POST':
+        db = get_db()
+        db.execute('''
+            INSERT INTO customers (name, email, phone, address, company)
+            VALUES (?, ?, ?, ?, ?)
+        ''', customer_form_values(request.form))
+        db.commit()
+        invalidate_dashboard()
+        return redirect(url_for('customers'))
+    
+    return render_template('customer_form.html', customer=None)
+
+@app.route('/customers/edit/<int:id>', methods=['GET', 'POST'])
+@login_required
+def edit_customer(id):
+    db = get_db()
+    
+    if request.method == 'POST':
+        db.execute('''
+            UPDATE customers 
+            SET name=?, email=?, phone=?, address=?, company=?
+            WHERE id=?
+        ''', customer_form_values(request.form) + (id,))
+        db.commit()
+        return redirect(url_for('customers'))
+    
+    customer = db.execute('SELECT * FROM customers WHERE id = ?', (id,)).fetchone()
+    return render_template('customer_form.html', customer=customer)
+
+# Supplier routes
+@app.route('/suppliers')
+@login_required
+def suppliers():
+    db = get_db()
+    page = paginate('suppliers', request.args, db)
+    return render_template('suppliers.html', suppliers=page['items'], page=page)
+
+@app.route('/suppliers/add', methods=['GET', 'POST'])
+@login_required
+def add_supplier():
+    if request.method == 'POST':
+        db = get_db()
+        db.execute('''
+            INSERT INTO suppliers (name, email, phone, address, contact_person)
+            VALUES (?, ?, ?, ?, ?)
+        ''', supplier_form_values(request.form))
+        db.commit()
+        return redirect(url_for('suppliers'))
+    
+    return render_template('supplier_form.html', supplier=None)
+
+@app.route('/suppliers/edit/<int:id>', methods=['GET', 'POST'])
+@login_required
+def edit_supplier(id):
+    db = get_db()
+    
+    if request.method == 'POST':
+        db.execute('''
+            UPDATE suppliers 
             SET name=?, email=?, phone=?, address=?, contact_person=?
             WHERE id=?
-        ''', (
-            request.form['name'],
-            request.form.get('email', ''),
-            request.form.get('phone', ''),
-            request.form.get('address', ''),
-            request.form.get('contact_person', ''),
-            id
-        ))
+        ''', supplier_form_values(request.form) + (id,))
         db.commit()
-        db.close()
         return redirect(url_for('suppliers'))
     
     supplier = db.execute('SELECT * FROM suppliers WHERE id = ?', (id,)).fetchone()
-    db.close()
-    return render_template('supplier_form.html', supplier=supplier, t=get_translation)
+    return render_template('supplier_form.html', supplier=supplier)
 
 # Mold Management Routes
 @app.route('/molds')
 @login_required
 def molds():
     db = get_db()
-    molds = db.execute('SELECT * FROM molds ORDER BY mold_code').fetchall()
-    db.close()
-    return render_template('molds.html', molds=molds, t=get_translation)
+    page = paginate('molds', request.args, db)
+    return render_template('molds.html', molds=page['items'], page=page)
 
 @app.route('/molds/add', methods=['GET', 'POST'])
 @login_required
@@ -626,29 +3364,11 @@ def add_mold():
                              total_shots, maintenance_interval, last_maintenance_date, 
                              next_maintenance_date, location, weight, dimensions, notes)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            request.form['mold_code'],
-            request.form['mold_name'],
-            int(request.form['cavity_count']),
-            request.form.get('compatible_materials', ''),
-            int(request.form['required_tonnage_min']) if request.form.get('required_tonnage_min') else None,
-            int(request.form['required_tonnage_max']) if request.form.get('required_tonnage_max') else None,
-            int(request.form['cycle_time']) if request.form.get('cycle_time') else None,
-            request.form.get('status', 'active'),
-            int(request.form.get('total_shots', 0)),
-            int(request.form.get('maintenance_interval', 500000)),
-            request.form.get('last_maintenance_date'),
-            request.form.get('next_maintenance_date'),
-            request.form.get('location', ''),
-            float(request.form.get('weight', 0)) if request.form.get('weight') else None,
-            request.form.get('dimensions', ''),
-            request.form.get('notes', '')
-        ))
+        ''', mold_form_values(request.form))
         db.commit()
-        db.close()
         return redirect(url_for('molds'))
     
-    return render_template('mold_form.html', mold=None, t=get_translation)
+    return render_template('mold_form.html', mold=None)
 
 @app.route('/molds/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -663,32 +3383,12 @@ def edit_mold(id):
                 total_shots=?, maintenance_interval=?, last_maintenance_date=?, 
                 next_maintenance_date=?, location=?, weight=?, dimensions=?, notes=?
             WHERE id=?
-        ''', (
-            request.form['mold_code'],
-            request.form['mold_name'],
-            int(request.form['cavity_count']),
-            request.form.get('compatible_materials', ''),
-            int(request.form['required_tonnage_min']) if request.form.get('required_tonnage_min') else None,
-            int(request.form['required_tonnage_max']) if request.form.get('required_tonnage_max') else None,
-            int(request.form['cycle_time']) if request.form.get('cycle_time') else None,
-            request.form.get('status', 'active'),
-            int(request.form.get('total_shots', 0)),
-            int(request.form.get('maintenance_interval', 500000)),
-            request.form.get('last_maintenance_date'),
-            request.form.get('next_maintenance_date'),
-            request.form.get('location', ''),
-            float(request.form.get('weight', 0)) if request.form.get('weight') else None,
-            request.form.get('dimensions', ''),
-            request.form.get('notes', ''),
-            id
-        ))
+        ''', mold_form_values(request.form) + (id,))
         db.commit()
-        db.close()
         return redirect(url_for('molds'))
     
     mold = db.execute('SELECT * FROM molds WHERE id = ?', (id,)).fetchone()
-    db.close()
-    return render_template('mold_form.html', mold=mold, t=get_translation)
+    return render_template('mold_form.html', mold=mold)
 
 @app.route('/molds/delete/<int:id>')
 @login_required
@@ -696,7 +3396,6 @@ def delete_mold(id):
     db = get_db()
     db.execute('DELETE FROM molds WHERE id = ?', (id,))
     db.commit()
-    db.close()
     return redirect(url_for('molds'))
 
 # Machine Management Routes
@@ -704,16 +3403,15 @@ def delete_mold(id):
 @login_required
 def machines():
     db = get_db()
-    machines = db.execute('SELECT * FROM machines ORDER BY machine_code').fetchall()
-    db.close()
-    return render_template('machines.html', machines=machines, t=get_translation)
+    page = paginate('machines', request.args, db)
+    return render_template('machines.html', machines=page['items'], page=page)
 
 @app.route('/machines/add', methods=['GET', 'POST'])
 @login_required
 def add_machine():
     if request.method == 'POST':
         db = get_db()
-        db.execute('''
+        cursor = db.execute('''
             INSERT INTO machines (machine_code, machine_name, brand, model, tonnage,
                                 injection_unit, screw_diameter, max_shot_weight,
                                 min_mold_size, max_mold_size, power_consumption,
@@ -721,32 +3419,13 @@ def add_machine():
                                 next_maintenance_date, maintenance_interval_days,
                                 total_hours, notes)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            request.form['machine_code'],
-            request.form['machine_name'],
-            request.form.get('brand', ''),
-            request.form.get('model', ''),
-            int(request.form['tonnage']) if request.form.get('tonnage') else None,
-            int(request.form.get('injection_unit', 0)) if request.form.get('injection_unit') else None,
-            int(request.form.get('screw_diameter', 0)) if request.form.get('screw_diameter') else None,
-            int(request.form.get('max_shot_weight', 0)) if request.form.get('max_shot_weight') else None,
-            int(request.form.get('min_mold_size', 0)) if request.form.get('min_mold_size') else None,
-            int(request.form.get('max_mold_size', 0)) if request.form.get('max_mold_size') else None,
-            int(request.form.get('power_consumption', 0)) if request.form.get('power_consumption') else None,
-            request.form.get('status', 'idle'),
-            request.form.get('location', ''),
-            request.form.get('section', ''),
-            request.form.get('last_maintenance_date'),
-            request.form.get('next_maintenance_date'),
-            int(request.form.get('maintenance_interval_days', 90)),
-            int(request.form.get('total_hours', 0)),
-            request.form.get('notes', '')
-        ))
+        ''', machine_form_values(request.form))
+        publish_event(db, 'machine', cursor.lastrowid, 'created')
         db.commit()
-        db.close()
+        notify_subscribers()
         return redirect(url_for('machines'))
     
-    return render_template('machine_form.html', machine=None, t=get_translation)
+    return render_template('machine_form.html', machine=None)
 
 @app.route('/machines/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -763,99 +3442,63 @@ def edit_machine(id):
                 next_maintenance_date=?, maintenance_interval_days=?,
                 total_hours=?, notes=?
             WHERE id=?
-        ''', (
-            request.form['machine_code'],
-            request.form['machine_name'],
-            request.form.get('brand', ''),
-            request.form.get('model', ''),
-            int(request.form['tonnage']) if request.form.get('tonnage') else None,
-            int(request.form.get('injection_unit', 0)) if request.form.get('injection_unit') else None,
-            int(request.form.get('screw_diameter', 0)) if request.form.get('screw_diameter') else None,
-            int(request.form.get('max_shot_weight', 0)) if request.form.get('max_shot_weight') else None,
-            int(request.form.get('min_mold_size', 0)) if request.form.get('min_mold_size') else None,
-            int(request.form.get('max_mold_size', 0)) if request.form.get('max_mold_size') else None,
-            int(request.form.get('power_consumption', 0)) if request.form.get('power_consumption') else None,
-            request.form.get('status', 'idle'),
-            request.form.get('location', ''),
-            request.form.get('section', ''),
-            request.form.get('last_maintenance_date'),
-            request.form.get('next_maintenance_date'),
-            int(request.form.get('maintenance_interval_days', 90)),
-            int(request.form.get('total_hours', 0)),
-            request.form.get('notes', ''),
-            id
-        ))
+        ''', machine_form_values(request.form) + (id,))
+        publish_event(db, 'machine', id)
         db.commit()
-        db.close()
+        notify_subscribers()
         return redirect(url_for('machines'))
     
     machine = db.execute('SELECT * FROM machines WHERE id = ?', (id,)).fetchone()
-    db.close()
-    return render_template('machine_form.html', machine=machine, t=get_translation)
+    return render_template('machine_form.html', machine=machine)
 
 @app.route('/machines/delete/<int:id>')
 @login_required
 def delete_machine(id):
     db = get_db()
     db.execute('DELETE FROM machines WHERE id = ?', (id,))
+    publish_event(db, 'machine', id, 'deleted')
     db.commit()
-    db.close()
-    return redirect(url_for('machines'))
-
-# Production Management Routes
-@app.route('/production')
-@login_required
-def production():
-    db = get_db()
-    orders = db.execute('''
-        SELECT po.*, p.name as product_name, p.sku, m.mold_code, mc.machine_code
-        FROM production_orders po
-        JOIN products p ON po.product_id = p.id
-        JOIN molds m ON po.mold_id = m.id
-        LEFT JOIN machines mc ON po.machine_id = mc.id
-        ORDER BY po.created_at DESC
-    ''').fetchall()
-    db.close()
-    return render_template('production.html', orders=orders, t=get_translation)
+    notify_subscribers()
+    return redirect(url_for('machines'))
+
+# Production Management Routes
+@app.route('/production')
+@login_required
+def production():
+    db = get_db()
+    page = paginate('production', request.args, db)
+    return render_template('production.html', orders=page['items'], page=page)
+
+def create_production_order(db, values, user_id):
+    """Insert a planned production order (values in PRODUCTION_COLUMNS order); returns its id"""
+    # Generate order number
+    order_number = next_document_number(db, 'production_order')
+    
+    cursor = db.execute('''
+        INSERT INTO production_orders (order_number, product_id, mold_id, machine_id,
+                                     operator_name, planned_quantity, planned_start_date,
+                                     planned_end_date, notes, created_by)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (order_number,) + values + (user_id,))
+    publish_event(db, 'production', cursor.lastrowid, 'created')
+    db.commit()
+    notify_subscribers()
+    return cursor.lastrowid
 
 @app.route('/production/add', methods=['GET', 'POST'])
 @login_required
 def add_production():
     if request.method == 'POST':
         db = get_db()
-        
-        # Generate order number
-        order_count = db.execute('SELECT COUNT(*) as count FROM production_orders').fetchone()['count']
-        order_number = f'PO-{order_count + 1:05d}'
-        
-        db.execute('''
-            INSERT INTO production_orders (order_number, product_id, mold_id, machine_id,
-                                         operator_name, planned_quantity, planned_start_date,
-                                         planned_end_date, notes, created_by)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            order_number,
-            int(request.form['product_id']),
-            int(request.form['mold_id']),
-            int(request.form['machine_id']) if request.form.get('machine_id') else None,
-            request.form.get('operator_name', ''),
-            int(request.form['planned_quantity']),
-            request.form.get('planned_start_date'),
-            request.form.get('planned_end_date'),
-            request.form.get('notes', ''),
-            session['user_id']
-        ))
-        db.commit()
-        db.close()
+        create_production_order(db, production_form_values(request.form), session['user_id'])
         return redirect(url_for('production'))
     
     db = get_db()
     products = db.execute('SELECT * FROM products WHERE product_type = "finished_good" ORDER BY name').fetchall()
     molds = db.execute('SELECT * FROM molds WHERE status = "active" ORDER BY mold_code').fetchall()
     machines = db.execute('SELECT * FROM machines ORDER BY machine_code').fetchall()
-    db.close()
     return render_template('production_form.html', order=None, products=products, 
-                         molds=molds, machines=machines, t=get_translation)
+                         molds=molds, machines=machines)
 
 @app.route('/production/start/<int:id>', methods=['POST'])
 @login_required
@@ -866,8 +3509,9 @@ def start_production(id):
         SET status = 'in_progress', actual_start_date = ?
         WHERE id = ?
     ''', (datetime.now(), id))
+    publish_event(db, 'production', id, 'started')
     db.commit()
-    db.close()
+    notify_subscribers()
     return redirect(url_for('production'))
 
 @app.route('/production/complete/<int:id>', methods=['GET', 'POST'])
@@ -891,17 +3535,19 @@ def complete_production(id):
             WHERE id = ?
         ''', (datetime.now(), produced, scrap, material_used, id))
         
-        # Update mold shots
-        order = db.execute('SELECT mold_id FROM production_orders WHERE id = ?', (id,)).fetchone()
-        db.execute('''
-            UPDATE molds 
-            SET total_shots = total_shots + ?,
-                shots_since_maintenance = shots_since_maintenance + ?
-            WHERE id = ?
-        ''', (produced + scrap, produced + scrap, order['mold_id']))
+        # Update mold shots, unless machine telemetry already counted them
+        order = db.execute('SELECT mold_id, telemetry_shots FROM production_orders WHERE id = ?', (id,)).fetchone()
+        if not order['telemetry_shots']:
+            db.execute('''
+                UPDATE molds 
+                SET total_shots = total_shots + ?,
+                    shots_since_maintenance = shots_since_maintenance + ?
+                WHERE id = ?
+            ''', (produced + scrap, produced + scrap, order['mold_id']))
         
+        publish_event(db, 'production', id, 'completed')
         db.commit()
-        db.close()
+        notify_subscribers()
         return redirect(url_for('production'))
     
     order = db.execute('''
@@ -911,8 +3557,7 @@ def complete_production(id):
         JOIN molds m ON po.mold_id = m.id
         WHERE po.id = ?
     ''', (id,)).fetchone()
-    db.close()
-    return render_template('production_complete.html', order=order, t=get_translation)
+    return render_template('production_complete.html', order=order)
 
 @app.route('/production/quality/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -940,14 +3585,18 @@ def production_quality(id):
         # If quality passed, update product stock
         if quality_result == 'passed':
             order = db.execute('SELECT product_id, produced_quantity FROM production_orders WHERE id = ?', (id,)).fetchone()
+            set_stock_source(db, 'production', 'production_order', id, session['user_id'])
             db.execute('''
                 UPDATE products 
                 SET quantity = quantity + ?
                 WHERE id = ?
             ''', (order['produced_quantity'], order['product_id']))
+            clear_stock_source(db)
         
+        publish_event(db, 'production', id, 'quality')
         db.commit()
-        db.close()
+        invalidate_dashboard()
+        notify_subscribers()
         return redirect(url_for('production'))
     
     order = db.execute('''
@@ -956,22 +3605,310 @@ def production_quality(id):
         JOIN products p ON po.product_id = p.id
         WHERE po.id = ?
     ''', (id,)).fetchone()
-    db.close()
-    return render_template('production_quality.html', order=order, t=get_translation)
+    return render_template('production_quality.html', order=order)
+
+# Production scheduling: an earliest-due-date list scheduler. Planned orders
+# are popped from a priority queue and placed on the compatible machine
+# (tonnage within the mold's range) where they finish first, after the
+# machine and the mold are free and outside their maintenance days.
+app.config['SCHEDULE_SETUP_MINUTES'] = int(os.environ.get('ERP_SCHEDULE_SETUP_MINUTES', 30))
+SCHEDULE_TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+def parse_schedule_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+def maintenance_window(value):
+    """A maintenance date blocks that whole day"""
+    day = parse_schedule_date(value)
+    if day is None:
+        return None
+    day = datetime.combine(day.date(), datetime.min.time())
+    return day, day + timedelta(days=1)
+
+def order_duration(order):
+    """Production time in seconds from the mold cycle and cavities, else the product rate"""
+    if order['mold_cycle_time'] and order['cavity_count']:
+        shots = -(-order['planned_quantity'] // order['cavity_count'])
+        return shots * order['mold_cycle_time']
+    if order['pieces_per_hour']:
+        return order['planned_quantity'] * 3600 / order['pieces_per_hour']
+    return None
+
+def place(start, duration, windows):
+    """Earliest start >= start whose [start, start + duration) avoids every window"""
+    moved = True
+    while moved:
+        moved = False
+        for window_start, window_end in windows:
+            if start < window_end and start + duration > window_start:
+                start = window_end
+                moved = True
+    return start
+
+def build_schedule(db, now=None):
+    """Assign every planned order to a machine and time slot (nothing is written).
+
+    Returns {'assignments': [...], 'unscheduled': [...], 'stats': {...}}.
+    """
+    started = time.perf_counter()
+    now = (now or datetime.now()).replace(second=0, microsecond=0) + timedelta(minutes=1)
+    setup = timedelta(minutes=app.config['SCHEDULE_SETUP_MINUTES'])
+    
+    machines = db.execute('''
+        SELECT id, machine_code, tonnage, status, next_maintenance_date FROM machines
+        WHERE status != 'broken'
+    ''').fetchall()
+    machine_free = {m['id']: now for m in machines}
+    machine_mold = {m['id']: None for m in machines}
+    machine_windows = {m['id']: [w for w in [maintenance_window(m['next_maintenance_date'])] if w]
+                       for m in machines}
+    for m in machines:
+        if m['status'] == 'maintenance':
+            machine_windows[m['id']].append((now, now + timedelta(days=1)))
+    molds = {row['id']: row for row in db.execute('''
+        SELECT id, status, required_tonnage_min, required_tonnage_max, next_maintenance_date FROM molds
+    ''')}
+    mold_free = {mold_id: now for mold_id in molds}
+    mold_windows = {mold_id: [w for w in [maintenance_window(row['next_maintenance_date'])] if w]
+                    for mold_id, row in molds.items()}
+    
+    orders = db.execute('''
+        SELECT po.id, po.order_number, po.status, po.mold_id, po.machine_id, po.planned_quantity,
+               po.produced_quantity, po.planned_start_date, po.planned_end_date, po.actual_start_date,
+               m.cycle_time as mold_cycle_time, m.cavity_count, p.pieces_per_hour
+        FROM production_orders po
+        JOIN molds m ON po.mold_id = m.id
+        JOIN products p ON po.product_id = p.id
+        WHERE po.status IN ('planned', 'in_progress')
+    ''').fetchall()
+    
+    # Running orders keep their machine and mold until their estimated end
+    backlog = []
+    for order in orders:
+        duration = order_duration(order)
+        if order['status'] == 'in_progress':
+            start = parse_schedule_date(order['actual_start_date']) or now
+            end = max(now, start + timedelta(seconds=duration or 0))
+            if order['machine_id'] in machine_free:
+                machine_free[order['machine_id']] = max(machine_free[order['machine_id']], end)
+                machine_mold[order['machine_id']] = order['mold_id']
+            mold_free[order['mold_id']] = max(mold_free.get(order['mold_id'], now), end)
+            continue
+        release = max(now, parse_schedule_date(order['planned_start_date']) or now)
+        due = parse_schedule_date(order['planned_end_date']) or parse_schedule_date(order['planned_start_date'])
+        # Orders with a due date first (earliest first), then by release and age
+        heapq.heappush(backlog, (due is None, due or now, release, order['id'], order, duration))
+    
+    # Compatible machines depend only on the mold's tonnage range
+    candidates = {}
+    def compatible(mold):
+        if mold['id'] not in candidates:
+            low, high = mold['required_tonnage_min'], mold['required_tonnage_max']
+            if low is None and high is None:
+                candidates[mold['id']] = [m['id'] for m in machines]
+            else:
+                candidates[mold['id']] = [m['id'] for m in machines if m['tonnage'] is not None
+                                          and (low or 0) <= m['tonnage'] <= (high or float('inf'))]
+        return candidates[mold['id']]
+    
+    assignments, unscheduled = [], []
+    while backlog:
+        _, due, release, _, order, duration = heapq.heappop(backlog)
+        mold = molds.get(order['mold_id'])
+        if duration is None:
+            unscheduled.append({'id': order['id'], 'order_number': order['order_number'],
+                                'reason': 'mold cycle time / cavity count or product pieces per hour missing'})
+            continue
+        if mold is None or mold['status'] != 'active':
+            unscheduled.append({'id': order['id'], 'order_number': order['order_number'], 'reason': 'mold not active'})
+            continue
+        machine_ids = compatible(mold)
+        if not machine_ids:
+            unscheduled.append({'id': order['id'], 'order_number': order['order_number'],
+                                'reason': 'no machine within the mold tonnage range'})
+            continue
+        run = timedelta(seconds=duration)
+        best = None
+        for machine_id in machine_ids:
+            change = setup if machine_mold[machine_id] != order['mold_id'] else timedelta(0)
+            start = max(release, machine_free[machine_id], mold_free[order['mold_id']])
+            start = place(start, change + run, machine_windows[machine_id] + mold_windows[order['mold_id']])
+            end = start + change + run
+            if best is None or end < best[0]:
+                best = (end, start, machine_id)
+        end, start, machine_id = best
+        machine_free[machine_id] = end
+        machine_mold[machine_id] = order['mold_id']
+        mold_free[order['mold_id']] = end
+        assignments.append({
+            'id': order['id'],
+            'order_number': order['order_number'],
+            'machine_id': machine_id,
+            'mold_id': order['mold_id'],
+            'planned_start_date': start.strftime(SCHEDULE_TIME_FORMAT),
+            'planned_end_date': end.strftime(SCHEDULE_TIME_FORMAT),
+            'late': due is not None and end > due and order['planned_end_date'] is not None,
+        })
+    
+    makespan = max((a['planned_end_date'] for a in assignments), default=None)
+    return {
+        'assignments': assignments,
+        'unscheduled': unscheduled,
+        'stats': {
+            'orders': len(assignments) + len(unscheduled),
+            'scheduled': len(assignments),
+            'late': sum(a['late'] for a in assignments),
+            'machines': len(machines),
+            'finish': makespan,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        },
+    }
+
+def apply_schedule(db, attempts=3):
+    """Compute a schedule and write it, retrying if orders, molds or machines change meanwhile"""
+    tables = ('production_orders', 'molds', 'machines')
+    for _ in range(attempts):
+        tag, _ = table_versions(db, tables)
+        schedule = build_schedule(db)
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if table_versions(db, tables)[0] != tag:
+                db.rollback()
+                continue
+            db.executemany('''
+                UPDATE production_orders SET machine_id = ?, planned_start_date = ?, planned_end_date = ?
+                WHERE id = ? AND status = 'planned'
+            ''', [(a['machine_id'], a['planned_start_date'], a['planned_end_date'], a['id'])
+                  for a in schedule['assignments']])
+            publish_event(db, 'production', None, 'rescheduled')
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        notify_subscribers()
+        return schedule
+    raise sqlite3.OperationalError('production data kept changing while rescheduling; try again')
+
+@app.route('/api/schedule', methods=['GET', 'POST'])
+@login_required
+def api_schedule():
+    """GET previews the schedule for all planned orders; POST applies it"""
+    db = get_db()
+    if request.method == 'POST':
+        return jsonify(apply_schedule(db))
+    return jsonify(build_schedule(db))
+
+@app.route('/production/reschedule', methods=['POST'])
+@login_required
+def reschedule_production():
+    apply_schedule(get_db())
+    return redirect(url_for('production', status='planned', sort='planned_start', order='asc'))
 
 # Sales Order routes
 @app.route('/sales')
 @login_required
 def sales():
     db = get_db()
-    orders = db.execute('''
-        SELECT so.*, c.name as customer_name 
-        FROM sales_orders so 
-        JOIN customers c ON so.customer_id = c.id
-        ORDER BY so.order_date DESC
-    ''').fetchall()
-    db.close()
-    return render_template('sales.html', orders=orders, t=get_translation)
+    page = paginate('sales', request.args, db)
+    return render_template('sales.html', orders=page['items'], page=page)
+
+def parse_order_lines(db, form, price='unit_price'):
+    """Validate posted order lines against the catalogue in one query.
+
+    Returns [(product_id, quantity, unit_price, subtotal)]; raises ValueError
+    with a user-facing message for malformed lines or unknown products.
+    """
+    items = form.getlist('product_id[]')
+    quantities = form.getlist('quantity[]')
+    prices = form.getlist('unit_price[]')
+    rows = [(item, quantities[i] if i < len(quantities) else None, prices[i] if i < len(prices) else None)
+            for i, item in enumerate(items)]
+    return validate_order_lines(db, rows, price)
+
+def validate_order_lines(db, rows, price='unit_price'):
+    """Validate (product_id, quantity, unit_price) rows; a blank product skips the line
+    and a blank price takes the catalogue price (the SQL expression `price`)."""
+    posted = []
+    for i, (item, quantity, unit_price) in enumerate(rows):
+        if item in (None, ''):
+            continue
+        try:
+            product_id = int(item)
+            quantity = int(quantity)
+            unit_price = float(unit_price) if unit_price not in (None, '') else None
+        except (ValueError, TypeError):
+            raise ValueError(f'Line {i + 1}: invalid quantity or price')
+        if quantity <= 0:
+            raise ValueError(f'Line {i + 1}: quantity must be positive')
+        posted.append((product_id, quantity, unit_price))
+    if not posted:
+        raise ValueError('Add at least one order item')
+    
+    catalogue = {row['id']: row['price'] for row in db.execute(
+        f'SELECT id, {price} AS price FROM products WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps(sorted({p[0] for p in posted})),))}
+    missing = sorted({p[0] for p in posted} - set(catalogue))
+    if missing:
+        raise ValueError('Unknown product id(s): ' + ', '.join(map(str, missing)))
+    
+    lines = []
+    for product_id, quantity, unit_price in posted:
+        if unit_price is None:
+            unit_price = catalogue[product_id]
+        lines.append((product_id, quantity, unit_price, quantity * unit_price))
+    return lines
+
+def create_sale(db, customer_id, status, notes, lines, user_id):
+    """Write a sales order, its items, stock changes and income record in one transaction.
+
+    Returns (order_id, order_number).
+    """
+    total = sum(line[3] for line in lines)
+    stock_changes = {}
+    if status == 'completed':
+        for product_id, quantity, _, _ in lines:
+            stock_changes[product_id] = stock_changes.get(product_id, 0) + quantity
+    
+    # Generate order number
+    order_number = next_document_number(db, 'sales_order')
+    
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        # Insert order with its final total
+        cursor = db.execute('''
+            INSERT INTO sales_orders (order_number, customer_id, status, total_amount, notes, created_by)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (order_number, customer_id, status, total, notes, user_id))
+        order_id = cursor.lastrowid
+        
+        # Insert order items and update inventory in batches
+        db.executemany('''
+            INSERT INTO sales_order_items (order_id, product_id, quantity, unit_price, subtotal)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(order_id,) + line for line in lines])
+        if stock_changes:
+            set_stock_source(db, 'sale', 'sales_order', order_id, user_id)
+            db.executemany('UPDATE products SET quantity = quantity - ? WHERE id = ?',
+                           [(quantity, product_id) for product_id, quantity in stock_changes.items()])
+            clear_stock_source(db)
+        
+        # Add transaction record
+        db.execute('''
+            INSERT INTO transactions (type, category, amount, description, reference_type, reference_id, created_by)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', ('income', 'sales', total, f'Sales Order {order_number}', 'sales_order', order_id, user_id))
+        
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    invalidate_dashboard()
+    return order_id, order_number
 
 @app.route('/sales/add', methods=['GET', 'POST'])
 @login_required
@@ -979,65 +3916,256 @@ def add_sale():
     if request.method == 'POST':
         db = get_db()
         
-        # Generate order number
-        order_count = db.execute('SELECT COUNT(*) as count FROM sales_orders').fetchone()['count']
-        order_number = f'SO-{order_count + 1:05d}'
+        # Validate everything before taking the write lock
+        try:
+            customer_id = int(request.form['customer_id'])
+            lines = parse_order_lines(db, request.form)
+        except (KeyError, ValueError) as e:
+            customers = db.execute('SELECT * FROM customers ORDER BY name').fetchall()
+            products = db.execute('SELECT * FROM products ORDER BY name').fetchall()
+            return render_template('sales_form.html', customers=customers,
+                                   products=products, error=str(e)), 400
         
-        # Insert order
+        create_sale(db, customer_id, request.form.get('status', 'pending'),
+                    request.form.get('notes', ''), lines, session['user_id'])
+        return redirect(url_for('sales'))
+    
+    db = get_db()
+    customers = db.execute('SELECT * FROM customers ORDER BY name').fetchall()
+    products = db.execute('SELECT * FROM products ORDER BY name').fetchall()
+    return render_template('sales_form.html', customers=customers, products=products)
+
+# Purchase Order routes
+@app.route('/purchases')
+@login_required
+def purchases():
+    db = get_db()
+    page = paginate('purchases', request.args, db)
+    return render_template('purchases.html', orders=page['items'], page=page)
+
+def create_purchase_order(db, supplier_id, notes, lines, user_id, expected_date=None):
+    """Write a pending purchase order and its items in one transaction.
+
+    Returns (po_id, po_number).
+    """
+    total = sum(line[3] for line in lines)
+    po_number = next_document_number(db, 'purchase_order')
+    
+    db.execute('BEGIN IMMEDIATE')
+    try:
         cursor = db.execute('''
-            INSERT INTO sales_orders (order_number, customer_id, status, notes, created_by)
+            INSERT INTO purchase_orders (po_number, supplier_id, status, total_amount, notes, expected_date, created_by)
+            VALUES (?, ?, 'pending', ?, ?, ?, ?)
+        ''', (po_number, supplier_id, total, notes, expected_date or None, user_id))
+        po_id = cursor.lastrowid
+        db.executemany('''
+            INSERT INTO purchase_order_items (po_id, product_id, quantity, unit_price, subtotal)
             VALUES (?, ?, ?, ?, ?)
-        ''', (
-            order_number,
-            int(request.form['customer_id']),
-            request.form.get('status', 'pending'),
-            request.form.get('notes', ''),
-            session['user_id']
-        ))
-        
-        order_id = cursor.lastrowid
-        
-        # Insert order items and update inventory
-        items = request.form.getlist('product_id[]')
-        quantities = request.form.getlist('quantity[]')
-        prices = request.form.getlist('unit_price[]')
-        
-        total = 0
-        for i in range(len(items)):
-            if items[i]:
-                product_id = int(items[i])
-                quantity = int(quantities[i])
-                unit_price = float(prices[i])
-                subtotal = quantity * unit_price
-                total += subtotal
-                
-                db.execute('''
-                    INSERT INTO sales_order_items (order_id, product_id, quantity, unit_price, subtotal)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (order_id, product_id, quantity, unit_price, subtotal))
-                
-                # Update inventory if order is completed
-                if request.form.get('status') == 'completed':
-                    db.execute('UPDATE products SET quantity = quantity - ? WHERE id = ?', (quantity, product_id))
+        ''', [(po_id,) + line for line in lines])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return po_id, po_number
+
+def set_purchase_status(db, po_id, status, user_id):
+    """Approve a pending order or cancel a pending/approved one; other orders are left unchanged"""
+    if status == 'approved':
+        db.execute('''
+            UPDATE purchase_orders SET status = 'approved', approved_by = ?, approved_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'pending'
+        ''', (user_id, po_id))
+    else:
+        db.execute('''
+            UPDATE purchase_orders SET status = 'cancelled'
+            WHERE id = ? AND status IN ('pending', 'approved')
+        ''', (po_id,))
+    db.commit()
+
+def receive_purchase_items(db, receipts, user_id):
+    """Post goods receipts [(item_id, quantity)] across any number of lines and orders in one transaction.
+
+    Stock and received quantities are raised with one statement per table, each
+    order gets one expense record for the value received, and orders move to
+    'partial' or 'received'. Raises ValueError, writing nothing, for unknown
+    lines, orders that are not approved, or more than the outstanding quantity.
+    """
+    totals = {}
+    for i, (item_id, quantity) in enumerate(receipts):
+        try:
+            item_id, quantity = int(item_id), int(quantity)
+        except (ValueError, TypeError):
+            raise ValueError(f'Line {i + 1}: invalid line or quantity')
+        if quantity < 0:
+            raise ValueError(f'Line {i + 1}: quantity must not be negative')
+        if quantity:
+            totals[item_id] = totals.get(item_id, 0) + quantity
+    if not totals:
+        raise ValueError('Enter a quantity for at least one line')
+    
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        items = {row['id']: row for row in db.execute('''
+            SELECT poi.id, poi.po_id, poi.product_id, poi.unit_price,
+                   poi.quantity - poi.received_quantity as outstanding, po.po_number, po.status
+            FROM purchase_order_items poi
+            JOIN purchase_orders po ON poi.po_id = po.id
+            WHERE poi.id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(sorted(totals)),))}
+        errors = []
+        for item_id, quantity in totals.items():
+            item = items.get(item_id)
+            if item is None:
+                errors.append(f'Unknown purchase order line {item_id}')
+            elif item['status'] not in PURCHASE_RECEIVABLE_STATUSES:
+                errors.append(f"{item['po_number']} is {item['status']}")
+            elif quantity > item['outstanding']:
+                errors.append(f"{item['po_number']}: {quantity} received but {item['outstanding']} outstanding")
+        if errors:
+            raise ValueError('; '.join(errors))
         
-        # Update order total
-        db.execute('UPDATE sales_orders SET total_amount = ? WHERE id = ?', (total, order_id))
+        stock = {}
+        orders = {}
+        for item_id, quantity in totals.items():
+            item = items[item_id]
+            order_stock = stock.setdefault(item['po_id'], {})
+            order_stock[item['product_id']] = order_stock.get(item['product_id'], 0) + quantity
+            number, amount = orders.get(item['po_id'], (item['po_number'], 0))
+            orders[item['po_id']] = (number, amount + quantity * item['unit_price'])
         
-        # Add transaction record
-        db.execute('''
+        db.executemany('UPDATE purchase_order_items SET received_quantity = received_quantity + ? WHERE id = ?',
+                       [(quantity, item_id) for item_id, quantity in totals.items()])
+        for po_id, order_stock in stock.items():
+            set_stock_source(db, 'receipt', 'purchase_order', po_id, user_id)
+            db.executemany('UPDATE products SET quantity = quantity + ? WHERE id = ?',
+                           [(quantity, product_id) for product_id, quantity in order_stock.items()])
+        clear_stock_source(db)
+        db.executemany('''
             INSERT INTO transactions (type, category, amount, description, reference_type, reference_id, created_by)
             VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', ('income', 'sales', total, f'Sales Order {order_number}', 'sales_order', order_id, session['user_id']))
-        
+        ''', [('expense', 'purchases', amount, f'Goods receipt {number}', 'purchase_order', po_id, user_id)
+              for po_id, (number, amount) in orders.items()])
+        db.execute('''
+            UPDATE purchase_orders SET status = CASE
+                WHEN EXISTS (SELECT 1 FROM purchase_order_items poi
+                             WHERE poi.po_id = purchase_orders.id AND poi.received_quantity < poi.quantity)
+                THEN 'partial' ELSE 'received' END
+            WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(sorted(orders)),))
         db.commit()
-        db.close()
-        return redirect(url_for('sales'))
-    
+    except Exception:
+        db.rollback()
+        raise
+    invalidate_dashboard()
+    return {
+        'lines': len(totals),
+        'orders': len(orders),
+        'quantity': sum(totals.values()),
+        'amount': round(sum(amount for _, amount in orders.values()), 2),
+    }
+
+def outstanding_purchase_lines(db, po_ids=None, supplier_id=None):
+    """Lines of approved orders still waiting for goods, oldest expected first"""
+    return db.execute('''
+        SELECT poi.id, poi.po_id, poi.product_id, poi.quantity, poi.received_quantity, poi.unit_price,
+               poi.quantity - poi.received_quantity as outstanding,
+               po.po_number, po.expected_date, p.name as product_name, p.sku, p.unit, s.name as supplier_name
+        FROM purchase_order_items poi
+        JOIN purchase_orders po ON poi.po_id = po.id
+        JOIN products p ON poi.product_id = p.id
+        JOIN suppliers s ON po.supplier_id = s.id
+        WHERE po.status IN ('approved', 'partial') AND poi.received_quantity < poi.quantity
+          AND (:po_ids IS NULL OR po.id IN (SELECT value FROM json_each(:po_ids)))
+          AND (:supplier_id IS NULL OR po.supplier_id = :supplier_id)
+        ORDER BY COALESCE(po.expected_date, po.order_date), po.po_number, poi.id
+    ''', {'po_ids': json.dumps(po_ids) if po_ids else None, 'supplier_id': supplier_id}).fetchall()
+
+@app.route('/purchases/add', methods=['GET', 'POST'])
+@login_required
+def add_purchase():
     db = get_db()
-    customers = db.execute('SELECT * FROM customers ORDER BY name').fetchall()
+    if request.method == 'POST':
+        # Validate everything before taking the write lock
+        try:
+            supplier_id = int(request.form['supplier_id'])
+            lines = parse_order_lines(db, request.form, price='COALESCE(cost_price, 0)')
+        except (KeyError, ValueError) as e:
+            suppliers = db.execute('SELECT * FROM suppliers ORDER BY name').fetchall()
+            products = db.execute('SELECT * FROM products ORDER BY name').fetchall()
+            return render_template('purchase_form.html', suppliers=suppliers,
+                                   products=products, error=str(e)), 400
+        
+        create_purchase_order(db, supplier_id, request.form.get('notes', ''), lines, session['user_id'],
+                              request.form.get('expected_date'))
+        return redirect(url_for('purchases'))
+    
+    suppliers = db.execute('SELECT * FROM suppliers ORDER BY name').fetchall()
     products = db.execute('SELECT * FROM products ORDER BY name').fetchall()
-    db.close()
-    return render_template('sales_form.html', customers=customers, t=get_translation, products=products)
+    return render_template('purchase_form.html', suppliers=suppliers, products=products)
+
+@app.route('/purchases/approve/<int:id>', methods=['POST'])
+@login_required
+def approve_purchase(id):
+    set_purchase_status(get_db(), id, 'approved', session['user_id'])
+    return redirect(request.referrer or url_for('purchases'))
+
+@app.route('/purchases/cancel/<int:id>', methods=['POST'])
+@login_required
+def cancel_purchase(id):
+    set_purchase_status(get_db(), id, 'cancelled', session['user_id'])
+    return redirect(request.referrer or url_for('purchases'))
+
+@app.route('/purchases/receive', methods=['GET', 'POST'])
+@login_required
+def receive_purchases():
+    """Goods receiving: every outstanding line of approved orders (or of ?po_id=)
+    on one form, posted together"""
+    db = get_db()
+    po_ids = request.args.getlist('po_id', type=int)
+    supplier_id = request.args.get('supplier_id', type=int)
+    result = None
+    error = None
+    if request.method == 'POST':
+        item_ids = request.form.getlist('item_id[]')
+        quantities = request.form.getlist('quantity[]')
+        receipts = [(item_id, quantities[i] if i < len(quantities) and quantities[i] != '' else 0)
+                    for i, item_id in enumerate(item_ids)]
+        try:
+            result = receive_purchase_items(db, receipts, session['user_id'])
+        except ValueError as e:
+            error = str(e)
+    
+    lines = outstanding_purchase_lines(db, po_ids, supplier_id)
+    suppliers = db.execute('SELECT id, name FROM suppliers ORDER BY name').fetchall()
+    return render_template('purchase_receive.html', lines=lines, suppliers=suppliers, result=result,
+                           error=error), 400 if error else 200
+
+@app.route('/api/receipts', methods=['POST'])
+@login_required
+def api_receipts():
+    """Post a batch of goods receipts: {"lines": [{"item_id", "quantity"}], "orders": [po_id]}.
+    Listed orders are received in full; everything is posted in one transaction."""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return api_error('Expected a JSON object', 400)
+    lines = body.get('lines') or []
+    orders = body.get('orders') or []
+    if not isinstance(lines, list) or not all(isinstance(line, dict) for line in lines):
+        return api_error('lines must be a list of {item_id, quantity} objects', 400)
+    if not isinstance(orders, list) or not all(isinstance(po_id, int) for po_id in orders):
+        return api_error('orders must be a list of purchase order ids', 400)
+    db = get_db()
+    receipts = [(line.get('item_id'), line.get('quantity')) for line in lines]
+    if orders:
+        outstanding = outstanding_purchase_lines(db, orders)
+        idle = sorted(set(orders) - {row['po_id'] for row in outstanding})
+        if idle:
+            return api_error('Nothing to receive on purchase order(s): ' + ', '.join(map(str, idle)), 400)
+        receipts += [(row['id'], row['outstanding']) for row in outstanding]
+    try:
+        return jsonify(receive_purchase_items(db, receipts, session['user_id']))
+    except ValueError as e:
+        return api_error(str(e), 400)
 
 # Reports route
 @app.route('/reports')
@@ -1046,52 +4174,1132 @@ def reports():
     db = get_db()
     
     reports_data = {
-        'inventory_value': db.execute('SELECT SUM(quantity * unit_price) as value FROM products').fetchone()['value'] or 0,
-        'low_stock_items': db.execute('SELECT * FROM products WHERE quantity <= reorder_level').fetchall(),
+        'inventory_value': db.execute('SELECT inventory_value FROM inventory_summary WHERE id = 1').fetchone()['inventory_value'],
+        'low_stock_items': db.execute('SELECT * FROM products WHERE quantity - reorder_level <= 0').fetchall(),
         'top_products': db.execute('''
-            SELECT p.name, SUM(soi.quantity) as total_sold, SUM(soi.subtotal) as revenue
-            FROM sales_order_items soi
-            JOIN products p ON soi.product_id = p.id
-            GROUP BY p.id
+            SELECT p.name, SUM(r.quantity) as total_sold, SUM(r.revenue) as revenue
+            FROM sales_monthly_product r
+            JOIN products p ON r.product_id = p.id
+            GROUP BY r.product_id
             ORDER BY total_sold DESC
             LIMIT 5
         ''').fetchall(),
         'monthly_sales': db.execute('''
-            SELECT strftime('%Y-%m', order_date) as month, SUM(total_amount) as total
-            FROM sales_orders
-            WHERE status = 'completed'
+            SELECT month, SUM(total) as total
+            FROM sales_monthly_customer
             GROUP BY month
+            HAVING SUM(order_count) > 0
             ORDER BY month DESC
             LIMIT 6
         ''').fetchall(),
         'top_customers': db.execute('''
-            SELECT c.name, COUNT(so.id) as order_count, SUM(so.total_amount) as total_spent
-            FROM customers c
-            JOIN sales_orders so ON c.id = so.customer_id
-            WHERE so.status = 'completed'
-            GROUP BY c.id
+            SELECT c.name, SUM(r.order_count) as order_count, SUM(r.total) as total_spent
+            FROM sales_monthly_customer r
+            JOIN customers c ON r.customer_id = c.id
+            GROUP BY r.customer_id
+            HAVING SUM(r.order_count) > 0
             ORDER BY total_spent DESC
             LIMIT 5
         ''').fetchall()
     }
     
-    db.close()
-    return render_template('reports.html', data=reports_data, t=get_translation)
+    return render_template('reports.html', data=reports_data)
+
+# MRP routes
+MRP_PROPOSALS_QUERY = '''
+    SELECT r.*, p.name, p.sku, p.unit, p.mold_id, p.supplier_id, m.mold_code, s.name as supplier_name
+    FROM mrp_results r
+    JOIN products p ON r.product_id = p.id
+    LEFT JOIN molds m ON p.mold_id = m.id
+    LEFT JOIN suppliers s ON p.supplier_id = s.id
+    WHERE r.action IS NOT NULL
+    ORDER BY r.action, p.name
+'''
+
+def mrp_state(db):
+    return {
+        'proposals': db.execute(MRP_PROPOSALS_QUERY).fetchall(),
+        'materials': mrp_material_summary(db),
+        'computed_at': db.execute('SELECT MAX(computed_at) FROM mrp_results').fetchone()[0],
+        'pending_changes': db.execute('SELECT COUNT(*) FROM mrp_dirty').fetchone()[0],
+    }
+
+@app.route('/mrp')
+@login_required
+def mrp():
+    return render_template('mrp.html', data=mrp_state(get_db()))
+
+@app.route('/mrp/run', methods=['POST'])
+@login_required
+def mrp_run():
+    run_mrp(get_db(), full=request.form.get('full') == '1')
+    return redirect(url_for('mrp'))
+
+@app.route('/mrp/create-orders', methods=['POST'])
+@login_required
+def mrp_create_orders():
+    """Turn production proposals into planned production orders, then re-net them"""
+    db = get_db()
+    run_mrp(db)
+    for row in db.execute(MRP_PROPOSALS_QUERY).fetchall():
+        if row['action'] == 'produce' and row['mold_id']:
+            create_production_order(db, (row['product_id'], row['mold_id'], None, '',
+                                         int(row['proposed_quantity']), None, None, 'MRP'), session['user_id'])
+    run_mrp(db)
+    return redirect(url_for('mrp'))
+
+@app.route('/mrp/order-materials', methods=['POST'])
+@login_required
+def mrp_order_materials():
+    """Turn purchase proposals into pending purchase orders, one per supplier, then re-net them"""
+    db = get_db()
+    run_mrp(db)
+    by_supplier = {}
+    for row in db.execute(MRP_PROPOSALS_QUERY).fetchall():
+        if row['action'] == 'purchase' and row['supplier_id']:
+            by_supplier.setdefault(row['supplier_id'], []).append(
+                (row['product_id'], -(-row['proposed_quantity'] // 1), None))
+    for supplier_id, rows in by_supplier.items():
+        lines = validate_order_lines(db, rows, price='COALESCE(cost_price, 0)')
+        create_purchase_order(db, supplier_id, 'MRP', lines, session['user_id'])
+    run_mrp(db)
+    return redirect(url_for('mrp'))
+
+@app.route('/api/mrp', methods=['GET', 'POST'])
+@login_required
+def api_mrp():
+    """GET the current proposals and material needs; POST runs MRP first (full=1 for everything)"""
+    db = get_db()
+    run = None
+    if request.method == 'POST':
+        run = run_mrp(db, full=request.values.get('full') == '1')
+    data = mrp_state(db)
+    return jsonify({
+        'run': run,
+        'computed_at': data['computed_at'],
+        'pending_changes': data['pending_changes'],
+        'proposals': [dict(row) for row in data['proposals']],
+        'materials': [dict(row) for row in data['materials']],
+    })
+
+# Bulk import: rows are parsed as a stream, coerced with the form handlers'
+# helpers and written with executemany, one transaction per batch. "sql" is a
+# statement, or a function of the file's column names that returns one.
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('ERP_IMPORT_BATCH_SIZE', 1000))
+IMPORT_MAX_REPORTED_ERRORS = 200
+
+def product_import_sql(columns):
+    """Insert new SKUs; existing ones get only the columns the file has, and never
+    a new quantity (stock is set by the stock import)"""
+    updated = [col for col in PRODUCT_COLUMNS if col in columns and col not in ('sku', 'quantity')]
+    return f'''
+        INSERT INTO products ({', '.join(PRODUCT_COLUMNS)})
+        VALUES ({', '.join('?' * len(PRODUCT_COLUMNS))})
+        ON CONFLICT(sku) DO UPDATE SET
+            {''.join(f'{col} = excluded.{col}, ' for col in updated)}updated_at = CURRENT_TIMESTAMP
+    '''
+
+IMPORT_KINDS = {
+    'products': {
+        'values': product_form_values,
+        'required': ('name', 'sku', 'unit_price'),
+        'stock_reason': 'import',
+        'sql': product_import_sql,
+    },
+    'customers': {
+        'values': customer_form_values,
+        'required': ('name',),
+        'sql': f"INSERT INTO customers ({', '.join(CUSTOMER_COLUMNS)}) VALUES ({', '.join('?' * len(CUSTOMER_COLUMNS))})",
+    },
+    'suppliers': {
+        'values': supplier_form_values,
+        'required': ('name',),
+        'sql': f"INSERT INTO suppliers ({', '.join(SUPPLIER_COLUMNS)}) VALUES ({', '.join('?' * len(SUPPLIER_COLUMNS))})",
+    },
+    # Opening stock: sets on-hand quantity for existing SKUs
+    'stock': {
+        'values': lambda form: (int(form['quantity']), form['sku']),
+        'required': ('sku', 'quantity'),
+        'stock_reason': 'import',
+        # Rows whose value at this index is not in products.sku are rejected
+        'must_exist': ('sku', 1),
+        'sql': 'UPDATE products SET quantity = ?, updated_at = CURRENT_TIMESTAMP WHERE sku = ?',
+    },
+}
+
+def read_csv_rows(stream):
+    """Yield dicts from a binary CSV stream (UTF-8, optional BOM; ',' or ';' separated)"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    sample = text.readline()
+    delimiter = ';' if sample.count(';') > sample.count(',') else ','
+    header = next(csv.reader([sample], delimiter=delimiter), [])
+    for row in csv.reader(text, delimiter=delimiter):
+        if any(cell.strip() for cell in row):
+            yield {key.strip(): value.strip() for key, value in zip(header, row)}
+
+def _xlsx_column_index(ref):
+    index = 0
+    for char in ref:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - 64
+    return index - 1
+
+def read_xlsx_rows(stream):
+    """Yield dicts from the first worksheet of an XLSX file, parsing the sheet incrementally"""
+    ns = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+    with zipfile.ZipFile(stream) as workbook:
+        names = workbook.namelist()
+        shared = []
+        if 'xl/sharedStrings.xml' in names:
+            with workbook.open('xl/sharedStrings.xml') as f:
+                root = None
+                for event, elem in ET.iterparse(f, events=('start', 'end')):
+                    if root is None:
+                        root = elem
+                    elif event == 'end' and elem.tag == ns + 'si':
+                        shared.append(''.join(t.text or '' for t in elem.iter(ns + 't')))
+                        root.remove(elem)
+        sheets = sorted(n for n in names if n.startswith('xl/worksheets/sheet'))
+        if not sheets:
+            raise ValueError('workbook has no worksheet')
+        sheet = sheets[0]
+        header = None
+        with workbook.open(sheet) as f:
+            # Parsed rows are detached from <sheetData> so memory stays flat however long the sheet is
+            sheet_data = None
+            for event, elem in ET.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    if elem.tag == ns + 'sheetData':
+                        sheet_data = elem
+                    continue
+                if elem.tag != ns + 'row':
+                    continue
+                values = {}
+                for position, cell in enumerate(elem.iter(ns + 'c')):
+                    ref, kind = cell.get('r'), cell.get('t')
+                    column = _xlsx_column_index(ref) if ref else position
+                    if kind == 'inlineStr':
+                        value = ''.join(t.text or '' for t in cell.iter(ns + 't'))
+                    else:
+                        v = cell.find(ns + 'v')
+                        value = v.text if v is not None and v.text is not None else ''
+                        if kind == 's' and value:
+                            value = shared[int(value)]
+                        elif kind in (None, 'n') and value:
+                            number = float(value)
+                            value = str(int(number)) if number.is_integer() else value
+                    values[column] = value.strip()
+                sheet_data.remove(elem)
+                if header is None:
+                    header = values
+                elif any(values.values()):
+                    yield {name: values.get(column, '') for column, name in header.items()}
+
+def read_import_rows(stream, filename):
+    if filename.lower().endswith('.xlsx'):
+        return read_xlsx_rows(stream)
+    return read_csv_rows(stream)
+
+def import_rows(db, kind, rows, batch_size=None, progress=None):
+    """Validate and write rows in executemany batches; returns a summary report"""
+    spec = IMPORT_KINDS[kind]
+    sql = spec['sql']
+    batch_size = batch_size or app.config['IMPORT_BATCH_SIZE']
+    report = {'kind': kind, 'rows': 0, 'written': 0, 'error_count': 0, 'errors': [], 'batches': 0}
+    started = time.perf_counter()
+
+    def reject(line, error):
+        report['error_count'] += 1
+        if len(report['errors']) < IMPORT_MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line, 'error': error})
+
+    def flush(batch, lines):
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if 'must_exist' in spec:
+                column, index = spec['must_exist']
+                keys = json.dumps([params[index] for params in batch])
+                found = {r[0] for r in db.execute(
+                    f'SELECT {column} FROM products WHERE {column} IN (SELECT value FROM json_each(?))', (keys,))}
+                for params, line in zip(batch, lines):
+                    if params[index] not in found:
+                        reject(line, f'unknown {column.upper()} {params[index]}')
+                batch = [params for params in batch if params[index] in found]
+            written = 0
+            if batch:
+                if spec.get('stock_reason'):
+                    set_stock_source(db, spec['stock_reason'])
+                written = max(db.executemany(sql, batch).rowcount, 0)
+                if spec.get('stock_reason'):
+                    clear_stock_source(db)
+            db.commit()
+        except sqlite3.Error:
+            db.rollback()
+            raise
+        report['written'] += written
+        report['batches'] += 1
+        if progress:
+            progress(report)
+
+    batch, lines = [], []
+    for line, row in enumerate(rows, start=2):  # line 1 is the header
+        report['rows'] += 1
+        try:
+            missing = [col for col in spec['required'] if not row.get(col)]
+            if missing:
+                raise ValueError('missing ' + ', '.join(missing))
+            batch.append(spec['values'](row))
+            lines.append(line)
+            if callable(sql):
+                sql = sql(row.keys())
+        except (ValueError, KeyError) as e:
+            reject(line, str(e))
+            continue
+        if len(batch) >= batch_size:
+            flush(batch, lines)
+            batch, lines = [], []
+    if batch:
+        flush(batch, lines)
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    invalidate_dashboard()
+    list_count_cache.invalidate()
+    return report
+
+@app.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_data():
+    report = None
+    error = None
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        if kind not in IMPORT_KINDS or not upload or not upload.filename:
+            error = get_translation('import_choose_file')
+        else:
+            try:
+                rows = read_import_rows(upload.stream, upload.filename)
+                report = import_rows(get_db(), kind, rows)
+            except (sqlite3.Error, ValueError, zipfile.BadZipFile, ET.ParseError) as e:
+                error = f'{get_translation("import_failed")}: {e}'
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(report or {'error': error}), (200 if report else 400)
+    return render_template('import.html', kinds=list(IMPORT_KINDS), report=report, error=error)
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(list(IMPORT_KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', type=int, default=None, help='Rows per transaction.')
+def import_data_command(kind, path, batch_size):
+    """Bulk import products, customers, suppliers or opening stock from CSV/XLSX."""
+    def progress(report):
+        click.echo(f"  {report['rows']} rows read, {report['written']} written, {report['error_count']} errors")
+
+    with open(path, 'rb') as f:
+        report = import_rows(get_db(), kind, read_import_rows(f, path), batch_size, progress)
+    for item in report['errors']:
+        click.echo(f"line {item['line']}: {item['error']}", err=True)
+    click.echo(f"{report['written']} of {report['rows']} rows imported in {report['seconds']}s "
+               f"({report['error_count']} rejected)")
+
+# Streaming exports: rows are read from a cursor in batches and written out as
+# they arrive, so memory use does not depend on the number of rows.
+EXPORT_BATCH_SIZE = 500
+
+REPORT_EXPORTS = {
+    'inventory': '''
+        SELECT sku, name, category, material_type, quantity, unit, unit_price,
+               quantity * unit_price as stock_value, reorder_level, storage_location
+        FROM products ORDER BY name
+    ''',
+    'low_stock': '''
+        SELECT sku, name, quantity, reorder_level, unit_price
+        FROM products WHERE quantity - reorder_level <= 0 ORDER BY name
+    ''',
+    'product_sales': '''
+        SELECT p.sku, p.name, SUM(r.quantity) as total_sold, SUM(r.revenue) as revenue
+        FROM sales_monthly_product r
+        JOIN products p ON r.product_id = p.id
+        GROUP BY r.product_id
+        ORDER BY total_sold DESC
+    ''',
+    'monthly_sales': '''
+        SELECT month, SUM(order_count) as order_count, SUM(total) as total
+        FROM sales_monthly_customer
+        GROUP BY month
+        HAVING SUM(order_count) > 0
+        ORDER BY month DESC
+    ''',
+    'customer_sales': '''
+        SELECT c.name, c.company, SUM(r.order_count) as order_count, SUM(r.total) as total_spent
+        FROM sales_monthly_customer r
+        JOIN customers c ON r.customer_id = c.id
+        GROUP BY r.customer_id
+        HAVING SUM(r.order_count) > 0
+        ORDER BY total_spent DESC
+    ''',
+}
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+def export_query(name, args):
+    """SQL and parameters for an export: a list view (filtered and sorted) or a report"""
+    if name in REPORT_EXPORTS:
+        return REPORT_EXPORTS[name], []
+    view = LIST_VIEWS[name]
+    sort, order = list_sort(view, args)
+    where, params = list_filters(view, args)
+    sql = view['select']
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    direction = order.upper()
+    sql += f" ORDER BY {view['sort'][sort]} {direction}, {view['id']} {direction}"
+    return sql, params
+
+def iter_batches(cursor):
+    while True:
+        rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+        if not rows:
+            break
+        yield rows
+
+def stream_csv(cursor, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')  # BOM so Excel detects UTF-8 (Turkish characters)
+    writer.writerow(columns)
+    for rows in iter_batches(cursor):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def stream_json(cursor, columns):
+    yield b'['
+    first = True
+    for rows in iter_batches(cursor):
+        chunk = ',\n'.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) for row in rows)
+        yield (chunk if first else ',\n' + chunk).encode('utf-8')
+        first = False
+    yield b']\n'
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+_XLSX_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = xml_escape(_XLSX_ILLEGAL.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'),
+}
+
+def stream_xlsx(cursor, columns):
+    """Minimal single-sheet workbook written through a non-seekable zip stream"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for part, xml in XLSX_PARTS.items():
+            workbook.writestr(part, xml)
+        yield sink.drain()
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            sheet.write(('<row>' + ''.join(_xlsx_cell(c) for c in columns) + '</row>').encode('utf-8'))
+            for rows in iter_batches(cursor):
+                sheet.write(''.join('<row>' + ''.join(_xlsx_cell(v) for v in row) + '</row>'
+                                    for row in rows).encode('utf-8'))
+                yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+EXPORT_WRITERS = {'csv': stream_csv, 'json': stream_json, 'xlsx': stream_xlsx}
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route('/export/<name>.<fmt>')
+@login_required
+def export(name, fmt):
+    """Stream a list view or report as CSV, JSON or XLSX; add gzip=1 to compress"""
+    if fmt not in EXPORT_WRITERS or (name not in LIST_VIEWS and name not in REPORT_EXPORTS):
+        abort(404)
+    sql, params = export_query(name, request.args)
+    cursor = get_db().execute(sql, params)
+    columns = [col[0] for col in cursor.description]
+    body = EXPORT_WRITERS[fmt](cursor, columns)
+    filename = f"{name}-{datetime.now().strftime('%Y%m%d-%H%M')}.{fmt}"
+    mimetype = EXPORT_MIMETYPES[fmt]
+    if request.args.get('gzip') in ('1', 'true', 'yes'):
+        body = gzip_stream(body)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no',
+    })
+
+# Server-Sent Events
+def format_sse(event_id, channel, payload):
+    return f'id: {event_id}\nevent: {channel}\ndata: {payload}\n\n'
+
+@app.route('/events')
+@login_required
+def events():
+    """Live change events: /events?channel=production&channel=machine
+
+    Browsers reconnect with Last-Event-ID and receive what they missed; a
+    "resync" event means too much was missed and the page should reload.
+    Once this process serves event_stream_limit() streams it answers 503,
+    which browsers take as final, so the page stays static instead.
+    """
+    channels = [c for c in request.args.getlist('channel') if c in EVENT_CHANNELS] or None
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_id') or 0)
+    except ValueError:
+        last_id = 0
+    try:
+        subscriber = event_broker.subscribe(channels)
+    except OverflowError:
+        return 'Live updates are not available right now', 503, {'Retry-After': '60'}
+    missed = []
+    if last_id:
+        pool = get_pool()
+        db = pool.acquire()
+        try:
+            missed = db.execute('SELECT id, channel, payload FROM app_events WHERE id > ? ORDER BY id LIMIT ?',
+                                (last_id, EVENT_BATCH_SIZE)).fetchall()
+        finally:
+            pool.release(db)
+    keepalive = app.config['EVENT_KEEPALIVE']
+    
+    def stream():
+        sent = last_id
+        try:
+            yield 'retry: 3000\n\n'
+            if len(missed) == EVENT_BATCH_SIZE:
+                yield 'event: resync\ndata: {}\n\n'
+            else:
+                for row in missed:
+                    if channels is None or row['channel'] in channels:
+                        yield format_sse(row['id'], row['channel'], row['payload'])
+                    sent = row['id']
+            while True:
+                if subscriber.lagging:
+                    subscriber.lagging = False
+                    yield 'event: resync\ndata: {}\n\n'
+                try:
+                    event_id, channel, payload = subscriber.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event_id > sent:
+                    sent = event_id
+                    yield format_sse(event_id, channel, payload)
+        finally:
+            event_broker.unsubscribe(subscriber)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# JSON API: /api/v1/<resource> and /api/v1/<resource>/<id>.
+# "view" is the LIST_VIEWS entry used for reads; "tables" are the change
+# counters an ETag covers (every table joined into the representation).
+def api_create_sale(db, body):
+    items = body.get('items')
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError('items must be a list of {product_id, quantity, unit_price} objects')
+    lines = validate_order_lines(db, [(item.get('product_id'), item.get('quantity'), item.get('unit_price'))
+                                      for item in items])
+    order_id, _ = create_sale(db, int(body['customer_id']), body.get('status', 'pending'),
+                              body.get('notes', ''), lines, session['user_id'])
+    return order_id
+
+API_RESOURCES = {
+    'products': {
+        'view': 'products',
+        'table': 'products',
+        'tables': ('products', 'suppliers', 'molds'),
+        'columns': PRODUCT_COLUMNS,
+        'values': product_form_values,
+        'touch': 'updated_at',
+        'delete': True,
+    },
+    'molds': {
+        'view': 'molds',
+        'table': 'molds',
+        'tables': ('molds',),
+        'columns': MOLD_COLUMNS,
+        'values': mold_form_values,
+        'delete': True,
+    },
+    'machines': {
+        'view': 'machines',
+        'table': 'machines',
+        'tables': ('machines',),
+        'columns': MACHINE_COLUMNS,
+        'values': machine_form_values,
+        'delete': True,
+        'channel': 'machine',
+    },
+    'production_orders': {
+        'view': 'production',
+        'table': 'production_orders',
+        'tables': ('production_orders', 'products', 'molds', 'machines'),
+        # Only planning fields are writable; start/complete/quality have side effects
+        'columns': PRODUCTION_COLUMNS,
+        'values': production_form_values,
+        'channel': 'production',
+        'create': lambda db, body: create_production_order(db, production_form_values(body), session['user_id']),
+    },
+    'sales_orders': {
+        'view': 'sales',
+        'table': 'sales_orders',
+        'tables': ('sales_orders', 'sales_order_items', 'customers', 'products'),
+        'create': api_create_sale,
+        'items': '''
+            SELECT soi.*, p.name as product_name, p.sku
+            FROM sales_order_items soi
+            JOIN products p ON soi.product_id = p.id
+            WHERE soi.order_id = ?
+            ORDER BY soi.id
+        ''',
+    },
+}
+
+def api_error(message, status):
+    return jsonify({'error': message}), status
+
+def api_fields(resource, db):
+    """Requested ?fields=a,b,c, validated against the resource's columns (None = all)"""
+    if not request.args.get('fields'):
+        return None
+    view = LIST_VIEWS[resource['view']]
+    known = {col[0] for col in db.execute(view['select'] + ' LIMIT 0').description}
+    if 'items' in resource:
+        known.add('items')
+    fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+    unknown = [f for f in fields if f not in known]
+    if unknown:
+        raise ValueError('Unknown field(s): ' + ', '.join(unknown))
+    return fields
+
+def api_record(row, fields):
+    data = {key: row[key] for key in row.keys() if key != '_sort_key'}
+    if fields:
+        data = {key: data[key] for key in fields if key in data}
+    return data
+
+def api_conditional(resource, db):
+    """Validators for the current URL from the change counters alone.
+
+    Returns (etag, last_modified, version tag, not_modified). Counters are read
+    before any rows, so a concurrent write can only make the ETag older than the
+    body, which the next poll corrects.
+    """
+    tag, changed = table_versions(db, resource['tables'])
+    etag = f'{tag}-{zlib.crc32(request.full_path.encode()):08x}'
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        since = request.if_modified_since
+        not_modified = since is not None and changed is not None and changed <= since
+    return etag, changed, tag, not_modified
+
+def api_response(payload, etag, changed, status=200):
+    response = jsonify(payload) if payload is not None else Response(status=304)
+    if status != 200:
+        response.status_code = status
+    response.set_etag(etag, weak=True)
+    if changed:
+        response.last_modified = changed
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def api_load(resource, db, id, fields=None):
+    view = LIST_VIEWS[resource['view']]
+    row = db.execute(view['select'] + f" WHERE {view['id']} = ?", (id,)).fetchone()
+    if row is None:
+        return None
+    data = api_record(row, fields)
+    if 'items' in resource and (not fields or 'items' in fields):
+        data['items'] = [dict(item) for item in db.execute(resource['items'], (id,))]
+    return data
+
+@app.route('/api/v1/<resource>', methods=['GET', 'POST'])
+@login_required
+def api_collection(resource):
+    """List (paginated like the list pages, plus ?fields=) or create a record"""
+    spec = API_RESOURCES.get(resource)
+    if spec is None:
+        return api_error('Unknown resource', 404)
+    db = get_db()
+    
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return api_error('Expected a JSON object', 400)
+        try:
+            if 'create' in spec:
+                new_id = spec['create'](db, body)
+            else:
+                columns = spec['columns']
+                cursor = db.execute(
+                    f"INSERT INTO {spec['table']} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    spec['values'](body))
+                new_id = cursor.lastrowid
+                if 'channel' in spec:
+                    publish_event(db, spec['channel'], new_id, 'created')
+                db.commit()
+        except KeyError as e:
+            return api_error(f'Missing field: {e.args[0]}', 400)
+        except (ValueError, TypeError) as e:
+            return api_error(str(e), 400)
+        except sqlite3.IntegrityError as e:
+            db.rollback()
+            return api_error(str(e), 409)
+        invalidate_dashboard()
+        notify_subscribers()
+        response = jsonify(api_load(spec, db, new_id))
+        response.status_code = 201
+        response.headers['Location'] = url_for('api_item', resource=resource, id=new_id)
+        return response
+    
+    etag, changed, tag, not_modified = api_conditional(spec, db)
+    if not_modified:
+        return api_response(None, etag, changed)
+    try:
+        fields = api_fields(spec, db)
+    except ValueError as e:
+        return api_error(str(e), 400)
+    page = paginate(spec['view'], request.args, db, cache_tag=tag)
+    return api_response({
+        'items': [api_record(row, fields) for row in page['items']],
+        'total': page['total'],
+        'per_page': page['per_page'],
+        'sort': page['sort'],
+        'order': page['order'],
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor'],
+    }, etag, changed)
+
+@app.route('/api/v1/<resource>/<int:id>', methods=['GET', 'PUT', 'PATCH', 'DELETE'])
+@login_required
+def api_item(resource, id):
+    """Read, update (fields not sent keep their values) or delete one record"""
+    spec = API_RESOURCES.get(resource)
+    if spec is None:
+        return api_error('Unknown resource', 404)
+    db = get_db()
+    
+    if request.method == 'GET':
+        etag, changed, _, not_modified = api_conditional(spec, db)
+        if not_modified:
+            return api_response(None, etag, changed)
+        try:
+            data = api_load(spec, db, id, api_fields(spec, db))
+        except ValueError as e:
+            return api_error(str(e), 400)
+        if data is None:
+            return api_error('Not found', 404)
+        return api_response(data, etag, changed)
+    
+    if request.method == 'DELETE':
+        if not spec.get('delete'):
+            return api_error('Method not allowed', 405)
+        cursor = db.execute(f"DELETE FROM {spec['table']} WHERE id = ?", (id,))
+        if cursor.rowcount and 'channel' in spec:
+            publish_event(db, spec['channel'], id, 'deleted')
+        db.commit()
+        if not cursor.rowcount:
+            return api_error('Not found', 404)
+        invalidate_dashboard()
+        notify_subscribers()
+        return '', 204
+    
+    if 'columns' not in spec:
+        return api_error('Method not allowed', 405)
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return api_error('Expected a JSON object', 400)
+    current = db.execute(f"SELECT * FROM {spec['table']} WHERE id = ?", (id,)).fetchone()
+    if current is None:
+        return api_error('Not found', 404)
+    columns = list(spec['columns'])
+    try:
+        values = spec['values']({**dict(current), **body})
+    except KeyError as e:
+        return api_error(f'Missing field: {e.args[0]}', 400)
+    except (ValueError, TypeError) as e:
+        return api_error(str(e), 400)
+    if 'touch' in spec:
+        columns.append(spec['touch'])
+        values += (datetime.now(),)
+    try:
+        db.execute(f"UPDATE {spec['table']} SET {', '.join(c + '=?' for c in columns)} WHERE id = ?",
+                   values + (id,))
+        if 'channel' in spec:
+            publish_event(db, spec['channel'], id)
+        db.commit()
+    except sqlite3.IntegrityError as e:
+        db.rollback()
+        return api_error(str(e), 409)
+    invalidate_dashboard()
+    notify_subscribers()
+    return jsonify(api_load(spec, db, id))
 
-# API endpoints for dynamic data
+# Unversioned product list from before /api/v1, kept as-is for existing consumers
 @app.route('/api/products')
 @login_required
 def api_products():
     db = get_db()
     products = db.execute('SELECT id, name, sku, unit_price, quantity FROM products ORDER BY name').fetchall()
-    db.close()
     return jsonify([dict(p) for p in products])
 
+SEARCH_RESULT_URLS = {
+    'product': lambda r: url_for('edit_product', id=r['id']),
+    'customer': lambda r: url_for('edit_customer', id=r['id']),
+    'supplier': lambda r: url_for('edit_supplier', id=r['id']),
+    'sales_order': lambda r: url_for('sales', q=r['title']),
+    'production_order': lambda r: url_for('production', q=r['title']),
+}
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    """Typeahead search: /api/search?q=kap&kind=product&limit=10"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+    results = search(get_db(), request.args.get('q', ''),
+                     kinds=request.args.getlist('kind') or None, limit=limit)
+    for result in results:
+        result['url'] = SEARCH_RESULT_URLS[result['kind']](result)
+    return jsonify(results)
+
+@app.route('/api/db/pool')
+@login_required
+def api_db_pool():
+    """Connection pool counters for sizing DB_POOL_SIZE"""
+    data = get_pool().snapshot()
+    data['checkpoint'] = dict(_checkpoint_stats)
+    return jsonify(data)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint: a login session or "Authorization: Bearer <ERP_METRICS_TOKEN>" """
+    token = app.config['METRICS_TOKEN']
+    if 'user_id' not in session and not (token and request.headers.get('Authorization') == f'Bearer {token}'):
+        return jsonify({'error': 'Authentication required'}), 401
+    return Response(metrics.render(pool_gauges()), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/slow-queries')
+@login_required
+def api_slow_queries():
+    """The most recent statements slower than ERP_SLOW_QUERY_MS, newest first"""
+    return jsonify({'enabled': app.config['INSTRUMENTATION'], 'threshold_ms': app.config['SLOW_QUERY_MS'],
+                    'queries': list(reversed(recent_slow_queries))})
+
+def parse_oee_time(value, default):
+    if not value:
+        return default
+    return datetime.fromisoformat(value)
+
+@app.route('/api/oee')
+@login_required
+def api_oee():
+    """OEE over a window: /api/oee?group=machine|mold|shift&start=2024-05-01&end=2024-05-08
+
+    start/end are local dates or date-times; the default window is the last 7 days.
+    """
+    now = datetime.now()
+    try:
+        end = parse_oee_time(request.args.get('end'), now)
+        start = parse_oee_time(request.args.get('start'), end - timedelta(days=7))
+        if start >= end:
+            raise ValueError('start must be before end')
+        if end - start > timedelta(days=366):
+            raise ValueError('window must not exceed one year')
+        results, stats = compute_oee(get_db(), start, end, request.args.get('group', 'machine'), now)
+    except ValueError as e:
+        return api_error(str(e), 400)
+    return jsonify({
+        'start': start.strftime(OEE_TIME_FORMAT),
+        'end': end.strftime(OEE_TIME_FORMAT),
+        'group': request.args.get('group', 'machine'),
+        'results': results,
+        'periods': stats,
+    })
+
+@app.route('/api/stock')
+@login_required
+def api_stock():
+    """On-hand stock from the ledger: /api/stock?as_of=2024-05-01&product_id=1&product_id=2
+
+    as_of is a UTC date (end of day) or date-time; without it, the current balance.
+    """
+    db = get_db()
+    try:
+        as_of = parse_stock_time(request.args['as_of']) if request.args.get('as_of') else None
+    except ValueError:
+        return api_error('as_of must be an ISO date or date-time', 400)
+    product_ids = request.args.getlist('product_id', type=int) or None
+    balances, scanned = stock_balances(db, as_of, product_ids)
+    maybe_take_stock_snapshot(db)
+    return jsonify({
+        'as_of': as_of,
+        'movements_scanned': scanned,
+        'balances': [{'product_id': product_id, 'quantity': quantity}
+                     for product_id, quantity in sorted(balances.items())],
+    })
+
+@app.route('/api/stock/movements')
+@login_required
+def api_stock_movements():
+    """Ledger entries of one product, newest first: ?product_id=1&since=...&until=...&limit=100"""
+    try:
+        product_id = int(request.args['product_id'])
+        since = parse_stock_time(request.args['since']) if request.args.get('since') else '0000-01-01'
+        until = parse_stock_time(request.args['until']) if request.args.get('until') else '9999-12-31 23:59:59'
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except (KeyError, ValueError):
+        return api_error('product_id is required; since and until must be ISO dates and limit a number', 400)
+    rows = get_db().execute('''
+        SELECT id, quantity, balance, reason, reference_type, reference_id, created_by, moved_at
+        FROM stock_movements
+        WHERE product_id = ? AND moved_at >= ? AND moved_at <= ?
+        ORDER BY id DESC LIMIT ?
+    ''', (product_id, since, until, limit)).fetchall()
+    return jsonify({'product_id': product_id, 'movements': [dict(row) for row in rows]})
+
+@app.route('/api/stock/reconcile')
+@login_required
+def api_stock_reconcile():
+    """Products whose on-hand quantity differs from their ledger balance"""
+    differences = reconcile_stock(get_db())
+    return jsonify({'ok': not differences, 'differences': differences})
+
+@app.route('/api/telemetry', methods=['POST'])
+def api_telemetry_ingest():
+    """Accept one event or a list of events; they are written by the next flush.
+
+    Event: {"machine_code": "ENJ-01", "ts": 1735732800.5, "shots": 1,
+            "cycle_time": 12.4, "state": "working", "mold_id": 3}
+    Only a machine is required. Authenticate with the login session or,
+    for machines, "Authorization: Bearer <ERP_TELEMETRY_TOKEN>".
+    """
+    token = app.config['TELEMETRY_TOKEN']
+    if 'user_id' not in session and not (token and request.headers.get('Authorization') == f'Bearer {token}'):
+        return api_error('Authentication required', 401)
+    body = request.get_json(silent=True)
+    events = body if isinstance(body, list) else [body]
+    now_ms = int(time.time() * 1000)
+    try:
+        parsed = [parse_telemetry_event(event, now_ms) for event in events]
+    except (ValueError, TypeError) as e:
+        return api_error(str(e), 400)
+    try:
+        telemetry_buffer.add(parsed)
+    except OverflowError as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    return jsonify({'accepted': len(parsed)}), 202
+
+@app.route('/api/telemetry')
+@login_required
+def api_telemetry():
+    """Stored events for one machine: ?machine_id=1&since=<epoch s>&until=<epoch s>&limit=1000"""
+    try:
+        machine_id = int(request.args['machine_id'])
+        since = int(float(request.args.get('since', 0)) * 1000)
+        until = int(float(request.args['until']) * 1000) if request.args.get('until') else 2 ** 62
+        limit = max(1, min(int(request.args.get('limit', 1000)), 10000))
+    except (KeyError, ValueError):
+        return api_error('machine_id is required; since, until and limit must be numbers', 400)
+    rows = get_db().execute('''
+        SELECT ts, mold_id, shots, cycle_ms, state FROM machine_telemetry
+        WHERE machine_id = ? AND ts >= ? AND ts < ?
+        ORDER BY ts DESC LIMIT ?
+    ''', (machine_id, since, until, limit)).fetchall()
+    return jsonify([{
+        'ts': row['ts'] / 1000,
+        'mold_id': row['mold_id'],
+        'shots': row['shots'],
+        'cycle_time': row['cycle_ms'] / 1000 if row['cycle_ms'] is not None else None,
+        'state': TELEMETRY_STATES[row['state']] if row['state'] is not None else None,
+    } for row in rows])
+
+@app.route('/api/telemetry/status')
+@login_required
+def api_telemetry_status():
+    """Ingestion buffer counters"""
+    return jsonify(telemetry_buffer.snapshot())
+
+@app.cli.command('simulate-telemetry')
+@click.option('--machines', default=5, help='Number of machines to simulate (existing machines, by id).')
+@click.option('--rate', default=5.0, help='Events per second per machine.')
+@click.option('--duration', default=10.0, help='Seconds to run.')
+@click.option('--url', default=None, help='Post to a running server (e.g. http://localhost:5000) instead of in-process.')
+@click.option('--token', default=None, help='Telemetry token for --url (defaults to ERP_TELEMETRY_TOKEN).')
+def simulate_telemetry_command(machines, rate, duration, url, token):
+    """Feed simulated shot/state events from injection machines"""
+    pool = get_pool()
+    db = pool.acquire()
+    try:
+        machine_ids = [row['id'] for row in db.execute('SELECT id FROM machines ORDER BY id LIMIT ?', (machines,))]
+    finally:
+        pool.release(db)
+    if not machine_ids:
+        raise click.ClickException('No machines to simulate; add machines first.')
+    token = token or app.config['TELEMETRY_TOKEN']
+    states = {machine_id: 'working' for machine_id in machine_ids}
+    sent, started = 0, time.monotonic()
+    tick = 1 / rate
+    while time.monotonic() - started < duration:
+        now = time.time()
+        events = []
+        for machine_id in machine_ids:
+            if random.random() < 0.01:
+                states[machine_id] = 'idle' if states[machine_id] == 'working' else 'working'
+            working = states[machine_id] == 'working'
+            events.append({'machine_id': machine_id, 'ts': now, 'state': states[machine_id],
+                           'shots': 1 if working else 0,
+                           'cycle_time': round(tick * random.uniform(0.9, 1.1), 3) if working else None})
+        if url:
+            req = urllib.request.Request(url.rstrip('/') + '/api/telemetry', data=json.dumps(events).encode(),
+                                              headers={'Content-Type': 'application/json',
+                                                       'Authorization': f'Bearer {token}'})
+            urllib.request.urlopen(req).close()
+        else:
+            telemetry_buffer.add([parse_telemetry_event(event) for event in events])
+        sent += len(events)
+        time.sleep(max(0, tick - (time.time() - now)))
+    if not url:
+        telemetry_buffer.flush()
+    elapsed = time.monotonic() - started
+    click.echo(f'Sent {sent} events from {len(machine_ids)} machines in {elapsed:.1f}s ({sent / elapsed:.0f}/s)')
+
+# Tools that live in their own modules, imported only when the command runs
+# (or its --help is shown), so serving processes never load them
+class LazyCommand(click.Command):
+    def __init__(self, name, target, help):
+        super().__init__(name, help=help)
+        self.target = target
+
+    def _command(self):
+        module, attribute = self.target.split(':')
+        return getattr(importlib.import_module(module), attribute)
+
+    def get_params(self, ctx):
+        return self._command().get_params(ctx)
+
+    def invoke(self, ctx):
+        return self._command().invoke(ctx)
+
+app.cli.add_command(LazyCommand('generate-data', 'bench:generate_data_command',
+                                'Fill the database (ERP_DATABASE) with a synthetic manufacturing dataset.'))
+app.cli.add_command(LazyCommand('benchmark', 'bench:benchmark_command',
+                                'Measure latency and throughput of the main pages and write paths.'))
+
+# Serving: WSGI servers load create_app() (see wsgi.py and gunicorn.conf.py).
+# Every worker process prepares the database under a file lock, so only the
+# first one to start creates tables or migrates; the rest find the schema current.
+_app_lock = threading.Lock()
+_app_started = False
+
+def prepare_database():
+    """Create the schema and apply pending migrations, one process at a time"""
+    os.makedirs(os.path.dirname(DATABASE) or '.', exist_ok=True)
+    with open(DATABASE + '.init-lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        # Without flock, migrations still re-check the version under BEGIN IMMEDIATE
+        init_db()
+
+def shutdown_app():
+    """Flush buffered telemetry, stop the checkpointer and close pooled connections"""
+    global _app_started
+    with _app_lock:
+        if not _app_started:
+            return
+        _app_started = False
+    try:
+        telemetry_buffer.flush()
+    except sqlite3.Error as e:
+        app.logger.warning('Telemetry flush at shutdown failed: %s', e)
+    stop_checkpointer()
+    close_pool()
+
+def create_app():
+    """Application factory: prepare the database and start background work once per process"""
+    global _app_started
+    with _app_lock:
+        if not _app_started:
+            prepare_database()
+            start_checkpointer()
+            atexit.register(shutdown_app)
+            _app_started = True
+    return app
+
 if __name__ == '__main__':
-    # Initialize database
-    if not os.path.exists('database'):
-        os.makedirs('database')
-    init_db()
+    create_app()
     
-    # Run the app
+    # Run the development server
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,523 @@
+"""Synthetic data generator and benchmark harness for Simple ERP.
+
+Kept out of app.py so serving processes never import it; app.py registers the
+generate-data and benchmark commands lazily, so they still run as
+``flask --app app generate-data`` and ``flask --app app benchmark``.
+"""
+from datetime import datetime, timedelta
+import http.cookiejar
+import itertools
+import json
+import queue
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import click
+from flask.cli import with_appcontext
+
+from app import (app, get_db, prepare_database, invalidate_dashboard, set_stock_source, clear_stock_source,
+                 DATABASE, DOCUMENT_SEQUENCES, PRODUCT_COLUMNS, CUSTOMER_COLUMNS, SUPPLIER_COLUMNS,
+                 MOLD_COLUMNS, MACHINE_COLUMNS)
+
+# Synthetic data: a plastics-injection plant at a configurable scale, written
+# with executemany in large transactions through the normal schema (so the
+# triggers keep rollups, search, stock ledger and MRP tracking consistent).
+DATASET_SIZES = {
+    'products': 50000,
+    'molds': 500,
+    'machines': 80,
+    'customers': 5000,
+    'suppliers': 200,
+    'sales_order_items': 1000000,
+    'production_orders': 200000,
+    'purchase_orders': 20000,
+}
+DATASET_MATERIALS = ('PP', 'ABS', 'PE-HD', 'PE-LD', 'PS', 'PA6', 'PC', 'POM')
+DATASET_CATEGORIES = ('Caps', 'Containers', 'Automotive', 'Housings', 'Crates', 'Medical', 'Toys', 'Packaging')
+DATASET_COLORS = ('Natural', 'White', 'Black', 'Red', 'Blue', 'Green', 'Yellow', 'Grey')
+DATASET_BATCH = 20000
+
+def _reserve_numbers(db, name, count):
+    """Reserve a block of document numbers; returns the first one"""
+    db.execute('BEGIN IMMEDIATE')
+    last = db.execute('''
+        INSERT INTO sequences (name, last_value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET last_value = last_value + excluded.last_value
+        RETURNING last_value
+    ''', (name, count)).fetchone()[0]
+    db.commit()
+    return last - count + 1
+
+def _write_batches(db, sql, rows, stock_reason=None):
+    """executemany in DATASET_BATCH-row transactions; returns the number of rows"""
+    written = 0
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, DATASET_BATCH)):
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if stock_reason:
+                set_stock_source(db, stock_reason)
+            db.executemany(sql, batch)
+            if stock_reason:
+                clear_stock_source(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        written += len(batch)
+    return written
+
+def generate_dataset(db, sizes, days=730, seed=1, progress=None):
+    """Append a synthetic plant to the database; returns rows written per table"""
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    start = now - timedelta(days=days)
+    written = {}
+
+    def timestamp(moment):
+        return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+    def random_moment(end=now):
+        return start + timedelta(seconds=rng.randrange(max(1, int((end - start).total_seconds()))))
+
+    def ids(table, where=''):
+        return [row[0] for row in db.execute(f'SELECT id FROM {table} {where} ORDER BY id')]
+
+    def step(table, count):
+        written[table] = count
+        if progress:
+            progress(table, count)
+
+    first = db.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM suppliers').fetchone()[0]
+    step('suppliers', _write_batches(db, f"INSERT INTO suppliers ({', '.join(SUPPLIER_COLUMNS)}) VALUES (?, ?, ?, ?, ?)", (
+        (f'Supplier {first + i}', f'purchasing{first + i}@supplier.example', f'+90 212 {rng.randrange(10**6, 10**7)}',
+         f'{rng.randrange(1, 200)} Industrial Zone', f'Contact {first + i}')
+        for i in range(sizes['suppliers']))))
+    first = db.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM customers').fetchone()[0]
+    step('customers', _write_batches(db, f"INSERT INTO customers ({', '.join(CUSTOMER_COLUMNS)}) VALUES (?, ?, ?, ?, ?)", (
+        (f'Customer {first + i}', f'orders{first + i}@customer.example', f'+90 216 {rng.randrange(10**6, 10**7)}',
+         f'{rng.randrange(1, 500)} Trade Street', f'Company {(first + i) // 3}')
+        for i in range(sizes['customers']))))
+
+    first = db.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM molds').fetchone()[0]
+
+    def molds():
+        for i in range(sizes['molds']):
+            tonnage = rng.choice((80, 120, 160, 220, 280, 350, 450, 650))
+            yield (f'KLP-{first + i:04d}', f'Mold {first + i}', rng.choice((1, 2, 4, 8, 16, 32)),
+                   ','.join(rng.sample(DATASET_MATERIALS, 2)), tonnage, tonnage + rng.choice((50, 100, 200)),
+                   rng.randrange(8, 60), rng.choice(('active',) * 9 + ('maintenance',)), rng.randrange(0, 2000000), 500000, None, None, f'Rack {rng.randrange(1, 40)}', None, None, '')
+    step('molds', _write_batches(db, f"INSERT INTO molds ({', '.join(MOLD_COLUMNS)}) VALUES ({', '.join('?' * len(MOLD_COLUMNS))})", molds()))
+
+    first = db.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM machines').fetchone()[0]
+
+    def machines():
+        for i in range(sizes['machines']):
+            tonnage = rng.choice((100, 150, 200, 250, 300, 400, 500, 700, 900))
+            yield (f'ENJ-{first + i:03d}', f'Injection {first + i}', rng.choice(('Arburg', 'Engel', 'Haitian', 'KraussMaffei')),
+                   f'M{tonnage}', tonnage, None, None, None, None, None, None,
+                   rng.choice(('idle', 'working', 'working', 'working', 'maintenance')), f'Hall {rng.randrange(1, 4)}',
+                   rng.choice(('A', 'B', 'C')), None, None, 90, rng.randrange(0, 40000), '')
+    step('machines', _write_batches(db, f"INSERT INTO machines ({', '.join(MACHINE_COLUMNS)}) VALUES ({', '.join('?' * len(MACHINE_COLUMNS))})", machines()))
+
+    supplier_ids = ids('suppliers')
+    mold_ids = ids('molds')
+    machine_ids = ids('machines')
+    customer_ids = ids('customers')
+    first = db.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM products').fetchone()[0]
+    raw_count = max(len(DATASET_MATERIALS), sizes['products'] // 50)
+
+    def products():
+        for i in range(sizes['products']):
+            number = first + i
+            if i < raw_count:
+                material = DATASET_MATERIALS[i % len(DATASET_MATERIALS)]
+                price = round(rng.uniform(1.2, 4.5), 2)
+                yield (f'{material} granule {number}', f'RM-{number:06d}', None, 'Raw Material', 'raw_material', material,
+                       rng.choice(('Injection', 'Blow', 'Extrusion')), 'Natural', None, None,
+                       rng.randrange(0, 50000), 'kg', price, round(price * 0.9, 2), rng.randrange(1000, 10000),
+                       rng.choice(supplier_ids) if supplier_ids else None, None, None, None, None, 25,
+                       f'Silo {rng.randrange(1, 20)}')
+            else:
+                category = rng.choice(DATASET_CATEGORIES)
+                price = round(rng.uniform(0.05, 25), 2)
+                cycle_time = rng.randrange(8, 60)
+                yield (f'{category} part {number}', f'FG-{number:06d}', None, category, 'finished_good',
+                       rng.choice(DATASET_MATERIALS), None, rng.choice(DATASET_COLORS), round(rng.uniform(2, 400), 1),
+                       None, rng.randrange(0, 20000), 'pcs', price, round(price * rng.uniform(0.5, 0.8), 2),
+                       rng.randrange(0, 2000), None, rng.choice(mold_ids) if mold_ids else None, cycle_time,
+                       3600 // cycle_time, f'TD-{number}', rng.choice((50, 100, 250, 500, 1000)),
+                       f'{rng.choice("ABCDEF")}-{rng.randrange(1, 30):02d}-{rng.randrange(1, 6)}')
+    step('products', _write_batches(db, f"INSERT INTO products ({', '.join(PRODUCT_COLUMNS)}) VALUES ({', '.join('?' * len(PRODUCT_COLUMNS))})", products(), stock_reason='import'))
+
+    finished = db.execute("SELECT id, unit_price, mold_id FROM products WHERE product_type = 'finished_good' AND mold_id IS NOT NULL ORDER BY id").fetchall()
+    raw = db.execute("SELECT id, cost_price, supplier_id FROM products WHERE product_type = 'raw_material' AND supplier_id IS NOT NULL ORDER BY id").fetchall()
+
+    # Sales: a few products sell far more than the rest
+    if finished and customer_ids and sizes['sales_order_items']:
+        popularity = list(itertools.accumulate(1 / (rank + 1) ** 0.8 for rank in range(len(finished))))
+        order_count = max(1, sizes['sales_order_items'] // 4)
+        first_number = _reserve_numbers(db, 'sales_order', order_count)
+        order_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM sales_orders").fetchone()[0]
+        items_left = sizes['sales_order_items']
+        orders, items, income = [], [], []
+        moments = sorted(random_moment() for _ in range(order_count))
+        for n, moment in enumerate(moments):
+            order_id += 1
+            lines = min(items_left, rng.randint(1, 7)) if n < order_count - 1 else items_left
+            items_left -= lines
+            total = 0
+            for product in rng.choices(finished, cum_weights=popularity, k=lines):
+                quantity = rng.choice((50, 100, 200, 500, 1000, 2500))
+                total += quantity * product['unit_price']
+                items.append((order_id, product['id'], quantity, product['unit_price'], quantity * product['unit_price']))
+            status = rng.choices(('completed', 'pending', 'cancelled'), (85, 10, 5))[0]
+            if moment < now - timedelta(days=30) and status == 'pending':
+                status = 'completed'
+            orders.append((order_id, f"{DOCUMENT_SEQUENCES['sales_order']}-{first_number + n:05d}",
+                           rng.choice(customer_ids), timestamp(moment), status, round(total, 2), 1))
+            if status == 'completed':
+                income.append(('income', 'sales', round(total, 2), f'Sales Order {orders[-1][1]}', 'sales_order',
+                               order_id, 1, timestamp(moment)))
+            if len(items) >= DATASET_BATCH or n == order_count - 1:
+                db.execute('BEGIN IMMEDIATE')
+                db.executemany('''
+                    INSERT INTO sales_orders (id, order_number, customer_id, order_date, status, total_amount, created_by)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', orders)
+                db.executemany('''
+                    INSERT INTO sales_order_items (order_id, product_id, quantity, unit_price, subtotal)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', items)
+                db.executemany('''
+                    INSERT INTO transactions (type, category, amount, description, reference_type, reference_id,
+                                              created_by, transaction_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', income)
+                db.commit()
+                written['sales_orders'] = written.get('sales_orders', 0) + len(orders)
+                written['sales_order_items'] = written.get('sales_order_items', 0) + len(items)
+                if progress:
+                    progress('sales_order_items', written['sales_order_items'])
+                orders, items, income = [], [], []
+
+    # Production: finished history, then the current month's running and planned work
+    if finished and machine_ids and sizes['production_orders']:
+        count = sizes['production_orders']
+        first_number = _reserve_numbers(db, 'production_order', count)
+
+        def production_orders():
+            for n in range(count):
+                product = rng.choice(finished)
+                moment = random_moment() if rng.random() > 0.02 else now + timedelta(hours=rng.randrange(1, 14 * 24))
+                planned = rng.choice((1000, 2000, 5000, 10000, 20000))
+                hours = rng.uniform(4, 72)
+                end = moment + timedelta(hours=hours)
+                row = dict(status='completed', produced=0, scrap=0, used=0, start=None, end=None,
+                           quality='pending', quality_date=None)
+                if end < now - timedelta(days=2):
+                    produced = int(planned * rng.uniform(0.9, 1.05))
+                    row.update(produced=produced, scrap=int(produced * rng.uniform(0, 0.03)),
+                               used=round(produced * rng.uniform(0.01, 0.3), 1), start=timestamp(moment), end=timestamp(end),
+                               quality=rng.choices(('passed', 'failed', 'pending'), (92, 3, 5))[0],
+                               quality_date=timestamp(end + timedelta(hours=2)))
+                elif moment < now:
+                    row.update(status='in_progress', start=timestamp(moment), produced=int(planned * rng.uniform(0, 0.8)))
+                else:
+                    row.update(status='planned')
+                yield (f"{DOCUMENT_SEQUENCES['production_order']}-{first_number + n:05d}", product['id'],
+                       product['mold_id'], rng.choice(machine_ids), f'Operator {rng.randrange(1, 60)}', planned,
+                       row['produced'], row['scrap'], row['used'], row['status'], moment.strftime('%Y-%m-%d'),
+                       row['start'], end.strftime('%Y-%m-%d'), row['end'], row['quality'], row['quality_date'], 1,
+                       timestamp(moment - timedelta(days=rng.randrange(1, 10))))
+        step('production_orders', _write_batches(db, '''
+            INSERT INTO production_orders (order_number, product_id, mold_id, machine_id, operator_name,
+                planned_quantity, produced_quantity, scrap_quantity, raw_material_used, status, planned_start_date,
+                actual_start_date, planned_end_date, actual_end_date, quality_status, quality_date, created_by, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', production_orders()))
+
+    # Purchasing: raw material orders, received except for the latest ones
+    if raw and sizes['purchase_orders']:
+        count = sizes['purchase_orders']
+        first_number = _reserve_numbers(db, 'purchase_order', count)
+        po_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM purchase_orders').fetchone()[0]
+        orders, items = [], []
+        for n, moment in enumerate(sorted(random_moment() for _ in range(count))):
+            po_id += 1
+            supplier = rng.choice(raw)['supplier_id']
+            lines = [product for product in raw if product['supplier_id'] == supplier][:rng.randint(1, 4)] or [rng.choice(raw)]
+            status = 'received' if moment < now - timedelta(days=14) else rng.choice(('pending', 'approved', 'partial'))
+            total = 0
+            for product in lines:
+                quantity = rng.choice((500, 1000, 2500, 5000, 10000))
+                received = quantity if status == 'received' else (quantity // 2 if status == 'partial' else 0)
+                total += quantity * product['cost_price']
+                items.append((po_id, product['id'], quantity, product['cost_price'], quantity * product['cost_price'], received))
+            orders.append((po_id, f"{DOCUMENT_SEQUENCES['purchase_order']}-{first_number + n:05d}", supplier,
+                           timestamp(moment), status, round(total, 2), 1,
+                           (moment + timedelta(days=rng.randrange(3, 21))).strftime('%Y-%m-%d')))
+        db.execute('BEGIN IMMEDIATE')
+        db.executemany('''
+            INSERT INTO purchase_orders (id, po_number, supplier_id, order_date, status, total_amount, created_by, expected_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', orders)
+        db.executemany('''
+            INSERT INTO purchase_order_items (po_id, product_id, quantity, unit_price, subtotal, received_quantity)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', items)
+        db.commit()
+        step('purchase_orders', len(orders))
+
+    db.execute('ANALYZE')
+    db.commit()
+    invalidate_dashboard()
+    return written
+
+@click.command('generate-data')
+@with_appcontext
+@click.option('--scale', default=0.1, help='Multiplier for the default sizes (1.0 = 50k products, 1M sales order items).')
+@click.option('--size', 'overrides', multiple=True, metavar='TABLE=N', help='Exact row count for one table, e.g. products=1000.')
+@click.option('--days', default=730, help='Days of history to spread orders over.')
+@click.option('--seed', default=1, help='Random seed, for repeatable datasets.')
+def generate_data_command(scale, overrides, days, seed):
+    """Fill the database (ERP_DATABASE) with a synthetic manufacturing dataset."""
+    sizes = {table: max(1, round(count * scale)) for table, count in DATASET_SIZES.items()}
+    for override in overrides:
+        table, _, count = override.partition('=')
+        if table not in sizes or not count.isdigit():
+            raise click.BadParameter(f'expected TABLE=N with TABLE one of {", ".join(sizes)}', param_hint='--size')
+        sizes[table] = int(count)
+    prepare_database()
+    started = time.perf_counter()
+    written = generate_dataset(get_db(), sizes, days, seed,
+                               progress=lambda table, count: click.echo(f'{table}: {count:,}'))
+    click.echo(f'Done in {time.perf_counter() - started:.1f}s: ' +
+               ', '.join(f'{table} {count:,}' for table, count in written.items()))
+
+# Benchmarks: fixed request mixes replayed by concurrent clients, either
+# in-process through the test client or over HTTP against a running server.
+class BenchmarkClient:
+    """A client of one user session; redirects are not followed"""
+
+    def __init__(self, url=None):
+        self.url = url.rstrip('/') if url else None
+        if self.url:
+            self.cookies = http.cookiejar.CookieJar()
+            self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect())
+        else:
+            self.client = app.test_client()
+
+    def login(self, username, password):
+        status, _ = self.request('POST', '/login', data={'username': username, 'password': password})
+        if status != 302:
+            raise click.ClickException(f'Login as {username} failed (HTTP {status})')
+        return self
+
+    def clone(self):
+        """Another client in the same session, without logging in again (logins are rate limited)"""
+        other = BenchmarkClient(self.url)
+        if self.url:
+            for cookie in self.cookies:
+                other.cookies.set_cookie(cookie)
+        else:
+            name = app.config['SESSION_COOKIE_NAME']
+            other.client.set_cookie(name, self.client.get_cookie(name).value)
+        return other
+
+    def request(self, method, path, data=None, json_body=None):
+        """Returns (status, body)"""
+        if not self.url:
+            response = self.client.open(path, method=method, data=data, json=json_body)
+            return response.status_code, response.get_data()
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data, doseq=True).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+def benchmark_fixtures(client):
+    """Catalogue ids used to build requests, read through the API"""
+    def load(resource, fields, pages=1, keep=lambda item: True):
+        items, args = [], {'fields': fields, 'per_page': 200}
+        for _ in range(pages):
+            status, body = client.request('GET', f'/api/v1/{resource}?{urllib.parse.urlencode(args)}')
+            if status != 200:
+                raise click.ClickException(f'Could not load {resource} (HTTP {status})')
+            page = json.loads(body)
+            items += [item for item in page['items'] if keep(item)]
+            if len(items) >= 200 or not page['next_cursor']:
+                break
+            args['after'] = page['next_cursor']
+        return items
+    # Products that can be produced (have a mold) and sold
+    products = load('products', 'id,unit_price,mold_id', pages=20, keep=lambda p: p['mold_id'])
+    # No customers resource in the API: take the customers of recent orders
+    customers = sorted({o['customer_id'] for o in load('sales_orders', 'customer_id')})
+    machines = [m['id'] for m in load('machines', 'id')]
+    if not products or not customers or not machines:
+        raise click.ClickException('Not enough data to benchmark; run flask generate-data first.')
+    return {'products': products, 'customers': customers, 'machines': machines, 'production_orders': queue.Queue()}
+
+def prepare_production_orders(client, fixtures, count):
+    """Planned and started orders for the complete_production scenario"""
+    rng = random.Random(2)
+    for _ in range(count):
+        product = rng.choice(fixtures['products'])
+        status, body = client.request('POST', '/api/v1/production_orders', json_body={
+            'product_id': product['id'], 'mold_id': product['mold_id'],
+            'machine_id': rng.choice(fixtures['machines']), 'planned_quantity': 1000})
+        if status != 201:
+            raise click.ClickException(f'Could not create a production order (HTTP {status}): {body[:200]!r}')
+        order_id = json.loads(body)['id']
+        client.request('POST', f'/production/start/{order_id}')
+        fixtures['production_orders'].put(order_id)
+
+def _products_request(rng, fixtures):
+    if rng.random() < 0.5:
+        return 'GET', f"/products?q={rng.choice(DATASET_CATEGORIES).lower()}", None
+    sort = rng.choice(('name', 'sku', 'quantity', 'unit_price'))
+    return 'GET', f"/products?sort={sort}&order={rng.choice(('asc', 'desc'))}", None
+
+def _add_sale_request(rng, fixtures):
+    lines = rng.sample(fixtures['products'], min(len(fixtures['products']), rng.randint(1, 5)))
+    return 'POST', '/sales/add', {
+        'customer_id': rng.choice(fixtures['customers']),
+        'status': 'pending',
+        'product_id[]': [p['id'] for p in lines],
+        'quantity[]': [rng.choice((10, 50, 100)) for _ in lines],
+        'unit_price[]': [p['unit_price'] for p in lines],
+    }
+
+def _complete_production_request(rng, fixtures):
+    order_id = fixtures['production_orders'].get_nowait()
+    return 'POST', f'/production/complete/{order_id}', {
+        'produced_quantity': rng.randrange(900, 1050), 'scrap_quantity': rng.randrange(0, 30),
+        'raw_material_used': round(rng.uniform(10, 200), 1)}
+
+# Scenario -> (request builder, status that counts as success)
+BENCHMARK_SCENARIOS = {
+    'dashboard': (lambda rng, fixtures: ('GET', '/dashboard', None), 200),
+    'products': (_products_request, 200),
+    'reports': (lambda rng, fixtures: ('GET', '/reports', None), 200),
+    'add_sale': (_add_sale_request, 302),
+    'complete_production': (_complete_production_request, 302),
+}
+
+def run_benchmark_scenario(clients, fixtures, name, count):
+    """Send `count` requests of one scenario spread over the clients; returns timings and errors"""
+    build, expected = BENCHMARK_SCENARIOS[name]
+    timings, errors = [], []
+    remaining = itertools.count()
+    lock = threading.Lock()
+
+    def worker(client, seed):
+        rng = random.Random(seed)
+        while next(remaining) < count:
+            method, path, data = build(rng, fixtures)
+            started = time.perf_counter()
+            status, _ = client.request(method, path, data=data)
+            elapsed = time.perf_counter() - started
+            with lock:
+                timings.append(elapsed)
+                if status != expected:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=worker, args=(client, i)) for i, client in enumerate(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, errors, time.perf_counter() - started
+
+def summarize_timings(timings, errors, wall):
+    ordered = sorted(timings)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2)
+
+    return {
+        'requests': len(ordered),
+        'errors': len(errors),
+        'p50_ms': percentile(0.50),
+        'p90_ms': percentile(0.90),
+        'p99_ms': percentile(0.99),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+        'throughput': round(len(ordered) / wall, 1),
+    }
+
+def compare_benchmarks(results, baseline, tolerance):
+    """Scenarios whose p90 grew more than `tolerance` (a fraction) over the baseline"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before and result['p90_ms'] > before['p90_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p90 {result['p90_ms']}ms vs {before['p90_ms']}ms")
+    return regressions
+
+@click.command('benchmark')
+@with_appcontext
+@click.option('--scenario', 'scenarios', multiple=True, type=click.Choice(list(BENCHMARK_SCENARIOS)),
+              help='Scenario to run (repeatable; default all).')
+@click.option('--requests', 'count', default=200, help='Timed requests per scenario.')
+@click.option('--warmup', default=20, help='Untimed requests per scenario before measuring.')
+@click.option('--threads', default=4, help='Concurrent clients, sharing one login session.')
+@click.option('--url', default=None, help='Benchmark a running server (e.g. http://localhost:5000) instead of in-process.')
+@click.option('--username', default='admin')
+@click.option('--password', default='admin123')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results as JSON.')
+@click.option('--baseline', type=click.File(), help='Earlier --output file; exit 1 if a scenario regressed.')
+@click.option('--tolerance', default=0.2, help='Allowed p90 growth over the baseline, as a fraction.')
+def benchmark_command(scenarios, count, warmup, threads, url, username, password, output, baseline, tolerance):
+    """Measure latency and throughput of the main pages and write paths."""
+    scenarios = scenarios or tuple(BENCHMARK_SCENARIOS)
+    clients = [BenchmarkClient(url).login(username, password)]
+    clients += [clients[0].clone() for _ in range(threads - 1)]
+    fixtures = benchmark_fixtures(clients[0])
+    if 'complete_production' in scenarios:
+        prepare_production_orders(clients[0], fixtures, count + warmup)
+    results = {}
+    for name in scenarios:
+        if warmup:
+            run_benchmark_scenario(clients, fixtures, name, warmup)
+        timings, errors, wall = run_benchmark_scenario(clients, fixtures, name, count)
+        results[name] = summarize_timings(timings, errors, wall)
+        row = results[name]
+        click.echo(f"{name:<20} p50 {row['p50_ms']:>8.1f}ms  p90 {row['p90_ms']:>8.1f}ms  p99 {row['p99_ms']:>8.1f}ms  "
+                   f"max {row['max_ms']:>8.1f}ms  {row['throughput']:>7.1f} req/s"
+                   + (f"  {row['errors']} errors (HTTP {', '.join(map(str, sorted(set(errors))))})" if errors else ''))
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'target': url or 'in-process',
+        'database': None if url else DATABASE,
+        'threads': len(clients),
+        'requests': count,
+        'scenarios': results,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if baseline:
+        regressions = compare_benchmarks(results, json.load(baseline), tolerance)
+        if regressions:
+            raise click.ClickException('Regression over baseline: ' + '; '.join(regressions))
+        click.echo(f'No regressions over the baseline (tolerance {tolerance:.0%})')
@@ -0,0 +1,35 @@
+# Gunicorn settings for Simple ERP; override with the ERP_* environment variables.
+# Run with: gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+
+bind = os.environ.get('ERP_BIND', '0.0.0.0:8000')
+# SQLite allows one writer at a time, so more processes than cores only adds lock waits
+workers = int(os.environ.get('ERP_WORKERS', multiprocessing.cpu_count()))
+# Threads per worker. Each request holds one pooled connection, and the event,
+# telemetry and checkpoint threads each borrow one briefly, so keep this at least
+# 3 below ERP_DB_POOL_SIZE. Each open live-update page (/events) holds one thread
+# for as long as it stays open, so serve /events from gunicorn_events.conf.py;
+# here ERP_EVENT_THREAD_SUBSCRIBERS caps those streams and must stay below this.
+worker_class = 'gthread'
+threads = int(os.environ.get('ERP_THREADS', 4))
+timeout = int(os.environ.get('ERP_WORKER_TIMEOUT', 60))
+# Seconds a stopping worker gets to finish in-flight requests
+graceful_timeout = int(os.environ.get('ERP_GRACEFUL_TIMEOUT', 30))
+# Restart a worker after this many requests (0: never)
+max_requests = int(os.environ.get('ERP_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get('ERP_ACCESS_LOG') or None
+
+
+def on_starting(server):
+    # Create and migrate the schema once, in the master, before any worker starts.
+    # The connection used is closed so no SQLite handle is shared with forked workers.
+    import app as erp
+    erp.prepare_database()
+    erp.close_pool()
+
+
+def worker_exit(server, worker):
+    import app as erp
+    erp.shutdown_app()
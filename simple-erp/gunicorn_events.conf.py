@@ -0,0 +1,20 @@
+# Gunicorn settings for the live-update stream (/events); the reverse proxy sends
+# /events here and everything else to the gunicorn.conf.py instance.
+# Run with: gunicorn -c gunicorn_events.conf.py wsgi:app
+import os
+
+bind = os.environ.get('ERP_EVENT_BIND', '127.0.0.1:8001')
+# gevent holds each open stream in a greenlet rather than a request thread, so
+# one process keeps a plant floor of screens live. ERP_EVENT_MAX_SUBSCRIBERS caps
+# streams per worker; the extra connections leave room for reconnects.
+worker_class = 'gevent'
+workers = int(os.environ.get('ERP_EVENT_WORKERS', 1))
+worker_connections = int(os.environ.get('ERP_EVENT_MAX_SUBSCRIBERS', 1000)) + 100
+timeout = int(os.environ.get('ERP_WORKER_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('ERP_GRACEFUL_TIMEOUT', 30))
+accesslog = os.environ.get('ERP_ACCESS_LOG') or None
+
+
+def worker_exit(server, worker):
+    import app as erp
+    erp.shutdown_app()
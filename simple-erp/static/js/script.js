@@ -109,12 +109,127 @@ function searchTable(inputId, tableId) {
     });
 }
 
+// Global typeahead search backed by /api/search
+function initGlobalSearch() {
+    const input = document.getElementById('globalSearch');
+    const results = document.getElementById('globalSearchResults');
+    if (!input || !results) return;
+    let timer = null;
+    let controller = null;
+    
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        const query = this.value.trim();
+        if (query.length < 2) {
+            results.innerHTML = '';
+            return;
+        }
+        timer = setTimeout(() => {
+            if (controller) controller.abort();
+            controller = new AbortController();
+            fetch('/api/search?q=' + encodeURIComponent(query), { signal: controller.signal })
+                .then(response => response.json())
+                .then(items => {
+                    results.innerHTML = '';
+                    items.forEach(item => {
+                        const link = document.createElement('a');
+                        link.href = item.url;
+                        link.textContent = item.title;
+                        const detail = document.createElement('small');
+                        detail.textContent = item.code || item.kind.replace('_', ' ');
+                        link.appendChild(detail);
+                        results.appendChild(link);
+                    });
+                })
+                .catch(() => {});
+        }, 150);
+    });
+    
+    document.addEventListener('click', function(event) {
+        if (!input.contains(event.target)) results.innerHTML = '';
+    });
+}
+
+document.addEventListener('DOMContentLoaded', initGlobalSearch);
+
+// Live list updates: pages with a data-live-channel table listen on /events
+// and patch the changed row from the event payload. Rows that can't be drawn
+// here (new ones, bulk changes) only raise a notice with a refresh link.
+function initLiveUpdates() {
+    const table = document.querySelector('[data-live-channel]');
+    if (!table || !window.EventSource) return;
+    
+    const channel = table.dataset.liveChannel;
+    const labels = JSON.parse(table.dataset.liveLabels || '{}');
+    const source = new EventSource('/events?channel=' + encodeURIComponent(channel));
+    
+    function showNotice(kind) {
+        const notice = document.querySelector('[data-live-notice="' + kind + '"]');
+        if (notice) notice.hidden = false;
+    }
+    
+    function patchCell(cell, value) {
+        if (cell.classList.contains('badge')) {
+            cell.className = 'badge badge-' + value;
+            cell.textContent = labels[value] || value;
+        } else if (cell.dataset.format === 'number') {
+            cell.textContent = Number(value).toLocaleString('en-US');
+        } else {
+            cell.textContent = value;
+        }
+        if (cell.hasAttribute('data-warn-positive')) {
+            cell.classList.toggle('warning-text', Number(value) > 0);
+        }
+    }
+    
+    function patchActions(cell, data) {
+        const template = table.parentNode.querySelector('template[data-actions-for="' + data.status + '/' + data.quality_status + '"]')
+            || table.parentNode.querySelector('template[data-actions-for="' + data.status + '"]');
+        cell.innerHTML = template ? template.innerHTML.replace(/__ID__/g, data.id) : '';
+    }
+    
+    function applyEvent(event) {
+        const data = JSON.parse(event.data);
+        if (data.id == null || data.action === 'created') {
+            showNotice('changed');
+            return;
+        }
+        // Rows on other pages are picked up by the next page load
+        const row = table.querySelector('tr[data-row-id="' + data.id + '"]');
+        if (!row) return;
+        if (data.action === 'deleted') {
+            row.remove();
+            return;
+        }
+        row.querySelectorAll('[data-field]').forEach(cell => {
+            const value = data[cell.dataset.field];
+            if (value !== undefined && value !== null) patchCell(cell, value);
+        });
+        const actions = row.querySelector('[data-actions]');
+        if (actions) patchActions(actions, data);
+        row.classList.add('live-updated');
+        setTimeout(() => row.classList.remove('live-updated'), 1500);
+    }
+    
+    source.addEventListener(channel, applyEvent);
+    source.addEventListener('resync', () => showNotice('changed'));
+    // A refused stream (503 when the server is at its stream limit) is not
+    // retried by the browser; say so instead of silently going stale
+    source.addEventListener('error', () => {
+        if (source.readyState === EventSource.CLOSED) showNotice('off');
+    });
+    window.addEventListener('beforeunload', () => source.close());
+}
+
+document.addEventListener('DOMContentLoaded', initLiveUpdates);
+
 // Print functionality
 function printReport() {
     window.print();
 }
 
-// Export to CSV (basic implementation)
+// Export to CSV (basic implementation; only sees rows rendered on the page.
+// Full lists and reports are exported server-side via /export/<name>.<csv|xlsx|json>)
 function exportTableToCSV(tableId, filename) {
     const table = document.getElementById(tableId);
     const rows = table.querySelectorAll('tr');
@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.py reads its settings when imported, so point it at a scratch database first
+os.environ['ERP_DATABASE'] = os.path.join(tempfile.mkdtemp(), 'erp.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as erp  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def erp_app():
+    erp.create_app()
+    return erp
+
+
+@pytest.fixture
+def db(erp_app):
+    with erp_app.app.app_context():
+        yield erp_app.get_db()
+
+
+@pytest.fixture(autouse=True)
+def fresh_login_buckets(erp_app):
+    # Every test logs in as admin from the same address
+    erp_app.login_user_buckets._buckets.clear()
+    erp_app.login_ip_buckets._buckets.clear()
+
+
+@pytest.fixture
+def client(erp_app):
+    client = erp_app.app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    return client
@@ -0,0 +1,15 @@
+def test_unversioned_product_list_keeps_its_shape(client):
+    client.post('/api/v1/products', json={'name': 'Legacy Cap', 'sku': 'SKU-LEGACY', 'unit_price': 2})
+    products = client.get('/api/products').get_json()
+    assert isinstance(products, list)
+    legacy = next(p for p in products if p['sku'] == 'SKU-LEGACY')
+    assert set(legacy) == {'id', 'name', 'sku', 'unit_price', 'quantity'}
+
+
+def test_v1_collection_is_paginated(client):
+    response = client.post('/api/v1/products', json={'name': 'Paged Cap', 'sku': 'SKU-V1', 'unit_price': 2})
+    assert response.status_code == 201
+    assert response.headers['Location'].endswith(f"/api/v1/products/{response.get_json()['id']}")
+    page = client.get('/api/v1/products?q=SKU-V1&fields=id,sku').get_json()
+    assert page['items'] == [{'id': response.get_json()['id'], 'sku': 'SKU-V1'}]
+    assert {'total', 'per_page', 'next_cursor', 'prev_cursor'} <= set(page)
@@ -0,0 +1,38 @@
+import json
+import sys
+
+
+def open_stream(client):
+    response = client.get('/events?channel=production', buffered=False)
+    if response.status_code == 200:
+        next(response.iter_encoded())  # start the stream so closing it unsubscribes
+    return response
+
+
+def test_streams_over_the_worker_cap_are_refused(erp_app):
+    client = erp_app.app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    limit = erp_app.event_stream_limit()
+    streams = [open_stream(client) for _ in range(limit)]
+    try:
+        assert all(response.status_code == 200 for response in streams)
+        refused = open_stream(client)
+        assert refused.status_code == 503
+    finally:
+        for response in streams:
+            response.close()
+    again = open_stream(client)
+    assert again.status_code == 200
+    again.close()
+
+    page = client.get('/production').get_data(as_text=True)
+    labels = page.split("data-live-labels='", 1)[1].split("'", 1)[0]
+    assert json.loads(labels)['in_progress']
+
+
+def test_gevent_workers_take_the_larger_stream_limit(erp_app, monkeypatch):
+    config = erp_app.app.config
+    assert erp_app.event_stream_limit() == config['EVENT_THREAD_SUBSCRIBERS']
+    monkey = type('Monkey', (), {'is_module_patched': staticmethod(lambda name: name == 'threading')})
+    monkeypatch.setitem(sys.modules, 'gevent.monkey', monkey)
+    assert erp_app.event_stream_limit() == config['EVENT_MAX_SUBSCRIBERS']
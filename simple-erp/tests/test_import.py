@@ -0,0 +1,45 @@
+import io
+
+
+def run_import(erp, db, kind, text):
+    return erp.import_rows(db, kind, erp.read_csv_rows(io.BytesIO(text.encode())))
+
+
+def test_reimporting_a_product_updates_it(erp_app, db):
+    first = run_import(erp_app, db, 'products', 'name,sku,unit_price\nCap,SKU-TWICE,2.5\n')
+    second = run_import(erp_app, db, 'products', 'name,sku,unit_price\nCap v2,SKU-TWICE,3.0\n')
+    assert first['written'] == second['written'] == 1
+    row = db.execute("SELECT name, unit_price FROM products WHERE sku = 'SKU-TWICE'").fetchone()
+    assert (row['name'], row['unit_price']) == ('Cap v2', 3.0)
+    assert db.execute('SELECT COUNT(*) FROM mrp_dirty WHERE product_id = '
+                      "(SELECT id FROM products WHERE sku = 'SKU-TWICE')").fetchone()[0] == 1
+
+
+def test_reimport_only_updates_columns_in_the_file(erp_app, db):
+    run_import(erp_app, db, 'products',
+               'name,sku,unit_price,quantity,reorder_level,color\nCrate,SKU-PARTIAL,4,50,3,Blue\n')
+    run_import(erp_app, db, 'products', 'name,sku,unit_price,quantity\nCrate XL,SKU-PARTIAL,5,0\n')
+    row = db.execute("SELECT * FROM products WHERE sku = 'SKU-PARTIAL'").fetchone()
+    assert (row['name'], row['unit_price']) == ('Crate XL', 5.0)
+    assert (row['quantity'], row['reorder_level'], row['color']) == (50, 3, 'Blue')
+    run_import(erp_app, db, 'stock', 'sku,quantity\nSKU-PARTIAL,70\n')
+    assert db.execute("SELECT quantity FROM products WHERE sku = 'SKU-PARTIAL'").fetchone()[0] == 70
+
+
+def test_stock_import_reports_unknown_skus(erp_app, db):
+    run_import(erp_app, db, 'products', 'name,sku,unit_price\nLid,SKU-KNOWN,1\n')
+    report = run_import(erp_app, db, 'stock', 'sku,quantity\nNOPE,5\nSKU-KNOWN,9\n')
+    assert report['written'] == 1
+    assert report['error_count'] == 1
+    assert report['errors'] == [{'line': 2, 'error': 'unknown SKU NOPE'}]
+    assert db.execute("SELECT quantity FROM products WHERE sku = 'SKU-KNOWN'").fetchone()[0] == 9
+
+
+def test_xlsx_rows_round_trip(erp_app, db):
+    cursor = db.execute("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 2000) "
+                        "SELECT 'Bin ' || i AS name, 'SKU-X' || i AS sku, i * 1.5 AS unit_price FROM n")
+    workbook = b''.join(erp_app.stream_xlsx(cursor, [col[0] for col in cursor.description]))
+    rows = list(erp_app.read_xlsx_rows(io.BytesIO(workbook)))
+    assert len(rows) == 2000
+    assert rows[0] == {'name': 'Bin 1', 'sku': 'SKU-X1', 'unit_price': '1.5'}
+    assert rows[-1] == {'name': 'Bin 2000', 'sku': 'SKU-X2000', 'unit_price': '3000'}
@@ -0,0 +1,22 @@
+import pytest
+
+
+@pytest.fixture
+def instrumented(erp_app):
+    config = erp_app.app.config
+    saved = config['INSTRUMENTATION']
+    erp_app.close_pool()
+    config['INSTRUMENTATION'] = True
+    yield
+    erp_app.close_pool()
+    config['INSTRUMENTATION'] = saved
+
+
+def test_server_timing_counts_statements_with_sqlite_sessions(erp_app, instrumented):
+    assert erp_app.app.config['SESSION_STORE'] == 'sqlite'
+    client = erp_app.app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    for path in ('/products', '/reports'):
+        timing = client.get(path).headers['Server-Timing']
+        statements = int(timing.split('desc="', 1)[1].split(' ', 1)[0])
+        assert statements > 0, (path, timing)
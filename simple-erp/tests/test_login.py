@@ -0,0 +1,29 @@
+from werkzeug.security import generate_password_hash
+
+
+def test_repeated_failures_are_throttled(erp_app):
+    client = erp_app.app.test_client()
+    burst = erp_app.app.config['LOGIN_USER_BURST']
+    for _ in range(burst):
+        response = client.post('/login', data={'username': 'admin', 'password': 'wrong'})
+        assert response.status_code == 200
+    response = client.post('/login', data={'username': 'admin', 'password': 'wrong'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    # The right password is refused too until a token refills
+    response = client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 429
+
+
+def test_outdated_hash_is_replaced_at_login(erp_app, db):
+    old_hash = generate_password_hash('rehash-me', 'pbkdf2:sha256')
+    db.execute("INSERT INTO users (username, password, full_name, role) VALUES ('rehash', ?, 'Rehash', 'user')",
+               (old_hash,))
+    db.commit()
+    client = erp_app.app.test_client()
+    response = client.post('/login', data={'username': 'rehash', 'password': 'rehash-me'})
+    assert response.status_code == 302
+    new_hash = db.execute("SELECT password FROM users WHERE username = 'rehash'").fetchone()[0]
+    assert new_hash.startswith(erp_app.app.config['PASSWORD_HASH_METHOD'])
+    client.get('/logout')
+    assert client.post('/login', data={'username': 'rehash', 'password': 'rehash-me'}).status_code == 302
@@ -0,0 +1,15 @@
+import sqlite3
+
+import pytest
+
+
+def test_connection_checked_out_across_close_pool_goes_back_to_its_own_pool(erp_app):
+    with erp_app.app.app_context():
+        conn = erp_app.get_db()
+        old_pool = erp_app.get_pool()
+        erp_app.close_pool()
+    new_pool = erp_app.get_pool()
+    assert new_pool is not old_pool
+    assert new_pool.snapshot()['open'] == 0
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
@@ -0,0 +1,42 @@
+import itertools
+
+import pytest
+
+_skus = itertools.count()
+
+
+@pytest.fixture
+def approved_order(erp_app, db):
+    supplier_id = db.execute("INSERT INTO suppliers (name) VALUES ('Resin Supplier')").lastrowid
+    product_id = db.execute("INSERT INTO products (name, sku, unit_price, cost_price, quantity) "
+                            "VALUES ('Resin Crate', ?, 9, 4, 10)", (f'SKU-RECEIPT-{next(_skus)}',)).lastrowid
+    db.commit()
+    lines = erp_app.validate_order_lines(db, [(product_id, 100, None)], price='COALESCE(cost_price, 0)')
+    po_id, _ = erp_app.create_purchase_order(db, supplier_id, '', lines, None)
+    erp_app.set_purchase_status(db, po_id, 'approved', None)
+    item_id = db.execute('SELECT id FROM purchase_order_items WHERE po_id = ?', (po_id,)).fetchone()[0]
+    return po_id, item_id, product_id
+
+
+def test_partial_receipt_updates_stock_and_ledger(erp_app, db, approved_order):
+    po_id, item_id, product_id = approved_order
+    result = erp_app.receive_purchase_items(db, [(item_id, 40)], None)
+    assert result == {'lines': 1, 'orders': 1, 'quantity': 40, 'amount': 160.0}
+    assert db.execute('SELECT quantity FROM products WHERE id = ?', (product_id,)).fetchone()[0] == 50
+    assert db.execute('SELECT status FROM purchase_orders WHERE id = ?', (po_id,)).fetchone()[0] == 'partial'
+    movement = db.execute('SELECT quantity, balance, reason, reference_type, reference_id FROM stock_movements '
+                          'WHERE product_id = ? ORDER BY id DESC LIMIT 1', (product_id,)).fetchone()
+    assert tuple(movement) == (40, 50, 'receipt', 'purchase_order', po_id)
+    assert [row for row in erp_app.reconcile_stock(db) if row['product_id'] == product_id] == []
+
+    erp_app.receive_purchase_items(db, [(item_id, 60)], None)
+    assert db.execute('SELECT status FROM purchase_orders WHERE id = ?', (po_id,)).fetchone()[0] == 'received'
+    assert db.execute('SELECT quantity FROM products WHERE id = ?', (product_id,)).fetchone()[0] == 110
+
+
+def test_over_receipt_writes_nothing(erp_app, db, approved_order):
+    po_id, item_id, product_id = approved_order
+    with pytest.raises(ValueError, match='outstanding'):
+        erp_app.receive_purchase_items(db, [(item_id, 101)], None)
+    assert db.execute('SELECT quantity FROM products WHERE id = ?', (product_id,)).fetchone()[0] == 10
+    assert db.execute('SELECT received_quantity FROM purchase_order_items WHERE id = ?', (item_id,)).fetchone()[0] == 0
@@ -0,0 +1,13 @@
+def test_hot_queries_use_indexes(erp_app, db):
+    assert erp_app.check_query_plans(db) == {}
+
+
+def test_check_query_plans_command_passes(erp_app):
+    result = erp_app.app.test_cli_runner().invoke(args=['check-query-plans'])
+    assert result.exit_code == 0, result.output
+    assert f'{len(erp_app.HOT_QUERIES)} hot queries use indexes' in result.output
+
+
+def test_unindexed_query_is_reported(erp_app, db):
+    failures = erp_app.check_query_plans(db, {'by_color': "SELECT id FROM products WHERE color = 'Blue'"})
+    assert list(failures) == ['by_color']
@@ -0,0 +1,31 @@
+def rollup_rows(db, order_id):
+    return {
+        period: [tuple(row) for row in db.execute(
+            f'SELECT {key}, product_id, quantity, revenue FROM sales_{period}_product '
+            f'WHERE product_id IN (SELECT product_id FROM sales_order_items WHERE order_id = ?) '
+            f'AND quantity != 0 ORDER BY 1, 2', (order_id,))]
+        for period, key in (('daily', 'day'), ('monthly', 'month'))
+    }
+
+
+def test_redating_an_order_moves_its_product_rollups(erp_app, db):
+    db.execute("INSERT INTO customers (name) VALUES ('Redate Co')")
+    customer_id = db.execute("SELECT id FROM customers WHERE name = 'Redate Co'").fetchone()[0]
+    db.execute("INSERT INTO products (name, sku, unit_price) VALUES ('Redate Bin', 'SKU-REDATE', 2)")
+    product_id = db.execute("SELECT id FROM products WHERE sku = 'SKU-REDATE'").fetchone()[0]
+    order_id = db.execute("INSERT INTO sales_orders (order_number, customer_id, order_date, status, total_amount) "
+                          "VALUES ('SO-REDATE', ?, '2024-01-31 10:00:00', 'completed', 8)", (customer_id,)).lastrowid
+    db.execute('INSERT INTO sales_order_items (order_id, product_id, quantity, unit_price, subtotal) '
+               'VALUES (?, ?, 4, 2, 8)', (order_id, product_id))
+    db.commit()
+    db.execute("UPDATE sales_orders SET order_date = '2024-02-02 09:00:00' WHERE id = ?", (order_id,))
+    db.commit()
+    assert rollup_rows(db, order_id) == {
+        'daily': [('2024-02-02', product_id, 4, 8.0)],
+        'monthly': [('2024-02', product_id, 4, 8.0)],
+    }
+    live = rollup_rows(db, order_id)
+    db.execute('BEGIN IMMEDIATE')
+    erp_app.rebuild_rollups(db)
+    db.commit()
+    assert rollup_rows(db, order_id) == live
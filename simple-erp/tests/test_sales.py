@@ -0,0 +1,49 @@
+import itertools
+import sqlite3
+
+import pytest
+
+_skus = itertools.count()
+
+
+@pytest.fixture
+def catalogue(db):
+    customer_id = db.execute("INSERT INTO customers (name) VALUES ('Sales Test Co')").lastrowid
+    product_id = db.execute("INSERT INTO products (name, sku, unit_price, quantity) VALUES ('Sales Test Bin', ?, 2, 20)",
+                            (f'SKU-SALE-{next(_skus)}',)).lastrowid
+    db.commit()
+    return customer_id, product_id
+
+
+def counts(db):
+    return tuple(db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                 for table in ('sales_orders', 'sales_order_items', 'transactions'))
+
+
+def test_unknown_product_rejects_the_whole_sale(client, db, catalogue):
+    customer_id, product_id = catalogue
+    before = counts(db)
+    response = client.post('/sales/add', data={
+        'customer_id': customer_id, 'status': 'completed',
+        'product_id[]': [product_id, 999999], 'quantity[]': [3, 1], 'unit_price[]': ['', ''],
+    })
+    assert response.status_code == 400
+    assert 'Unknown product id(s): 999999' in response.get_data(as_text=True)
+    assert counts(db) == before
+    assert db.execute('SELECT quantity FROM products WHERE id = ?', (product_id,)).fetchone()[0] == 20
+
+
+def test_failed_sale_rolls_back_every_write(erp_app, db, catalogue, monkeypatch):
+    customer_id, product_id = catalogue
+    lines = erp_app.validate_order_lines(db, [(product_id, 3, None)])
+    before = counts(db)
+
+    def fail(*args):
+        raise sqlite3.OperationalError('disk I/O error')
+
+    monkeypatch.setattr(erp_app, 'set_stock_source', fail)
+    with pytest.raises(sqlite3.OperationalError):
+        erp_app.create_sale(db, customer_id, 'completed', '', lines, None)
+    assert not db.in_transaction
+    assert counts(db) == before
+    assert db.execute('SELECT quantity FROM products WHERE id = ?', (product_id,)).fetchone()[0] == 20
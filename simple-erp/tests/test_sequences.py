@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+
+@pytest.mark.parametrize('block_size', [1, 5])
+def test_concurrent_allocation_never_repeats_a_number(erp_app, block_size):
+    # One allocator per thread stands in for separate worker processes
+    name = f'test_concurrent_{block_size}'
+    pool = erp_app.get_pool()
+    numbers = []
+    errors = []
+
+    def allocate():
+        allocator = erp_app.SequenceAllocator(block_size)
+        db = pool.acquire()
+        try:
+            numbers.extend(allocator.next_value(db, name) for _ in range(40))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            pool.release(db)
+
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(numbers) == len(set(numbers)) == 160
+    assert max(numbers) == 160
+
+
+def test_shared_allocator_across_threads(erp_app):
+    allocator = erp_app.SequenceAllocator(3)
+    pool = erp_app.get_pool()
+    numbers = []
+
+    def allocate():
+        db = pool.acquire()
+        try:
+            numbers.extend(allocator.next_value(db, 'test_shared') for _ in range(30))
+        finally:
+            pool.release(db)
+
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(numbers) == list(range(1, 121))
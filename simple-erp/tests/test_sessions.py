@@ -0,0 +1,30 @@
+import pytest
+
+
+@pytest.fixture
+def single_connection_pool(erp_app):
+    config = erp_app.app.config
+    saved = config['DB_POOL_SIZE'], config['DB_POOL_TIMEOUT']
+    erp_app.close_pool()
+    config['DB_POOL_SIZE'], config['DB_POOL_TIMEOUT'] = 1, 0.5
+    yield
+    erp_app.close_pool()
+    config['DB_POOL_SIZE'], config['DB_POOL_TIMEOUT'] = saved
+
+
+def test_login_and_session_save_need_one_connection(erp_app, single_connection_pool):
+    client = erp_app.app.test_client()
+    response = client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302
+    assert client.get('/dashboard').status_code == 200
+    assert erp_app.get_pool().snapshot()['timeouts'] == 0
+
+
+def test_logout_ends_the_server_side_session(erp_app, db):
+    client = erp_app.app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    sid = client.get_cookie('session').value
+    assert db.execute('SELECT COUNT(*) FROM sessions WHERE id = ?', (sid,)).fetchone()[0] == 1
+    client.get('/logout')
+    assert db.execute('SELECT COUNT(*) FROM sessions WHERE id = ?', (sid,)).fetchone()[0] == 0
+    assert client.get('/dashboard').status_code == 302
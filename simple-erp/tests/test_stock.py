@@ -0,0 +1,14 @@
+def test_reconcile_stock_prints_summary_before_failing(erp_app, db):
+    db.execute("INSERT INTO products (name, sku, unit_price, quantity) VALUES ('Drifted', 'SKU-DRIFT', 1, 0)")
+    product_id = db.execute("SELECT id FROM products WHERE sku = 'SKU-DRIFT'").fetchone()[0]
+    db.execute("INSERT INTO stock_movements (product_id, quantity, balance, reason) VALUES (?, 5, 5, 'adjustment')",
+               (product_id,))
+    db.commit()
+    runner = erp_app.app.test_cli_runner()
+    result = runner.invoke(args=['reconcile-stock'])
+    assert result.exit_code == 1
+    assert f'product {product_id}: on hand 0, ledger 5' in result.output
+    assert result.output.rstrip().endswith('difference(s).')
+    result = runner.invoke(args=['reconcile-stock', '--fix'])
+    assert result.exit_code == 0
+    assert runner.invoke(args=['reconcile-stock']).output.strip() == '0 difference(s).'